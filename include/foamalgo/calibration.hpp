@@ -0,0 +1,764 @@
+/**
+ * Distributed under the terms of the GNU General Public License v3.0.
+ *
+ * The full license is in the file LICENSE, distributed with this software.
+ *
+ * Copyright (C) 2020, Jun Zhu. All rights reserved.
+ */
+#ifndef FOAM_CALIBRATION_H
+#define FOAM_CALIBRATION_H
+
+#include <algorithm>
+#include <array>
+#include <cmath>
+#include <limits>
+#include <type_traits>
+#include <vector>
+
+#include "xtensor/xtensor.hpp"
+#include "xtensor/xview.hpp"
+
+#if defined(FOAM_USE_TBB)
+#include "tbb/parallel_for.h"
+#include "tbb/blocked_range.h"
+#include "tbb/blocked_range2d.h"
+#endif
+
+#include "traits.hpp"
+#include "utilities.hpp"
+
+
+namespace foam
+{
+
+/**
+ * @class DarkBuilder
+ * @brief Build pulse-resolved offset and noise constants from dark runs.
+ *
+ * Dark trains are fed one by one and the statistics of each pixel in each
+ * memory cell are accumulated with Welford's online algorithm, so that the
+ * whole run never needs to be held in memory.
+ *
+ * Iterative sigma-clipping is performed by streaming the run more than once.
+ * nextPass() freezes the offset and noise obtained so far and starts a new
+ * pass, in which the samples outside [offset - sigma * noise, offset + sigma * noise]
+ * are rejected.
+ *
+ * @tparam T: data type of the output constants.
+ */
+template<typename T = float>
+class DarkBuilder
+{
+  static_assert(std::is_floating_point<T>::value);
+
+public:
+
+  using ConstantsType = xt::xtensor<T, 3>;
+  using MaskType = xt::xtensor<bool, 3>;
+  using CountType = xt::xtensor<size_t, 3>;
+  using ShapeType = std::array<size_t, 3>;
+
+private:
+
+  using StatsType = xt::xtensor<double, 3>;
+
+  ShapeType shape_; // (memory cells, y, x)
+
+  CountType count_;
+  StatsType mean_;
+  StatsType m2_;
+
+  // sigma-clipping window of the current pass
+  bool clipping_ = false;
+  StatsType lb_;
+  StatsType ub_;
+
+  size_t n_passes_ = 1;
+
+  /**
+   * Accumulate an image into the statistics of a memory cell.
+   */
+  template<typename E>
+  void updateCell(const E& src, size_t i, size_t c);
+
+public:
+
+  DarkBuilder(size_t n_cells, size_t h, size_t w);
+
+  ~DarkBuilder() = default;
+
+  /**
+   * Accumulate a dark train. The i-th image belongs to the i-th memory cell.
+   *
+   * @param src: dark train. Shape = (memory cells, y, x)
+   */
+  template<typename E, EnableIf<std::decay_t<E>, IsImageArray> = false>
+  void update(E&& src);
+
+  /**
+   * Accumulate a dark train with explicit memory cell IDs.
+   *
+   * @param src: dark train. Shape = (pulses, y, x)
+   * @param cell_ids: memory cell ID of each pulse. IDs must be unique.
+   */
+  template<typename E, EnableIf<std::decay_t<E>, IsImageArray> = false>
+  void update(E&& src, const std::vector<size_t>& cell_ids);
+
+  /**
+   * Freeze the current offset and noise and start a new pass over the run.
+   *
+   * @param sigma: samples further than sigma * noise from the offset will be
+   *    rejected in the new pass.
+   */
+  void nextPass(double sigma);
+
+  /**
+   * Reset all the accumulated statistics and the clipping window.
+   */
+  void reset();
+
+  /**
+   * Return the offset constants. Shape = (memory cells, y, x)
+   *
+   * Pixels without any accepted sample are nan.
+   */
+  ConstantsType offset() const;
+
+  /**
+   * Return the noise (standard deviation) constants. Shape = (memory cells, y, x)
+   *
+   * Pixels without any accepted sample are nan.
+   */
+  ConstantsType noise() const;
+
+  /**
+   * Return the number of accepted samples in the current pass. Shape = (memory cells, y, x)
+   */
+  const CountType& count() const { return count_; }
+
+  /**
+   * Generate the bad pixel mask.
+   *
+   * A pixel is bad if it has no accepted sample, zero noise, or its offset or
+   * noise lies outside the given range.
+   *
+   * @param offset_lb: lower boundary of a good offset.
+   * @param offset_ub: upper boundary of a good offset.
+   * @param noise_lb: lower boundary of a good noise.
+   * @param noise_ub: upper boundary of a good noise.
+   *
+   * @return: the mask with bad pixels being true. Shape = (memory cells, y, x)
+   */
+  MaskType badPixelMask(T offset_lb, T offset_ub, T noise_lb, T noise_ub) const;
+
+  /**
+   * Return the index of the current pass, starting from 1.
+   */
+  size_t nPasses() const { return n_passes_; }
+
+  /**
+   * Return the shape of the constants.
+   */
+  const ShapeType& shape() const { return shape_; }
+};
+
+template<typename T>
+DarkBuilder<T>::DarkBuilder(size_t n_cells, size_t h, size_t w) : shape_({n_cells, h, w})
+{
+  count_ = xt::zeros<size_t>(shape_);
+  mean_ = xt::zeros<double>(shape_);
+  m2_ = xt::zeros<double>(shape_);
+}
+
+template<typename T>
+template<typename E>
+void DarkBuilder<T>::updateCell(const E& src, size_t i, size_t c)
+{
+  for (size_t j = 0; j < shape_[1]; ++j)
+  {
+    for (size_t k = 0; k < shape_[2]; ++k)
+    {
+      auto v = static_cast<double>(src(i, j, k));
+      if (std::isnan(v)) continue;
+      if (clipping_ && (v < lb_(c, j, k) || v > ub_(c, j, k))) continue;
+
+      size_t n = ++count_(c, j, k);
+      double& mean = mean_(c, j, k);
+      double delta = v - mean;
+      mean += delta / static_cast<double>(n);
+      m2_(c, j, k) += delta * (v - mean);
+    }
+  }
+}
+
+template<typename T>
+template<typename E, EnableIf<std::decay_t<E>, IsImageArray>>
+void DarkBuilder<T>::update(E&& src)
+{
+  utils::checkShape(shape_, src.shape(), "Constants and dark train have different shapes");
+
+#if defined(FOAM_USE_TBB)
+  tbb::parallel_for(tbb::blocked_range<int>(0, shape_[0]),
+    [&src, this] (const tbb::blocked_range<int> &block)
+    {
+      for(int i=block.begin(); i != block.end(); ++i)
+      {
+#else
+      for (size_t i = 0; i < shape_[0]; ++i)
+      {
+#endif
+        updateCell(src, i, i);
+      }
+#if defined(FOAM_USE_TBB)
+    }
+  );
+#endif
+}
+
+template<typename T>
+template<typename E, EnableIf<std::decay_t<E>, IsImageArray>>
+void DarkBuilder<T>::update(E&& src, const std::vector<size_t>& cell_ids)
+{
+  auto src_shape = src.shape();
+  utils::checkShape(shape_, src_shape, "Constants and dark train have different image shapes", 1, 1);
+  FOAM_ASSERT_ARGUMENT(cell_ids.size() == src_shape[0],
+                       "Number of cell IDs differs from the number of pulses")
+
+  std::vector<bool> seen(shape_[0], false);
+  for (auto c : cell_ids)
+  {
+    FOAM_ASSERT_ARGUMENT(c < shape_[0], "Cell ID out of range: " + std::to_string(c))
+    FOAM_ASSERT_ARGUMENT(!seen[c], "Duplicated cell ID: " + std::to_string(c))
+    seen[c] = true;
+  }
+
+#if defined(FOAM_USE_TBB)
+  tbb::parallel_for(tbb::blocked_range<int>(0, src_shape[0]),
+    [&src, &cell_ids, this] (const tbb::blocked_range<int> &block)
+    {
+      for(int i=block.begin(); i != block.end(); ++i)
+      {
+#else
+      for (size_t i = 0; i < src_shape[0]; ++i)
+      {
+#endif
+        updateCell(src, i, cell_ids[i]);
+      }
+#if defined(FOAM_USE_TBB)
+    }
+  );
+#endif
+}
+
+template<typename T>
+void DarkBuilder<T>::nextPass(double sigma)
+{
+  FOAM_ASSERT_ARGUMENT(sigma > 0, "sigma must be positive")
+
+  lb_ = xt::empty<double>(shape_);
+  ub_ = xt::empty<double>(shape_);
+
+  auto inf = std::numeric_limits<double>::infinity();
+  for (size_t i = 0; i < shape_[0]; ++i)
+  {
+    for (size_t j = 0; j < shape_[1]; ++j)
+    {
+      for (size_t k = 0; k < shape_[2]; ++k)
+      {
+        size_t n = count_(i, j, k);
+        if (n == 0)
+        {
+          // nothing to be clipped against
+          lb_(i, j, k) = -inf;
+          ub_(i, j, k) = inf;
+        } else
+        {
+          double half_width = sigma * std::sqrt(m2_(i, j, k) / static_cast<double>(n));
+          lb_(i, j, k) = mean_(i, j, k) - half_width;
+          ub_(i, j, k) = mean_(i, j, k) + half_width;
+        }
+      }
+    }
+  }
+  clipping_ = true;
+
+  count_.fill(0);
+  mean_.fill(0.);
+  m2_.fill(0.);
+
+  ++n_passes_;
+}
+
+template<typename T>
+void DarkBuilder<T>::reset()
+{
+  count_.fill(0);
+  mean_.fill(0.);
+  m2_.fill(0.);
+
+  clipping_ = false;
+  lb_ = StatsType();
+  ub_ = StatsType();
+
+  n_passes_ = 1;
+}
+
+template<typename T>
+typename DarkBuilder<T>::ConstantsType DarkBuilder<T>::offset() const
+{
+  ConstantsType ret = xt::empty<T>(shape_);
+
+  auto nan = std::numeric_limits<T>::quiet_NaN();
+  for (size_t i = 0; i < shape_[0]; ++i)
+  {
+    for (size_t j = 0; j < shape_[1]; ++j)
+    {
+      for (size_t k = 0; k < shape_[2]; ++k)
+      {
+        ret(i, j, k) = count_(i, j, k) == 0 ? nan : static_cast<T>(mean_(i, j, k));
+      }
+    }
+  }
+  return ret;
+}
+
+template<typename T>
+typename DarkBuilder<T>::ConstantsType DarkBuilder<T>::noise() const
+{
+  ConstantsType ret = xt::empty<T>(shape_);
+
+  auto nan = std::numeric_limits<T>::quiet_NaN();
+  for (size_t i = 0; i < shape_[0]; ++i)
+  {
+    for (size_t j = 0; j < shape_[1]; ++j)
+    {
+      for (size_t k = 0; k < shape_[2]; ++k)
+      {
+        size_t n = count_(i, j, k);
+        ret(i, j, k) = n == 0 ? nan : static_cast<T>(std::sqrt(m2_(i, j, k) / static_cast<double>(n)));
+      }
+    }
+  }
+  return ret;
+}
+
+template<typename T>
+typename DarkBuilder<T>::MaskType
+DarkBuilder<T>::badPixelMask(T offset_lb, T offset_ub, T noise_lb, T noise_ub) const
+{
+  MaskType mask = xt::empty<bool>(shape_);
+
+  for (size_t i = 0; i < shape_[0]; ++i)
+  {
+    for (size_t j = 0; j < shape_[1]; ++j)
+    {
+      for (size_t k = 0; k < shape_[2]; ++k)
+      {
+        size_t n = count_(i, j, k);
+        if (n == 0 || m2_(i, j, k) == 0.)
+        {
+          mask(i, j, k) = true;
+          continue;
+        }
+
+        auto offset = static_cast<T>(mean_(i, j, k));
+        auto noise = static_cast<T>(std::sqrt(m2_(i, j, k) / static_cast<double>(n)));
+        mask(i, j, k) = offset < offset_lb || offset > offset_ub || noise < noise_lb || noise > noise_ub;
+      }
+    }
+  }
+  return mask;
+}
+
+/**
+ * Common-mode policy which estimates the common mode by the median of the
+ * dark pixels.
+ */
+class MedianCommonModePolicy
+{
+public:
+  template<typename T>
+  static T estimate(std::vector<T>& values)
+  {
+    size_t n = values.size();
+    auto mid = values.begin() + n / 2;
+    std::nth_element(values.begin(), mid, values.end());
+    if (n % 2 == 1) return *mid;
+    return (*std::max_element(values.begin(), mid) + *mid) / T(2);
+  }
+};
+
+/**
+ * Common-mode policy which estimates the common mode by the mean of the
+ * dark pixels.
+ */
+class MeanCommonModePolicy
+{
+public:
+  template<typename T>
+  static T estimate(std::vector<T>& values)
+  {
+    double total = 0.;
+    for (auto v : values) total += v;
+    return static_cast<T>(total / static_cast<double>(values.size()));
+  }
+};
+
+namespace detail
+{
+
+/**
+ * Subtract the common mode of a rectangular region [y0, y1) x [x0, x1) of an image.
+ *
+ * Pixels which are nan, excluded or whose absolute values are above the threshold
+ * (i.e. hit by photons) do not contribute to the common mode. The region is left
+ * untouched if no pixel contributes.
+ */
+template<typename Policy, typename E, typename F, typename T>
+inline void correctCommonModeRegion(E& src, const F& excluded, T threshold,
+                                    size_t y0, size_t y1, size_t x0, size_t x1,
+                                    std::vector<T>& buffer)
+{
+  buffer.clear();
+  for (size_t j = y0; j < y1; ++j)
+  {
+    for (size_t k = x0; k < x1; ++k)
+    {
+      T v = src(j, k);
+      if (std::isnan(v) || std::abs(v) > threshold || excluded(j, k)) continue;
+      buffer.push_back(v);
+    }
+  }
+
+  if (buffer.empty()) return;
+
+  T cm = Policy::estimate(buffer);
+  for (size_t j = y0; j < y1; ++j)
+  {
+    for (size_t k = x0; k < x1; ++k)
+    {
+      src(j, k) -= cm;
+    }
+  }
+}
+
+/**
+ * Apply common-mode correction to an ASIC in a module.
+ *
+ * @param ia: flattened index of the ASIC in the ASIC grid.
+ */
+template<typename Detector, typename Policy, typename E, typename F, typename T>
+inline void correctCommonModeAsic(E& src, const F& excluded, T threshold, bool per_row,
+                                  size_t ia, std::vector<T>& buffer)
+{
+  constexpr auto ah = Detector::asic_shape[0];
+  constexpr auto aw = Detector::asic_shape[1];
+
+  size_t y0 = (ia / Detector::asic_grid_shape[1]) * ah;
+  size_t x0 = (ia % Detector::asic_grid_shape[1]) * aw;
+
+  if (per_row)
+  {
+    for (size_t j = y0; j < y0 + ah; ++j)
+    {
+      correctCommonModeRegion<Policy>(src, excluded, threshold, j, j + 1, x0, x0 + aw, buffer);
+    }
+  } else
+  {
+    correctCommonModeRegion<Policy>(src, excluded, threshold, y0, y0 + ah, x0, x0 + aw, buffer);
+  }
+}
+
+template<typename Detector, typename Policy, typename E, typename F, typename T>
+inline void correctCommonModeImageImp(E& src, const F& excluded, T threshold, bool per_row)
+{
+  utils::checkShape(Detector::module_shape, src.shape(), "Image and module have different shapes");
+
+  constexpr size_t n_asics = Detector::asic_grid_shape[0] * Detector::asic_grid_shape[1];
+
+#if defined(FOAM_USE_TBB)
+  tbb::parallel_for(tbb::blocked_range<int>(0, n_asics),
+    [&src, &excluded, threshold, per_row] (const tbb::blocked_range<int> &block)
+    {
+      std::vector<T> buffer;
+      for(int ia=block.begin(); ia != block.end(); ++ia)
+      {
+#else
+      std::vector<T> buffer;
+      for (size_t ia = 0; ia < n_asics; ++ia)
+      {
+#endif
+        correctCommonModeAsic<Detector, Policy>(src, excluded, threshold, per_row, ia, buffer);
+      }
+#if defined(FOAM_USE_TBB)
+    }
+  );
+#endif
+}
+
+template<typename Detector, typename Policy, typename E, typename F, typename T>
+inline void correctCommonModeImageArrayImp(E& src, const F& excluded, T threshold, bool per_row)
+{
+  auto shape = src.shape();
+  utils::checkShape(Detector::module_shape, shape, "Images and module have different shapes", 0, 1);
+
+  constexpr size_t n_asics = Detector::asic_grid_shape[0] * Detector::asic_grid_shape[1];
+
+#if defined(FOAM_USE_TBB)
+  tbb::parallel_for(tbb::blocked_range2d<int>(0, shape[0], 0, n_asics),
+    [&src, &excluded, threshold, per_row] (const tbb::blocked_range2d<int> &block)
+    {
+      std::vector<T> buffer;
+      for(int i=block.rows().begin(); i != block.rows().end(); ++i)
+      {
+        auto&& src_view = xt::view(src, i, xt::all(), xt::all());
+        for(int ia=block.cols().begin(); ia != block.cols().end(); ++ia)
+        {
+#else
+      std::vector<T> buffer;
+      for (size_t i = 0; i < shape[0]; ++i)
+      {
+        auto&& src_view = xt::view(src, i, xt::all(), xt::all());
+        for (size_t ia = 0; ia < n_asics; ++ia)
+        {
+#endif
+          correctCommonModeAsic<Detector, Policy>(src_view, excluded, threshold, per_row, ia, buffer);
+        }
+      }
+#if defined(FOAM_USE_TBB)
+    }
+  );
+#endif
+}
+
+} //detail
+
+/**
+ * @brief Inplace apply common-mode correction to a module image.
+ *
+ * The common mode is estimated either for each ASIC or for each row of each
+ * ASIC from the pixels not being hit by photons.
+ *
+ * @tparam Detector: detector type, e.g. JungFrau or EPix100, which provides
+ *    the ASIC layout.
+ * @tparam Policy: common-mode policy (MedianCommonModePolicy or MeanCommonModePolicy).
+ *
+ * @param src: offset corrected image data. shape = (y, x)
+ * @param threshold: pixels with absolute values above the threshold are
+ *    regarded as being hit by photons.
+ * @param per_row: true for estimating the common mode for each row of each ASIC
+ *    instead of for each ASIC.
+ */
+template <typename Detector, typename Policy, typename E, EnableIf<E, IsImage> = false>
+inline void correctCommonMode(E& src,
+                              typename E::value_type threshold = std::numeric_limits<typename E::value_type>::infinity(),
+                              bool per_row = false)
+{
+  detail::correctCommonModeImageImp<Detector, Policy>(
+    src, [] (size_t, size_t) { return false; }, threshold, per_row);
+}
+
+/**
+ * @brief Inplace apply common-mode correction to a module image.
+ *
+ * @tparam Detector: detector type, e.g. JungFrau or EPix100, which provides
+ *    the ASIC layout.
+ * @tparam Policy: common-mode policy (MedianCommonModePolicy or MeanCommonModePolicy).
+ *
+ * @param src: offset corrected image data. shape = (y, x)
+ * @param mask: pixels being true do not contribute to the common mode. shape = (y, x)
+ * @param threshold: pixels with absolute values above the threshold are
+ *    regarded as being hit by photons.
+ * @param per_row: true for estimating the common mode for each row of each ASIC
+ *    instead of for each ASIC.
+ */
+template <typename Detector, typename Policy, typename E, typename M,
+          EnableIf<E, IsImage> = false, EnableIf<M, IsImageMask> = false>
+inline void correctCommonMode(E& src, const M& mask,
+                              typename E::value_type threshold = std::numeric_limits<typename E::value_type>::infinity(),
+                              bool per_row = false)
+{
+  utils::checkShape(Detector::module_shape, mask.shape(), "Image and mask have different shapes");
+
+  detail::correctCommonModeImageImp<Detector, Policy>(
+    src, [&mask] (size_t j, size_t k) { return mask(j, k); }, threshold, per_row);
+}
+
+/**
+ * @brief Inplace apply common-mode correction to an array of module images.
+ *
+ * @tparam Detector: detector type, e.g. JungFrau or EPix100, which provides
+ *    the ASIC layout.
+ * @tparam Policy: common-mode policy (MedianCommonModePolicy or MeanCommonModePolicy).
+ *
+ * @param src: offset corrected image data. shape = (indices, y, x)
+ * @param threshold: pixels with absolute values above the threshold are
+ *    regarded as being hit by photons.
+ * @param per_row: true for estimating the common mode for each row of each ASIC
+ *    instead of for each ASIC.
+ */
+template <typename Detector, typename Policy, typename E, EnableIf<E, IsImageArray> = false>
+inline void correctCommonMode(E& src,
+                              typename E::value_type threshold = std::numeric_limits<typename E::value_type>::infinity(),
+                              bool per_row = false)
+{
+  detail::correctCommonModeImageArrayImp<Detector, Policy>(
+    src, [] (size_t, size_t) { return false; }, threshold, per_row);
+}
+
+/**
+ * @brief Inplace apply common-mode correction to an array of module images.
+ *
+ * @tparam Detector: detector type, e.g. JungFrau or EPix100, which provides
+ *    the ASIC layout.
+ * @tparam Policy: common-mode policy (MedianCommonModePolicy or MeanCommonModePolicy).
+ *
+ * @param src: offset corrected image data. shape = (indices, y, x)
+ * @param mask: pixels being true do not contribute to the common mode. shape = (y, x)
+ * @param threshold: pixels with absolute values above the threshold are
+ *    regarded as being hit by photons.
+ * @param per_row: true for estimating the common mode for each row of each ASIC
+ *    instead of for each ASIC.
+ */
+template <typename Detector, typename Policy, typename E, typename M,
+          EnableIf<E, IsImageArray> = false, EnableIf<M, IsImageMask> = false>
+inline void correctCommonMode(E& src, const M& mask,
+                              typename E::value_type threshold = std::numeric_limits<typename E::value_type>::infinity(),
+                              bool per_row = false)
+{
+  utils::checkShape(Detector::module_shape, mask.shape(), "Images and mask have different shapes");
+
+  detail::correctCommonModeImageArrayImp<Detector, Policy>(
+    src, [&mask] (size_t j, size_t k) { return mask(j, k); }, threshold, per_row);
+}
+
+namespace detail
+{
+
+template<typename E, typename G, typename C, typename O>
+inline void correctMultiGainImp(const E& src, const G& stages, const C& gain, const C& offset,
+                                O& out, size_t i, size_t c)
+{
+  using out_value_type = typename O::value_type;
+  constexpr auto nan = std::numeric_limits<out_value_type>::quiet_NaN();
+
+  auto n_stages = static_cast<size_t>(gain.shape()[0]);
+  auto shape = src.shape();
+  for (size_t j = 0; j < shape[1]; ++j)
+  {
+    for (size_t k = 0; k < shape[2]; ++k)
+    {
+      auto g = static_cast<size_t>(stages(i, j, k));
+      if (g >= n_stages)
+      {
+        out(i, j, k) = nan;
+        continue;
+      }
+      out(i, j, k) = static_cast<out_value_type>(
+        gain(g, c, j, k) * (static_cast<out_value_type>(src(i, j, k)) - offset(g, c, j, k)));
+    }
+  }
+}
+
+template<typename E, typename G, typename C, typename O>
+inline void checkMultiGainShapes(const E& src, const G& stages, const C& gain, const C& offset, O& out)
+{
+  auto shape = src.shape();
+  utils::checkShape(shape, stages.shape(), "data and gain stages have different shapes");
+  utils::checkShape(shape, out.shape(), "data and output have different shapes");
+  utils::checkShape(gain.shape(), offset.shape(), "gain and offset constants have different shapes");
+  utils::checkShape(shape, gain.shape(), "data and constants have different image shapes", 1, 2);
+}
+
+} //detail
+
+/**
+ * @brief Apply gain-stage-resolved gain and offset correction to an array of images.
+ *
+ * For each pixel, the constants of the gain stage in which it was recorded
+ * are selected, i.e. out = gain[g, i] * (src - offset[g, i]), where g is the
+ * gain stage and i is the index of the memory cell. Pixels with gain stages
+ * outside [0, gain stages) are set to nan, i.e. raw gain bits which are not
+ * contiguous, e.g. 0, 1 and 3 for JungFrau, must be remapped beforehand.
+ *
+ * @param src: raw image data. shape = (memory cells, y, x)
+ * @param stages: gain stage of each pixel. shape = (memory cells, y, x)
+ * @param gain: gain constants. shape = (gain stages, memory cells, y, x)
+ * @param offset: offset constants. shape = (gain stages, memory cells, y, x)
+ * @param out: corrected image data. shape = (memory cells, y, x)
+ */
+template <typename E, typename G, typename C, typename O,
+          EnableIf<E, IsImageArray> = false, EnableIf<G, IsImageArray> = false,
+          EnableIf<C, IsModulesArray> = false, EnableIf<O, IsImageArray> = false>
+inline void correctMultiGainImageData(const E& src, const G& stages, const C& gain, const C& offset, O& out)
+{
+  detail::checkMultiGainShapes(src, stages, gain, offset, out);
+  auto shape = src.shape();
+  utils::checkShape(shape, gain.shape(), "data and constants have different numbers of memory cells", 0, 1);
+
+#if defined(FOAM_USE_TBB)
+  tbb::parallel_for(tbb::blocked_range<int>(0, shape[0]),
+    [&src, &stages, &gain, &offset, &out] (const tbb::blocked_range<int> &block)
+    {
+      for(int i=block.begin(); i != block.end(); ++i)
+      {
+#else
+      for (size_t i = 0; i < shape[0]; ++i)
+      {
+#endif
+        detail::correctMultiGainImp(src, stages, gain, offset, out, i, i);
+      }
+#if defined(FOAM_USE_TBB)
+    }
+  );
+#endif
+}
+
+/**
+ * @brief Apply gain-stage-resolved gain and offset correction to an array of images
+ *    with explicit memory cell IDs.
+ *
+ * @param src: raw image data. shape = (pulses, y, x)
+ * @param stages: gain stage of each pixel. shape = (pulses, y, x)
+ * @param gain: gain constants. shape = (gain stages, memory cells, y, x)
+ * @param offset: offset constants. shape = (gain stages, memory cells, y, x)
+ * @param cell_ids: memory cell ID of each pulse.
+ * @param out: corrected image data. shape = (pulses, y, x)
+ */
+template <typename E, typename G, typename C, typename O,
+          EnableIf<E, IsImageArray> = false, EnableIf<G, IsImageArray> = false,
+          EnableIf<C, IsModulesArray> = false, EnableIf<O, IsImageArray> = false>
+inline void correctMultiGainImageData(const E& src, const G& stages, const C& gain, const C& offset,
+                                      const std::vector<size_t>& cell_ids, O& out)
+{
+  detail::checkMultiGainShapes(src, stages, gain, offset, out);
+  auto shape = src.shape();
+  FOAM_ASSERT_ARGUMENT(cell_ids.size() == shape[0],
+                       "Number of cell IDs differs from the number of pulses")
+  auto n_cells = static_cast<size_t>(gain.shape()[1]);
+  for (auto c : cell_ids)
+  {
+    FOAM_ASSERT_ARGUMENT(c < n_cells, "Cell ID out of range: " + std::to_string(c))
+  }
+
+#if defined(FOAM_USE_TBB)
+  tbb::parallel_for(tbb::blocked_range<int>(0, shape[0]),
+    [&src, &stages, &gain, &offset, &cell_ids, &out] (const tbb::blocked_range<int> &block)
+    {
+      for(int i=block.begin(); i != block.end(); ++i)
+      {
+#else
+      for (size_t i = 0; i < shape[0]; ++i)
+      {
+#endif
+        detail::correctMultiGainImp(src, stages, gain, offset, out, i, cell_ids[i]);
+      }
+#if defined(FOAM_USE_TBB)
+    }
+  );
+#endif
+}
+
+} // foam
+
+#endif //FOAM_CALIBRATION_H
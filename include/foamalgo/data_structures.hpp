@@ -0,0 +1,856 @@
+/**
+ * Distributed under the terms of the GNU General Public License v3.0.
+ *
+ * The full license is in the file LICENSE, distributed with this software.
+ *
+ * Copyright (C) 2020, Jun Zhu. All rights reserved.
+ */
+#ifndef FOAM_DATA_STRUCTURES_H
+#define FOAM_DATA_STRUCTURES_H
+
+#include <algorithm>
+#include <atomic>
+#include <chrono>
+#include <cmath>
+#include <cstdint>
+#include <limits>
+#include <memory>
+#include <thread>
+#include <type_traits>
+#include <utility>
+#include <vector>
+
+#include "xtensor/xtensor.hpp"
+
+#include "traits.hpp"
+#include "utilities.hpp"
+
+
+namespace foam
+{
+
+/**
+ * @brief A data point of OneWayAccuPairSequence.
+ */
+template<typename T>
+struct AccuPairPoint
+{
+  T x_avg; // average of x
+  T y_avg; // average of y
+  T y_min; // average of y minus half of the standard deviation
+  T y_max; // average of y plus half of the standard deviation
+  T y_std; // standard deviation of y
+  uint64_t count; // number of samples
+};
+
+/**
+ * @class OneWayAccuPairSequence
+ * @brief Store the history of a pair of accumulative scalar data.
+ *
+ * The data is collected in a stop-and-collect way. A motor, for example,
+ * stops at a position and data is collected for a period of time. Adjacent
+ * samples whose x values are within the resolution are accumulated into the
+ * same point, which stores the average of x and the average, count and
+ * standard deviation band of y. A point only becomes visible once it has
+ * min_count samples.
+ *
+ * The points are stored as records in an array with twice the maximum length,
+ * so that the visible points are always contiguous and the array only needs
+ * to be rolled over once every max_len new points.
+ *
+ * @tparam T: value type of the stored data.
+ */
+template<typename T>
+class OneWayAccuPairSequence
+{
+public:
+
+  using value_type = T;
+  using PointType = AccuPairPoint<T>;
+  using ContainerType = std::vector<PointType>;
+
+  /**
+   * Internal state for serialization.
+   */
+  struct State
+  {
+    size_t i0;
+    size_t len;
+    size_t last;
+    ContainerType points;
+    std::vector<T> m2;
+  };
+
+private:
+
+  static constexpr size_t over_capacity_ = 2;
+
+  double resolution_;
+  size_t max_len_;
+  size_t min_count_;
+
+  size_t i0_ = 0; // index of the first visible point
+  size_t len_ = 0; // number of visible points
+  size_t last_ = 0; // index of the point being accumulated
+
+  ContainerType points_;
+  std::vector<T> m2_; // sum of squared deviations of y
+
+  bool empty() const { return len_ == 0 && points_[0].count == 0; }
+
+  void startPoint(size_t i, double x, double y);
+
+  void rollOver();
+
+public:
+
+  /**
+   * Constructor.
+   *
+   * @param resolution: samples whose x values differ by no more than the
+   *    resolution from the average x of the last point are accumulated into it.
+   * @param max_len: maximum number of visible points.
+   * @param min_count: minimum number of samples of a visible point.
+   */
+  OneWayAccuPairSequence(double resolution, size_t max_len, size_t min_count);
+
+  ~OneWayAccuPairSequence() = default;
+
+  /**
+   * Add a new sample.
+   */
+  void append(double x, double y);
+
+  /**
+   * Add samples in order.
+   *
+   * @param xs: x values of the samples. shape = (n,)
+   * @param ys: y values of the samples. shape = (n,)
+   */
+  template<typename E1, typename E2,
+    EnableIf<std::decay_t<E1>, IsVector> = false, EnableIf<std::decay_t<E2>, IsVector> = false>
+  void extend(const E1& xs, const E2& ys);
+
+  /**
+   * Return whether appending a sample with the given x value would start a new point.
+   */
+  bool appendDry(double x) const;
+
+  /**
+   * Remove all the data.
+   */
+  void reset();
+
+  /**
+   * Return the index of the first visible point in the storage.
+   */
+  size_t start() const { return i0_; }
+
+  /**
+   * Return the number of visible points.
+   */
+  size_t size() const { return len_; }
+
+  /**
+   * Return the storage of the points.
+   */
+  const ContainerType& points() const { return points_; }
+
+  /**
+   * Return the internal state for serialization.
+   */
+  State state() const;
+
+  /**
+   * Restore the internal state returned by state() of an instance with the
+   * same max_len.
+   */
+  void setState(State state);
+};
+
+template<typename T>
+OneWayAccuPairSequence<T>::OneWayAccuPairSequence(double resolution, size_t max_len, size_t min_count)
+  : resolution_(resolution), max_len_(max_len), min_count_(min_count),
+    points_(over_capacity_ * max_len, PointType()),
+    m2_(over_capacity_ * max_len, T(0))
+{
+  FOAM_ASSERT_ARGUMENT(resolution > 0, "resolution must be positive!")
+  FOAM_ASSERT_ARGUMENT(max_len > 0, "max_len must be positive!")
+  FOAM_ASSERT_ARGUMENT(min_count > 0, "min_count must be positive!")
+}
+
+template<typename T>
+inline void OneWayAccuPairSequence<T>::startPoint(size_t i, double x, double y)
+{
+  points_[i] = PointType { static_cast<T>(x), static_cast<T>(y), static_cast<T>(y), static_cast<T>(y), T(0), 1 };
+  m2_[i] = T(0);
+}
+
+template<typename T>
+inline void OneWayAccuPairSequence<T>::rollOver()
+{
+  std::copy_n(points_.begin() + max_len_, max_len_, points_.begin());
+  std::copy_n(m2_.begin() + max_len_, max_len_, m2_.begin());
+}
+
+template<typename T>
+inline void OneWayAccuPairSequence<T>::append(double x, double y)
+{
+  size_t last = last_;
+
+  if (empty())
+  {
+    startPoint(last, x, y);
+  }
+  else if (std::abs(x - static_cast<double>(points_[last].x_avg)) <= resolution_)
+  {
+    auto& p = points_[last];
+    auto n = static_cast<double>(++p.count);
+    p.x_avg = static_cast<T>(p.x_avg + (x - p.x_avg) / n);
+    double avg_prev = p.y_avg;
+    p.y_avg = static_cast<T>(p.y_avg + (y - p.y_avg) / n);
+    m2_[last] = static_cast<T>(m2_[last] + (y - avg_prev) * (y - p.y_avg));
+    double y_std = std::sqrt(m2_[last] / n);
+    p.y_std = static_cast<T>(y_std);
+    // y_min and y_max store the average -/+ half of the standard deviation
+    double half_std = 0.5 * y_std;
+    p.y_min = static_cast<T>(p.y_avg - half_std);
+    p.y_max = static_cast<T>(p.y_avg + half_std);
+  }
+  else
+  {
+    // the last point is discarded if it has less than min_count samples
+    if (points_[last].count >= min_count_) last = ++last_;
+    startPoint(last, x, y);
+  }
+
+  // the point becomes visible once it has min_count samples
+  if (points_[last].count == min_count_)
+  {
+    if (len_ < max_len_)
+    {
+      ++len_;
+    }
+    else
+    {
+      ++i0_;
+      if (i0_ == max_len_)
+      {
+        i0_ = 0;
+        last_ -= max_len_;
+        rollOver();
+      }
+    }
+  }
+}
+
+template<typename T>
+template<typename E1, typename E2,
+  EnableIf<std::decay_t<E1>, IsVector>, EnableIf<std::decay_t<E2>, IsVector>>
+inline void OneWayAccuPairSequence<T>::extend(const E1& xs, const E2& ys)
+{
+  FOAM_ASSERT_ARGUMENT(xs.size() == ys.size(), "xs and ys must have the same length")
+
+  for (size_t i = 0; i < xs.size(); ++i)
+  {
+    append(static_cast<double>(xs(i)), static_cast<double>(ys(i)));
+  }
+}
+
+template<typename T>
+inline bool OneWayAccuPairSequence<T>::appendDry(double x) const
+{
+  if (empty()) return true;
+  return std::abs(x - static_cast<double>(points_[last_].x_avg)) > resolution_;
+}
+
+template<typename T>
+inline void OneWayAccuPairSequence<T>::reset()
+{
+  i0_ = 0;
+  len_ = 0;
+  last_ = 0;
+  std::fill(points_.begin(), points_.end(), PointType());
+  std::fill(m2_.begin(), m2_.end(), T(0));
+}
+
+template<typename T>
+inline typename OneWayAccuPairSequence<T>::State OneWayAccuPairSequence<T>::state() const
+{
+  return State { i0_, len_, last_, points_, m2_ };
+}
+
+template<typename T>
+inline void OneWayAccuPairSequence<T>::setState(State state)
+{
+  FOAM_ASSERT_ARGUMENT(state.points.size() == points_.size() && state.m2.size() == m2_.size(),
+                       "Inconsistent storage size")
+  FOAM_ASSERT_ARGUMENT(state.i0 < max_len_ && state.len <= max_len_ && state.last < points_.size(),
+                       "Invalid indices")
+
+  i0_ = state.i0;
+  len_ = state.len;
+  last_ = state.last;
+  points_ = std::move(state.points);
+  m2_ = std::move(state.m2);
+}
+
+namespace detail
+{
+
+/**
+ * Wait until the predicate is true.
+ *
+ * The waiting thread yields at first and then sleeps for short intervals.
+ *
+ * @param pred: predicate.
+ * @param timeout: timeout in seconds. Negative for waiting forever and zero
+ *    for not waiting.
+ *
+ * @return: false if timed out.
+ */
+template<typename F>
+inline bool waitUntil(F&& pred, double timeout)
+{
+  if (pred()) return true;
+  if (timeout == 0.) return false;
+
+  auto deadline = std::chrono::steady_clock::now() + std::chrono::duration<double>(timeout);
+  size_t n_waits = 0;
+  while (!pred())
+  {
+    if (timeout > 0. && std::chrono::steady_clock::now() >= deadline) return false;
+    if (n_waits < 64)
+    {
+      ++n_waits;
+      std::this_thread::yield();
+    }
+    else
+    {
+      std::this_thread::sleep_for(std::chrono::microseconds(50));
+    }
+  }
+  return true;
+}
+
+} // detail
+
+/**
+ * @class SpscQueue
+ * @brief Bounded lock-free single-producer single-consumer queue.
+ *
+ * The head and tail counters are only increased and the slots are indexed
+ * by the counters modulo the capacity. The head is advanced by
+ * compare-and-swap so that the producer can also drop the oldest item when
+ * the queue is full (see pushPop).
+ *
+ * @tparam T: item type, which must be trivially copyable.
+ */
+template<typename T>
+class SpscQueue
+{
+  static_assert(std::is_trivially_copyable<T>::value, "T must be trivially copyable!");
+
+  static constexpr size_t cache_line_size_ = 64;
+
+  size_t capacity_;
+  std::unique_ptr<std::atomic<T>[]> slots_;
+
+  // the counters are written by different threads
+  alignas(cache_line_size_) std::atomic<size_t> head_ { 0 };
+  alignas(cache_line_size_) std::atomic<size_t> tail_ { 0 };
+
+public:
+
+  /**
+   * Constructor.
+   *
+   * @param capacity: maximum number of items in the queue.
+   */
+  explicit SpscQueue(size_t capacity);
+
+  ~SpscQueue() = default;
+
+  SpscQueue(const SpscQueue&) = delete;
+  SpscQueue& operator=(const SpscQueue&) = delete;
+
+  /**
+   * Add an item without waiting. Only called by the producer.
+   *
+   * @return: false if the queue is full.
+   */
+  bool tryPush(const T& item);
+
+  /**
+   * Add an item.
+   *
+   * @param timeout: timeout in seconds. Negative for waiting forever and zero
+   *    for not waiting.
+   *
+   * @return: false if the queue is still full after timeout.
+   */
+  bool push(const T& item, double timeout = -1.);
+
+  /**
+   * Add an item. If the queue is full, the oldest item is removed.
+   *
+   * @param dropped: the removed item.
+   *
+   * @return: whether an item was removed.
+   */
+  bool pushPop(const T& item, T& dropped);
+
+  /**
+   * Remove the oldest item without waiting.
+   *
+   * @return: false if the queue is empty.
+   */
+  bool tryPop(T& item);
+
+  /**
+   * Remove the oldest item.
+   *
+   * @param timeout: timeout in seconds. Negative for waiting forever and zero
+   *    for not waiting.
+   *
+   * @return: false if the queue is still empty after timeout.
+   */
+  bool pop(T& item, double timeout = -1.);
+
+  /**
+   * Remove up to n oldest items.
+   *
+   * @param out: output iterator.
+   * @param n: maximum number of items.
+   * @param timeout: timeout in seconds for waiting for the first item.
+   *    Negative for waiting forever and zero for not waiting.
+   *
+   * @return: number of removed items.
+   */
+  template<typename OutputIt>
+  size_t popMany(OutputIt out, size_t n, double timeout = -1.);
+
+  /**
+   * Return the approximate number of items.
+   */
+  size_t size() const;
+
+  bool empty() const { return size() == 0; }
+
+  bool full() const { return size() == capacity_; }
+
+  size_t capacity() const { return capacity_; }
+};
+
+template<typename T>
+SpscQueue<T>::SpscQueue(size_t capacity) : capacity_(capacity)
+{
+  FOAM_ASSERT_ARGUMENT(capacity > 0, "capacity must be positive!")
+  slots_.reset(new std::atomic<T>[capacity]);
+}
+
+template<typename T>
+inline bool SpscQueue<T>::tryPush(const T& item)
+{
+  size_t tail = tail_.load(std::memory_order_relaxed);
+  if (tail - head_.load(std::memory_order_acquire) >= capacity_) return false;
+
+  slots_[tail % capacity_].store(item, std::memory_order_relaxed);
+  tail_.store(tail + 1, std::memory_order_release);
+  return true;
+}
+
+template<typename T>
+inline bool SpscQueue<T>::push(const T& item, double timeout)
+{
+  return detail::waitUntil([this, &item] () { return tryPush(item); }, timeout);
+}
+
+template<typename T>
+inline bool SpscQueue<T>::pushPop(const T& item, T& dropped)
+{
+  bool has_dropped = false;
+  // if tryPop fails, the consumer has just removed an item
+  while (!tryPush(item)) has_dropped = tryPop(dropped);
+  return has_dropped;
+}
+
+template<typename T>
+inline bool SpscQueue<T>::tryPop(T& item)
+{
+  size_t head = head_.load(std::memory_order_acquire);
+  while (head != tail_.load(std::memory_order_acquire))
+  {
+    // the slot can be overwritten after another thread advanced the head,
+    // in which case the exchange fails and the value is discarded
+    T value = slots_[head % capacity_].load(std::memory_order_relaxed);
+    if (head_.compare_exchange_weak(head, head + 1, std::memory_order_acq_rel))
+    {
+      item = value;
+      return true;
+    }
+  }
+  return false;
+}
+
+template<typename T>
+inline bool SpscQueue<T>::pop(T& item, double timeout)
+{
+  return detail::waitUntil([this, &item] () { return tryPop(item); }, timeout);
+}
+
+template<typename T>
+template<typename OutputIt>
+inline size_t SpscQueue<T>::popMany(OutputIt out, size_t n, double timeout)
+{
+  if (n == 0) return 0;
+
+  T item;
+  if (!pop(item, timeout)) return 0;
+  *out++ = item;
+
+  size_t count = 1;
+  while (count < n && tryPop(item))
+  {
+    *out++ = item;
+    ++count;
+  }
+  return count;
+}
+
+template<typename T>
+inline size_t SpscQueue<T>::size() const
+{
+  // the head is loaded first so that it is not larger than the tail
+  size_t head = head_.load(std::memory_order_acquire);
+  size_t tail = tail_.load(std::memory_order_acquire);
+  return std::min(tail - head, capacity_);
+}
+
+/**
+ * @class BinnedAccumulator2d
+ * @brief Accumulate values on a 2D grid of bins, e.g. a 2D motor scan.
+ *
+ * The count, mean and standard deviation of the values falling in each bin
+ * are accumulated with Welford's algorithm. Samples with nan are ignored.
+ *
+ * The bins have fixed widths and, as numpy.histogram2d, values equal to the
+ * last edge of the grid fall in the last bin. If auto_grow is true, the grid
+ * grows by whole bins to include samples outside it. Otherwise, these samples
+ * are ignored.
+ *
+ * The maps are reallocated when the grid grows. The storage returned by the
+ * accessors is shared, so that it stays valid but is no longer updated.
+ */
+class BinnedAccumulator2d
+{
+public:
+
+  using MapType = xt::xtensor<double, 2>;
+  using CountMapType = xt::xtensor<uint64_t, 2>;
+
+private:
+
+  struct Axis
+  {
+    double origin;
+    double width;
+    double last; // last edge of the initial bins
+    size_t n_bins0; // number of the initial bins
+    size_t n_bins;
+    long offset = 0; // index of the first bin with respect to the origin
+
+    double edge(size_t i) const
+    {
+      // the initial last edge is kept exact
+      if (offset + static_cast<long>(i) == static_cast<long>(n_bins0)) return last;
+      return origin + static_cast<double>(offset + static_cast<long>(i)) * width;
+    }
+
+    /**
+     * Return the index of the bin containing v, which can be out of range.
+     *
+     * As numpy.histogram2d, the last edge is included in the last bin.
+     */
+    double position(double v) const
+    {
+      double pos = std::floor((v - origin) / width) - static_cast<double>(offset);
+      auto n = static_cast<double>(n_bins);
+      // also protect the edges from rounding errors
+      if (pos >= n && v <= edge(n_bins)) return n - 1.;
+      if (pos < 0. && v >= edge(0)) return 0.;
+      return pos;
+    }
+  };
+
+  Axis x_;
+  Axis y_;
+  bool auto_grow_;
+  size_t max_bins_;
+
+  std::shared_ptr<CountMapType> count_;
+  std::shared_ptr<MapType> mean_;
+  std::shared_ptr<MapType> std_;
+  std::shared_ptr<MapType> m2_;
+
+  void allocate(size_t nx, size_t ny);
+
+  void grow(double ix_min, double ix_max, double iy_min, double iy_max);
+
+  bool locate(const Axis& axis, double v, size_t& i) const;
+
+  void push(size_t i, size_t j, double v);
+
+public:
+
+  /**
+   * Constructor.
+   *
+   * @param x_left: first edge of the bins along x.
+   * @param x_right: last edge of the bins along x.
+   * @param x_bins: number of bins along x.
+   * @param y_left: first edge of the bins along y.
+   * @param y_right: last edge of the bins along y.
+   * @param y_bins: number of bins along y.
+   * @param auto_grow: whether to grow the grid to include samples outside it.
+   * @param max_bins: maximum number of bins along each axis.
+   */
+  BinnedAccumulator2d(double x_left, double x_right, size_t x_bins,
+                      double y_left, double y_right, size_t y_bins,
+                      bool auto_grow = false, size_t max_bins = 4096);
+
+  ~BinnedAccumulator2d() = default;
+
+  /**
+   * Accumulate a sample.
+   */
+  void update(double x, double y, double v);
+
+  /**
+   * Accumulate a batch of samples.
+   *
+   * If the grid cannot grow to include all the samples, no sample is accumulated.
+   *
+   * @param xs: x positions. shape = (n,)
+   * @param ys: y positions. shape = (n,)
+   * @param vs: values. shape = (n,)
+   */
+  template<typename E1, typename E2, typename E3,
+    EnableIf<std::decay_t<E1>, IsVector> = false,
+    EnableIf<std::decay_t<E2>, IsVector> = false,
+    EnableIf<std::decay_t<E3>, IsVector> = false>
+  void update(const E1& xs, const E2& ys, const E3& vs);
+
+  /**
+   * Remove all the data and restore the initial grid.
+   */
+  void reset();
+
+  /**
+   * Return the bin edges along x.
+   */
+  xt::xtensor<double, 1> xEdges() const;
+
+  /**
+   * Return the bin edges along y.
+   */
+  xt::xtensor<double, 1> yEdges() const;
+
+  /**
+   * Return the number of samples in each bin. shape = (x bins, y bins)
+   */
+  std::shared_ptr<const CountMapType> count() const { return count_; }
+
+  /**
+   * Return the mean of each bin, which is nan for empty bins. shape = (x bins, y bins)
+   */
+  std::shared_ptr<const MapType> mean() const { return mean_; }
+
+  /**
+   * Return the standard deviation of each bin, which is nan for empty bins.
+   * shape = (x bins, y bins)
+   */
+  std::shared_ptr<const MapType> stdDev() const { return std_; }
+};
+
+inline BinnedAccumulator2d::BinnedAccumulator2d(double x_left, double x_right, size_t x_bins,
+                                                double y_left, double y_right, size_t y_bins,
+                                                bool auto_grow, size_t max_bins)
+  : auto_grow_(auto_grow), max_bins_(max_bins)
+{
+  FOAM_ASSERT_ARGUMENT(x_bins > 0 && y_bins > 0, "Number of bins must be positive")
+  FOAM_ASSERT_ARGUMENT(x_bins <= max_bins && y_bins <= max_bins, "Number of bins exceeds max_bins")
+  FOAM_ASSERT_ARGUMENT(std::isfinite(x_left) && std::isfinite(x_right) &&
+                       std::isfinite(y_left) && std::isfinite(y_right), "Bin edges must be finite")
+  FOAM_ASSERT_ARGUMENT(x_left < x_right && y_left < y_right, "Upper edge must be larger than lower edge")
+
+  x_ = Axis { x_left, (x_right - x_left) / static_cast<double>(x_bins), x_right, x_bins, x_bins };
+  y_ = Axis { y_left, (y_right - y_left) / static_cast<double>(y_bins), y_right, y_bins, y_bins };
+  allocate(x_bins, y_bins);
+}
+
+inline void BinnedAccumulator2d::allocate(size_t nx, size_t ny)
+{
+  constexpr double nan = std::numeric_limits<double>::quiet_NaN();
+  count_ = std::make_shared<CountMapType>(xt::zeros<uint64_t>({nx, ny}));
+  mean_ = std::make_shared<MapType>(xt::xtensor<double, 2>::from_shape({nx, ny}));
+  mean_->fill(nan);
+  std_ = std::make_shared<MapType>(xt::xtensor<double, 2>::from_shape({nx, ny}));
+  std_->fill(nan);
+  m2_ = std::make_shared<MapType>(xt::zeros<double>({nx, ny}));
+}
+
+inline void BinnedAccumulator2d::grow(double ix_min, double ix_max, double iy_min, double iy_max)
+{
+  auto nx_old = static_cast<double>(x_.n_bins);
+  auto ny_old = static_cast<double>(y_.n_bins);
+  double shift_x = std::max(-ix_min, 0.);
+  double shift_y = std::max(-iy_min, 0.);
+  double nx = std::max(ix_max + 1., nx_old) + shift_x;
+  double ny = std::max(iy_max + 1., ny_old) + shift_y;
+  if (nx == nx_old && ny == ny_old) return;
+
+  FOAM_ASSERT_ARGUMENT(nx <= static_cast<double>(max_bins_) && ny <= static_cast<double>(max_bins_),
+                       "Number of bins exceeds max_bins")
+
+  auto count = count_;
+  auto mean = mean_;
+  auto std_dev = std_;
+  auto m2 = m2_;
+  allocate(static_cast<size_t>(nx), static_cast<size_t>(ny));
+
+  auto di = static_cast<size_t>(shift_x);
+  auto dj = static_cast<size_t>(shift_y);
+  for (size_t i = 0; i < x_.n_bins; ++i)
+  {
+    for (size_t j = 0; j < y_.n_bins; ++j)
+    {
+      (*count_)(i + di, j + dj) = (*count)(i, j);
+      (*mean_)(i + di, j + dj) = (*mean)(i, j);
+      (*std_)(i + di, j + dj) = (*std_dev)(i, j);
+      (*m2_)(i + di, j + dj) = (*m2)(i, j);
+    }
+  }
+
+  x_.offset -= static_cast<long>(di);
+  y_.offset -= static_cast<long>(dj);
+  x_.n_bins = static_cast<size_t>(nx);
+  y_.n_bins = static_cast<size_t>(ny);
+}
+
+inline bool BinnedAccumulator2d::locate(const Axis& axis, double v, size_t& i) const
+{
+  double pos = axis.position(v);
+  if (pos >= 0. && pos < static_cast<double>(axis.n_bins))
+  {
+    i = static_cast<size_t>(pos);
+    return true;
+  }
+  return false;
+}
+
+inline void BinnedAccumulator2d::push(size_t i, size_t j, double v)
+{
+  auto n = static_cast<double>(++(*count_)(i, j));
+  double& mean = (*mean_)(i, j);
+  double& m2 = (*m2_)(i, j);
+  if (n == 1.)
+  {
+    mean = v;
+    m2 = 0.;
+  }
+  else
+  {
+    double delta = v - mean;
+    mean += delta / n;
+    m2 += delta * (v - mean);
+  }
+  (*std_)(i, j) = std::sqrt(m2 / n);
+}
+
+inline void BinnedAccumulator2d::update(double x, double y, double v)
+{
+  if (std::isnan(x) || std::isnan(y) || std::isnan(v)) return;
+
+  if (auto_grow_)
+  {
+    FOAM_ASSERT_ARGUMENT(std::isfinite(x) && std::isfinite(y), "Positions must be finite")
+    double ix = x_.position(x);
+    double iy = y_.position(y);
+    grow(ix, ix, iy, iy);
+  }
+
+  size_t i, j;
+  if (locate(x_, x, i) && locate(y_, y, j)) push(i, j, v);
+}
+
+template<typename E1, typename E2, typename E3,
+  EnableIf<std::decay_t<E1>, IsVector>, EnableIf<std::decay_t<E2>, IsVector>, EnableIf<std::decay_t<E3>, IsVector>>
+inline void BinnedAccumulator2d::update(const E1& xs, const E2& ys, const E3& vs)
+{
+  size_t n = xs.size();
+  FOAM_ASSERT_ARGUMENT(ys.size() == n && vs.size() == n, "xs, ys and vs must have the same length")
+
+  auto valid = [&xs, &ys, &vs] (size_t k)
+  {
+    return !(std::isnan(static_cast<double>(xs(k))) || std::isnan(static_cast<double>(ys(k))) ||
+             std::isnan(static_cast<double>(vs(k))));
+  };
+
+  if (auto_grow_)
+  {
+    constexpr double inf = std::numeric_limits<double>::infinity();
+    double ix_min = inf, ix_max = -inf, iy_min = inf, iy_max = -inf;
+    for (size_t k = 0; k < n; ++k)
+    {
+      if (!valid(k)) continue;
+      auto x = static_cast<double>(xs(k));
+      auto y = static_cast<double>(ys(k));
+      FOAM_ASSERT_ARGUMENT(std::isfinite(x) && std::isfinite(y), "Positions must be finite")
+      double ix = x_.position(x);
+      double iy = y_.position(y);
+      ix_min = std::min(ix_min, ix);
+      ix_max = std::max(ix_max, ix);
+      iy_min = std::min(iy_min, iy);
+      iy_max = std::max(iy_max, iy);
+    }
+    if (ix_min <= ix_max) grow(ix_min, ix_max, iy_min, iy_max);
+  }
+
+  for (size_t k = 0; k < n; ++k)
+  {
+    if (!valid(k)) continue;
+    size_t i, j;
+    if (locate(x_, static_cast<double>(xs(k)), i) && locate(y_, static_cast<double>(ys(k)), j))
+    {
+      push(i, j, static_cast<double>(vs(k)));
+    }
+  }
+}
+
+inline void BinnedAccumulator2d::reset()
+{
+  x_.offset = 0;
+  y_.offset = 0;
+  x_.n_bins = x_.n_bins0;
+  y_.n_bins = y_.n_bins0;
+  allocate(x_.n_bins0, y_.n_bins0);
+}
+
+inline xt::xtensor<double, 1> BinnedAccumulator2d::xEdges() const
+{
+  xt::xtensor<double, 1> edges = xt::empty<double>({x_.n_bins + 1});
+  for (size_t i = 0; i <= x_.n_bins; ++i) edges(i) = x_.edge(i);
+  return edges;
+}
+
+inline xt::xtensor<double, 1> BinnedAccumulator2d::yEdges() const
+{
+  xt::xtensor<double, 1> edges = xt::empty<double>({y_.n_bins + 1});
+  for (size_t i = 0; i <= y_.n_bins; ++i) edges(i) = y_.edge(i);
+  return edges;
+}
+
+} // foam
+
+#endif //FOAM_DATA_STRUCTURES_H
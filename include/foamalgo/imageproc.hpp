@@ -10,6 +10,8 @@
 #ifndef FOAM_IMAGE_PROC_H
 #define FOAM_IMAGE_PROC_H
 
+#include <algorithm>
+#include <cmath>
 #include <type_traits>
 
 #include "xtensor/xview.hpp"
@@ -172,6 +174,244 @@ inline auto nanmeanImageArray(E&& src1, E&& src2)
 #endif
 }
 
+namespace detail
+{
+
+/**
+ * Select the median of the values in a buffer, which is reordered in place.
+ *
+ * It is the average of the two middle values if the number of values is even.
+ */
+template<typename T>
+inline T selectMedian(std::vector<T>& buffer)
+{
+  size_t n = buffer.size();
+  auto mid = buffer.begin() + n / 2;
+  std::nth_element(buffer.begin(), mid, buffer.end());
+  if (n % 2 == 1) return *mid;
+  return (*std::max_element(buffer.begin(), mid) + *mid) / T(2);
+}
+
+/**
+ * Select the q-th percentile of the values in a buffer, which is reordered in place.
+ *
+ * It linearly interpolates between the two nearest ranks like numpy.percentile.
+ */
+template<typename T>
+inline T selectPercentile(std::vector<T>& buffer, double q)
+{
+  size_t n = buffer.size();
+  double index = q / 100. * static_cast<double>(n - 1);
+  auto lo = static_cast<size_t>(std::floor(index));
+  double gamma = index - static_cast<double>(lo);
+
+  auto it = buffer.begin() + lo;
+  std::nth_element(buffer.begin(), it, buffer.end());
+  auto a = static_cast<double>(*it);
+  if (gamma == 0. || lo + 1 >= n) return static_cast<T>(a);
+
+  auto b = static_cast<double>(*std::min_element(it + 1, buffer.end()));
+  double diff = b - a;
+  return static_cast<T>(gamma >= 0.5 ? b - diff * (1. - gamma) : a + diff * gamma);
+}
+
+/**
+ * Apply a selector to the non-nan values of each pixel along the first axis
+ * of an array of images.
+ */
+template<typename E, typename F>
+inline auto nanselectImageArrayImp(E&& src, const std::vector<size_t>& keep, F&& select)
+{
+  using value_type = typename std::decay_t<E>::value_type;
+  auto shape = src.shape();
+
+  for (auto idx : keep)
+  {
+    FOAM_ASSERT_ARGUMENT(idx < shape[0], "Index out of range: " + std::to_string(idx))
+  }
+
+  auto ret = ReducedImageType<E>::from_shape({static_cast<std::size_t>(shape[1]),
+                                              static_cast<std::size_t>(shape[2])});
+
+  auto fill = [&src, &keep, &shape, &ret, &select] (size_t j, size_t k, std::vector<value_type>& buffer)
+  {
+    buffer.clear();
+    if (keep.empty())
+    {
+      for (size_t i = 0; i < shape[0]; ++i)
+      {
+        auto v = src(i, j, k);
+        if (! std::isnan(v)) buffer.push_back(v);
+      }
+    } else
+    {
+      for (auto i : keep)
+      {
+        auto v = src(i, j, k);
+        if (! std::isnan(v)) buffer.push_back(v);
+      }
+    }
+
+    if (buffer.empty()) ret(j, k) = std::numeric_limits<value_type>::quiet_NaN();
+    else ret(j, k) = select(buffer);
+  };
+
+#if defined(FOAM_USE_TBB)
+  tbb::parallel_for(tbb::blocked_range2d<int>(0, shape[1], 0, shape[2]),
+    [&fill, &shape] (const tbb::blocked_range2d<int> &block)
+    {
+      std::vector<value_type> buffer;
+      buffer.reserve(shape[0]);
+      for(int j=block.rows().begin(); j != block.rows().end(); ++j)
+      {
+        for(int k=block.cols().begin(); k != block.cols().end(); ++k)
+        {
+#else
+      std::vector<value_type> buffer;
+      buffer.reserve(shape[0]);
+      for (size_t j = 0; j < shape[1]; ++j)
+      {
+        for (size_t k = 0; k < shape[2]; ++k)
+        {
+#endif
+          fill(j, k, buffer);
+        }
+      }
+#if defined(FOAM_USE_TBB)
+    }
+  );
+#endif
+
+  return ret;
+}
+
+} // detail
+
+/**
+ * @brief Calculate the pixel-wise nanmedian of an array of images.
+ *
+ * @param src: image data. shape = (indices, y, x)
+ * @return: the nanmedian image. shape = (y, x)
+ */
+template<typename E, EnableIf<std::decay_t<E>, IsImageArray> = false>
+inline auto nanmedianImageArray(E&& src)
+{
+  using value_type = typename std::decay_t<E>::value_type;
+  return detail::nanselectImageArrayImp(
+    std::forward<E>(src), {}, [] (std::vector<value_type>& buffer) { return detail::selectMedian(buffer); });
+}
+
+/**
+ * @brief Calculate the pixel-wise nanmedian of the selected images from an array of images.
+ *
+ * @param src: image data. shape = (indices, y, x)
+ * @param keep: a list of selected indices.
+ * @return: the nanmedian image. shape = (y, x)
+ */
+template<typename E, EnableIf<std::decay_t<E>, IsImageArray> = false>
+inline auto nanmedianImageArray(E&& src, const std::vector<size_t>& keep)
+{
+  if (keep.empty()) throw std::invalid_argument("keep cannot be empty!");
+  using value_type = typename std::decay_t<E>::value_type;
+  return detail::nanselectImageArrayImp(
+    std::forward<E>(src), keep, [] (std::vector<value_type>& buffer) { return detail::selectMedian(buffer); });
+}
+
+/**
+ * @brief Calculate the pixel-wise q-th nanpercentile of an array of images.
+ *
+ * The percentile is linearly interpolated between the two nearest ranks.
+ *
+ * @param src: image data. shape = (indices, y, x)
+ * @param q: percentile in [0, 100].
+ * @return: the nanpercentile image. shape = (y, x)
+ */
+template<typename E, EnableIf<std::decay_t<E>, IsImageArray> = false>
+inline auto nanpercentileImageArray(E&& src, double q)
+{
+  FOAM_ASSERT_ARGUMENT(q >= 0. && q <= 100., "Percentile must be within [0, 100]")
+  using value_type = typename std::decay_t<E>::value_type;
+  return detail::nanselectImageArrayImp(
+    std::forward<E>(src), {},
+    [q] (std::vector<value_type>& buffer) { return detail::selectPercentile(buffer, q); });
+}
+
+/**
+ * @brief Calculate the pixel-wise q-th nanpercentile of the selected images from
+ *    an array of images.
+ *
+ * @param src: image data. shape = (indices, y, x)
+ * @param q: percentile in [0, 100].
+ * @param keep: a list of selected indices.
+ * @return: the nanpercentile image. shape = (y, x)
+ */
+template<typename E, EnableIf<std::decay_t<E>, IsImageArray> = false>
+inline auto nanpercentileImageArray(E&& src, double q, const std::vector<size_t>& keep)
+{
+  if (keep.empty()) throw std::invalid_argument("keep cannot be empty!");
+  FOAM_ASSERT_ARGUMENT(q >= 0. && q <= 100., "Percentile must be within [0, 100]")
+  using value_type = typename std::decay_t<E>::value_type;
+  return detail::nanselectImageArrayImp(
+    std::forward<E>(src), keep,
+    [q] (std::vector<value_type>& buffer) { return detail::selectPercentile(buffer, q); });
+}
+
+/**
+ * @brief Accumulate the nan-sum and the number of non-nan values of an array of images.
+ *
+ * It allows calculating the nanmean of a stack of images chunk by chunk. The sum is
+ * accumulated in the value type of sum, which can be wider than the one of src to
+ * limit the loss of precision over a large stack.
+ *
+ * @param src: image data. shape = (indices, y, x)
+ * @param sum: the running sum. shape = (y, x)
+ * @param count: the running number of non-nan values. shape = (y, x)
+ */
+template<typename E, typename S, typename C,
+  EnableIf<E, IsImageArray> = false, EnableIf<S, IsImage> = false, EnableIf<C, IsImage> = false>
+inline void nanAccumulateImageArray(const E& src, S& sum, C& count)
+{
+  using value_type = typename S::value_type;
+  auto shape = src.shape();
+
+  utils::checkShape(sum.shape(), shape, "Sum and image data have different shapes", 0, 1);
+  utils::checkShape(count.shape(), shape, "Count and image data have different shapes", 0, 1);
+
+#if defined(FOAM_USE_TBB)
+  tbb::parallel_for(tbb::blocked_range2d<int>(0, shape[1], 0, shape[2]),
+    [&src, &shape, &sum, &count] (const tbb::blocked_range2d<int> &block)
+    {
+      for(int j=block.rows().begin(); j != block.rows().end(); ++j)
+      {
+        for(int k=block.cols().begin(); k != block.cols().end(); ++k)
+        {
+#else
+      for (size_t j = 0; j < shape[1]; ++j)
+      {
+        for (size_t k = 0; k < shape[2]; ++k)
+        {
+#endif
+          std::size_t n = 0;
+          value_type s = sum(j, k);
+          for (size_t i=0; i<shape[0]; ++i)
+          {
+            auto v = src(i, j, k);
+            if (! std::isnan(v))
+            {
+              n += 1;
+              s += v;
+            }
+          }
+          sum(j, k) = s;
+          count(j, k) += n;
+        }
+      }
+#if defined(FOAM_USE_TBB)
+    }
+  );
+#endif
+}
+
 /**
  * @brief Inplace convert nan using 0 in an image.
  *
@@ -8,17 +8,2216 @@
 #ifndef FOAM_STATISTICS_HPP
 #define FOAM_STATISTICS_HPP
 
+#include <algorithm>
+#include <cmath>
+#include <functional>
+#include <limits>
+#include <memory>
+#include <random>
+#include <sstream>
+#include <string>
+#include <tuple>
 #include <type_traits>
+#include <utility>
+#include <vector>
 
 #include "xtensor/xmath.hpp"
 #include "xtensor/xhistogram.hpp"
 
+#if defined(FOAM_USE_TBB)
+#include "tbb/parallel_for.h"
+#include "tbb/parallel_reduce.h"
+#include "tbb/blocked_range.h"
+#endif
+
 #include "traits.hpp"
+#include "utilities.hpp"
 
 
 namespace foam
 {
 
+namespace detail
+{
+
+/**
+ * Reduce the rows [0, n_rows) of a data set, in parallel if TBB is available.
+ *
+ * @param n_rows: number of rows.
+ * @param identity: initial value of the accumulator.
+ * @param f: callable which accumulates a row into an accumulator, i.e. f(row, acc).
+ * @param join: callable which merges two accumulators, i.e. join(acc1, acc2) -> acc.
+ */
+template<typename V, typename F, typename J>
+inline V reduceRows(size_t n_rows, const V& identity, const F& f, const J& join)
+{
+#if defined(FOAM_USE_TBB)
+  return tbb::parallel_reduce(tbb::blocked_range<size_t>(0, n_rows), identity,
+    [&f] (const tbb::blocked_range<size_t> &block, V acc)
+    {
+      for (size_t r = block.begin(); r != block.end(); ++r) f(r, acc);
+      return acc;
+    },
+    join
+  );
+#else
+  V acc = identity;
+  for (size_t r = 0; r < n_rows; ++r) f(r, acc);
+  return acc;
+#endif
+}
+
+/**
+ * Online accumulator of the count, sum, sum of squared deviations (Welford),
+ * minimum and maximum of a stream of values.
+ */
+struct MomentsAccumulator
+{
+  size_t count = 0;
+  double sum = 0.;
+  double mean = 0.;
+  double m2 = 0.;
+  double min = std::numeric_limits<double>::infinity();
+  double max = -std::numeric_limits<double>::infinity();
+
+  void push(double v)
+  {
+    ++count;
+    sum += v;
+    double delta = v - mean;
+    mean += delta / static_cast<double>(count);
+    m2 += delta * (v - mean);
+    if (v < min) min = v;
+    if (v > max) max = v;
+  }
+
+  /**
+   * Merge another accumulator (Chan et al.).
+   */
+  void merge(const MomentsAccumulator& other)
+  {
+    if (other.count == 0) return;
+    if (count == 0)
+    {
+      *this = other;
+      return;
+    }
+
+    auto na = static_cast<double>(count);
+    auto nb = static_cast<double>(other.count);
+    double n = na + nb;
+    double delta = other.mean - mean;
+    mean += delta * nb / n;
+    m2 += other.m2 + delta * delta * na * nb / n;
+
+    count += other.count;
+    sum += other.sum;
+    if (other.min < min) min = other.min;
+    if (other.max > max) max = other.max;
+  }
+
+  /**
+   * Return the members other than count for serialization.
+   */
+  auto fields() { return std::tie(sum, mean, m2, min, max); }
+
+  /**
+   * Return the mean, or nan if there is no value.
+   */
+  double average() const
+  {
+    return count == 0 ? std::numeric_limits<double>::quiet_NaN() : sum / static_cast<double>(count);
+  }
+
+  /**
+   * Return the population variance, or nan if there is no value.
+   */
+  double variance() const
+  {
+    return count == 0 ? std::numeric_limits<double>::quiet_NaN() : m2 / static_cast<double>(count);
+  }
+};
+
+/**
+ * Equal-width bins which assign values to bins in the same way as numpy.histogram.
+ *
+ * Values equal to the last edge fall in the last bin.
+ */
+class UniformBins
+{
+  double first_;
+  double last_;
+  size_t n_bins_;
+  std::vector<double> edges_;
+
+public:
+
+  UniformBins(double first, double last, size_t n_bins)
+    : first_(first), last_(last), n_bins_(n_bins), edges_(n_bins + 1)
+  {
+    FOAM_ASSERT_ARGUMENT(n_bins > 0, "Number of bins must be positive")
+    FOAM_ASSERT_ARGUMENT(std::isfinite(first) && std::isfinite(last),
+                         "Bin edges must be finite: [" + std::to_string(first) + ", " + std::to_string(last) + "]")
+    FOAM_ASSERT_ARGUMENT(first < last, "Upper edge must be larger than lower edge")
+
+    // the same as numpy.linspace
+    double step = (last - first) / static_cast<double>(n_bins);
+    for (size_t i = 0; i < n_bins; ++i) edges_[i] = static_cast<double>(i) * step + first;
+    edges_[n_bins] = last;
+  }
+
+  /**
+   * Return the bin index of a value, or -1 if it is outside the bins or nan.
+   */
+  long index(double v) const
+  {
+    if (!(v >= first_ && v <= last_)) return -1;
+
+    auto i = static_cast<size_t>((v - first_) / (last_ - first_) * static_cast<double>(n_bins_));
+    if (i >= n_bins_) i = n_bins_ - 1;
+    // correct the rounding error at the bin edges
+    if (v < edges_[i]) --i;
+    else if (i != n_bins_ - 1 && v >= edges_[i + 1]) ++i;
+    return static_cast<long>(i);
+  }
+
+  size_t size() const { return n_bins_; }
+
+  double first() const { return first_; }
+
+  double last() const { return last_; }
+
+  const std::vector<double>& edges() const { return edges_; }
+};
+
+/**
+ * Merge two histograms with the same bins.
+ */
+template<typename T>
+inline std::vector<T> mergeHistograms(std::vector<T> a, const std::vector<T>& b)
+{
+  for (size_t i = 0; i < a.size(); ++i) a[i] += b[i];
+  return a;
+}
+
+/**
+ * Fill a histogram with the weighted values [0, n) in parallel.
+ *
+ * Each thread fills its local bins, which are merged at the end.
+ *
+ * @param n: number of values.
+ * @param value: callable which returns the i-th value.
+ * @param weight: callable which returns the weight of the i-th value.
+ * @param bins: bins of the histogram.
+ */
+template<typename T, typename F, typename G>
+inline std::vector<T> histogramImp(size_t n, const F& value, const G& weight, const UniformBins& bins)
+{
+  return reduceRows(n, std::vector<T>(bins.size(), T(0)),
+    [&value, &weight, &bins] (size_t i, std::vector<T>& hist)
+    {
+      auto idx = bins.index(static_cast<double>(value(i)));
+      if (idx >= 0) hist[idx] += static_cast<T>(weight(i));
+    },
+    mergeHistograms<T>
+  );
+}
+
+/**
+ * Fill a 2D histogram with the weighted value pairs [0, n) in parallel.
+ */
+template<typename T, typename F, typename G>
+inline std::vector<T> histogram2dImp(size_t n, const F& value, const G& weight,
+                                     const UniformBins& x_bins, const UniformBins& y_bins)
+{
+  size_t ny = y_bins.size();
+  return reduceRows(n, std::vector<T>(x_bins.size() * ny, T(0)),
+    [&value, &weight, &x_bins, &y_bins, ny] (size_t i, std::vector<T>& hist)
+    {
+      auto v = value(i);
+      auto ix = x_bins.index(static_cast<double>(v.first));
+      if (ix < 0) return;
+      auto iy = y_bins.index(static_cast<double>(v.second));
+      if (iy < 0) return;
+      hist[ix * ny + iy] += static_cast<T>(weight(i));
+    },
+    mergeHistograms<T>
+  );
+}
+
+template<typename T, typename E, typename G>
+inline auto histogramRowsImp(E&& src, const G& weight, double left, double right, size_t n_bins)
+{
+  auto shape = src.shape();
+  UniformBins bins(left, right, n_bins);
+
+  xt::xtensor<T, 2> hist = xt::zeros<T>({static_cast<size_t>(shape[0]), n_bins});
+
+#if defined(FOAM_USE_TBB)
+  tbb::parallel_for(tbb::blocked_range<int>(0, shape[0]),
+    [&src, &weight, &shape, &bins, &hist] (const tbb::blocked_range<int> &block)
+    {
+      for(int i=block.begin(); i != block.end(); ++i)
+      {
+#else
+      for (size_t i = 0; i < shape[0]; ++i)
+      {
+#endif
+        for (size_t j = 0; j < shape[1]; ++j)
+        {
+          auto idx = bins.index(static_cast<double>(src(i, j)));
+          if (idx >= 0) hist(i, idx) += static_cast<T>(weight(i, j));
+        }
+      }
+#if defined(FOAM_USE_TBB)
+    }
+  );
+#endif
+
+  return hist;
+}
+
+template<typename T>
+inline xt::xtensor<T, 1> toTensor(const std::vector<T>& v)
+{
+  xt::xtensor<T, 1> ret = xt::empty<T>({v.size()});
+  std::copy(v.begin(), v.end(), ret.begin());
+  return ret;
+}
+
+/**
+ * Determine the outer edges of the histogram from the bin range and the
+ * min/max of the data, following the convention of numpy.histogram.
+ */
+inline std::pair<double, double> outerEdges(double lb, double ub, const MomentsAccumulator& moments)
+{
+  bool empty = moments.count == 0;
+  if (!std::isfinite(lb) && !std::isfinite(ub))
+  {
+    if (empty)
+    {
+      lb = 0.;
+      ub = 0.;
+    } else
+    {
+      lb = moments.min;
+      ub = moments.max;
+    }
+    if (lb == ub)
+    {
+      lb -= 0.5;
+      ub += 0.5;
+    }
+  } else if (!std::isfinite(ub))
+  {
+    ub = empty ? lb + 1. : moments.max;
+    if (ub <= lb) ub = lb + 1.;
+  } else if (!std::isfinite(lb))
+  {
+    lb = empty ? ub - 1. : moments.min;
+    if (lb >= ub) lb = ub - 1.;
+  }
+  return {lb, ub};
+}
+
+template<typename F>
+inline auto nanhistWithStatsImp(const F& at, size_t n_rows, size_t n_cols, double lb, double ub, size_t n_bins)
+{
+  FOAM_ASSERT_ARGUMENT(lb < ub, "Lower boundary must be smaller than upper boundary")
+  FOAM_ASSERT_ARGUMENT(n_bins > 0, "Number of bins must be positive")
+
+  using HistType = std::vector<long long>;
+  auto accepted = [lb, ub] (double v) { return v >= lb && v <= ub; }; // false for nan
+
+  auto fill_hist = [&at, n_cols, &accepted] (const UniformBins& bins, size_t r, HistType& hist)
+  {
+    for (size_t c = 0; c < n_cols; ++c)
+    {
+      double v = at(r, c);
+      if (!accepted(v)) continue;
+      auto i = bins.index(v);
+      if (i >= 0) ++hist[i];
+    }
+  };
+
+  // The histogram is filled in the same pass when the bin edges are known beforehand.
+  bool edges_known = std::isfinite(lb) && std::isfinite(ub);
+
+  struct Accumulator
+  {
+    MomentsAccumulator moments;
+    HistType hist;
+  };
+
+  std::unique_ptr<UniformBins> bins;
+  if (edges_known) bins = std::make_unique<UniformBins>(lb, ub, n_bins);
+
+  auto acc = reduceRows(n_rows, Accumulator{MomentsAccumulator(), HistType(edges_known ? n_bins : 0, 0)},
+    [&at, n_cols, &accepted, &bins] (size_t r, Accumulator& acc)
+    {
+      for (size_t c = 0; c < n_cols; ++c)
+      {
+        double v = at(r, c);
+        if (!accepted(v)) continue;
+        acc.moments.push(v);
+        if (bins)
+        {
+          auto i = bins->index(v);
+          if (i >= 0) ++acc.hist[i];
+        }
+      }
+    },
+    [] (Accumulator a, const Accumulator& b)
+    {
+      a.moments.merge(b.moments);
+      a.hist = mergeHistograms(std::move(a.hist), b.hist);
+      return a;
+    }
+  );
+
+  const auto& moments = acc.moments;
+  HistType hist = std::move(acc.hist);
+  if (!edges_known)
+  {
+    auto edges = outerEdges(lb, ub, moments);
+    bins = std::make_unique<UniformBins>(edges.first, edges.second, n_bins);
+
+    hist = reduceRows(n_rows, HistType(n_bins, 0),
+      [&fill_hist, &bins] (size_t r, HistType& h) { fill_hist(*bins, r, h); },
+      mergeHistograms<long long>
+    );
+  }
+
+  // Histogram-assisted selection of the median. The range holding the middle
+  // rank(s) is refined with a fixed number of sub-bins until the values in it
+  // are few enough to be gathered, so that the memory is bounded whatever the
+  // distribution of the data.
+  double median = std::numeric_limits<double>::quiet_NaN();
+  if (moments.count > 0)
+  {
+    constexpr size_t n_sub_bins = 1024;
+    constexpr size_t max_candidates = 65536;
+
+    size_t k1 = (moments.count - 1) / 2;
+    size_t k2 = moments.count / 2;
+
+    // [lo, hi), or [lo, hi] if hi_closed, holds the middle rank(s). offset is
+    // the number of values below lo and n is the number of values in the range.
+    size_t b1 = 0, b2 = 0, offset = 0, n = 0;
+    size_t cum = 0;
+    bool found = false;
+    for (size_t i = 0; i < n_bins; ++i)
+    {
+      auto n_i = static_cast<size_t>(hist[i]);
+      if (!found && k1 < cum + n_i)
+      {
+        b1 = i;
+        offset = cum;
+        found = true;
+      }
+      if (found) n += n_i;
+      if (k2 < cum + n_i)
+      {
+        b2 = i;
+        break;
+      }
+      cum += n_i;
+    }
+    double lo = bins->edges()[b1];
+    double hi = bins->edges()[b2 + 1];
+    bool hi_closed = b2 + 1 == n_bins;
+
+    struct SubHistogram
+    {
+      std::vector<size_t> count;
+      std::vector<double> min;
+      std::vector<double> max;
+
+      explicit SubHistogram(size_t n_bins)
+        : count(n_bins, 0),
+          min(n_bins, std::numeric_limits<double>::infinity()),
+          max(n_bins, -std::numeric_limits<double>::infinity()) {}
+    };
+
+    double x1, x2;
+    while (true)
+    {
+      auto in_range = [&accepted, lo, hi, hi_closed] (double v)
+      {
+        return accepted(v) && v >= lo && (v < hi || (hi_closed && v == hi));
+      };
+
+      if (n <= max_candidates)
+      {
+        auto candidates = reduceRows(n_rows, std::vector<double>(),
+          [&at, n_cols, &in_range] (size_t r, std::vector<double>& buffer)
+          {
+            for (size_t c = 0; c < n_cols; ++c)
+            {
+              double v = at(r, c);
+              if (in_range(v)) buffer.push_back(v);
+            }
+          },
+          [] (std::vector<double> a, const std::vector<double>& b)
+          {
+            a.insert(a.end(), b.begin(), b.end());
+            return a;
+          }
+        );
+
+        auto it1 = candidates.begin() + (k1 - offset);
+        std::nth_element(candidates.begin(), it1, candidates.end());
+        x1 = *it1;
+        x2 = k2 == k1 ? x1 : *std::min_element(it1 + 1, candidates.end());
+        break;
+      }
+
+      UniformBins sub_bins(lo, hi, n_sub_bins);
+      auto sub = reduceRows(n_rows, SubHistogram(n_sub_bins),
+        [&at, n_cols, &in_range, &sub_bins] (size_t r, SubHistogram& h)
+        {
+          for (size_t c = 0; c < n_cols; ++c)
+          {
+            double v = at(r, c);
+            if (!in_range(v)) continue;
+            auto i = sub_bins.index(v);
+            ++h.count[i];
+            if (v < h.min[i]) h.min[i] = v;
+            if (v > h.max[i]) h.max[i] = v;
+          }
+        },
+        [] (SubHistogram a, const SubHistogram& b)
+        {
+          for (size_t i = 0; i < a.count.size(); ++i)
+          {
+            a.count[i] += b.count[i];
+            a.min[i] = std::min(a.min[i], b.min[i]);
+            a.max[i] = std::max(a.max[i], b.max[i]);
+          }
+          return a;
+        }
+      );
+
+      size_t j1 = 0, j2 = 0, sub_offset = 0;
+      cum = offset;
+      found = false;
+      for (size_t i = 0; i < n_sub_bins; ++i)
+      {
+        if (!found && k1 < cum + sub.count[i])
+        {
+          j1 = i;
+          sub_offset = cum;
+          found = true;
+        }
+        if (k2 < cum + sub.count[i])
+        {
+          j2 = i;
+          break;
+        }
+        cum += sub.count[i];
+      }
+
+      if (j1 != j2)
+      {
+        // k1 is the last rank of sub-bin j1 and k2 is the first rank of sub-bin j2
+        x1 = sub.max[j1];
+        x2 = sub.min[j2];
+        break;
+      }
+      if (sub.min[j1] == sub.max[j1])
+      {
+        x1 = x2 = sub.min[j1];
+        break;
+      }
+
+      lo = sub.min[j1];
+      hi = sub.max[j1];
+      hi_closed = true;
+      offset = sub_offset;
+      n = sub.count[j1];
+    }
+    median = k2 == k1 ? x1 : (x1 + x2) / 2.;
+  }
+
+  return std::make_tuple(toTensor(hist), bins->first(), bins->last(),
+                         moments.average(), median, std::sqrt(moments.variance()));
+}
+
+/**
+ * Compensated (Kahan-Babuska-Neumaier) summation of a stream of values,
+ * optionally weighted.
+ */
+struct KahanAccumulator
+{
+  size_t count = 0;
+  double weight = 0.;
+  double sum = 0.;
+  double compensation = 0.;
+
+  void push(double v)
+  {
+    ++count;
+    weight += 1.;
+    add(v);
+  }
+
+  void push(double v, double w)
+  {
+    ++count;
+    weight += w;
+    add(w * v);
+  }
+
+  void merge(const KahanAccumulator& other)
+  {
+    count += other.count;
+    weight += other.weight;
+    add(other.sum);
+    compensation += other.compensation;
+  }
+
+  double value() const { return sum + compensation; }
+
+private:
+  void add(double v)
+  {
+    double t = sum + v;
+    // the compensation is meaningless once the sum overflows
+    if (std::isfinite(t))
+    {
+      if (std::abs(sum) >= std::abs(v)) compensation += (sum - t) + v;
+      else compensation += (v - t) + sum;
+    }
+    sum = t;
+  }
+};
+
+/**
+ * Online accumulator of the mean and sum of squared deviations (Welford),
+ * optionally weighted (West).
+ */
+struct WelfordAccumulator
+{
+  size_t count = 0;
+  double weight = 0.;
+  double mean = 0.;
+  double m2 = 0.;
+
+  void push(double v) { push(v, 1.); }
+
+  void push(double v, double w)
+  {
+    ++count;
+    weight += w;
+    double delta = v - mean;
+    mean += delta * w / weight;
+    m2 += w * delta * (v - mean);
+  }
+
+  /**
+   * Merge another accumulator (Chan et al.).
+   */
+  void merge(const WelfordAccumulator& other)
+  {
+    if (other.count == 0) return;
+    if (count == 0)
+    {
+      *this = other;
+      return;
+    }
+
+    double wa = weight;
+    double wb = other.weight;
+    double w = wa + wb;
+    double delta = other.mean - mean;
+    mean += delta * wb / w;
+    m2 += other.m2 + delta * delta * wa * wb / w;
+    weight = w;
+    count += other.count;
+  }
+};
+
+/**
+ * Online accumulator of the minimum (Compare = std::less) or the maximum
+ * (Compare = std::greater) of a stream of values.
+ */
+template<typename Compare>
+struct ExtremumAccumulator
+{
+  size_t count = 0;
+  double value = 0.;
+
+  void push(double v)
+  {
+    if (count == 0 || Compare()(v, value)) value = v;
+    ++count;
+  }
+
+  void merge(const ExtremumAccumulator& other)
+  {
+    if (other.count == 0) return;
+    push(other.value);
+    count += other.count - 1;
+  }
+};
+
+/**
+ * Push the value of a column into an accumulator.
+ */
+struct PushValue
+{
+  template<typename Accumulator>
+  void operator()(Accumulator& acc, size_t, double v) const { acc.push(v); }
+};
+
+/**
+ * Push the value of a column into an accumulator with the weight of the
+ * column, unless the column is masked or its weight is zero.
+ */
+template<typename M, typename W>
+struct PushMaskedWeighted
+{
+  const M& mask;
+  const W& weights;
+
+  template<typename Accumulator>
+  void operator()(Accumulator& acc, size_t j, double v) const
+  {
+    if (mask(j)) return;
+    auto w = static_cast<double>(weights(j));
+    if (w != 0.) acc.push(v, w);
+  }
+};
+
+/**
+ * Accumulate the values [0, n) in parallel, ignoring nan.
+ *
+ * @param n: number of values.
+ * @param at: callable which returns the i-th value.
+ */
+template<typename Accumulator, typename F>
+inline Accumulator nanreduceImp(size_t n, const F& at)
+{
+  return reduceRows(n, Accumulator(),
+    [&at] (size_t i, Accumulator& acc)
+    {
+      auto v = at(i);
+      if (!std::isnan(v)) acc.push(static_cast<double>(v));
+    },
+    [] (Accumulator a, const Accumulator& b)
+    {
+      a.merge(b);
+      return a;
+    }
+  );
+}
+
+/**
+ * Reduce a 2D array along the first axis with an accumulator, ignoring nan.
+ *
+ * Each thread handles a block of columns and walks through the rows, so that
+ * the memory is accessed contiguously. If there are only a few columns, the
+ * rows are split among threads instead.
+ *
+ * @param store: callable which stores the accumulator of a column, i.e. store(col, acc).
+ * @param push: callable which pushes a non-nan value of a column into an
+ *    accumulator, i.e. push(acc, col, value).
+ */
+template<typename Accumulator, typename E, typename S, typename P = PushValue>
+inline void nanreduceAxis0Imp(E&& src, const S& store, const P& push = P())
+{
+
+  auto shape = src.shape();
+  size_t n_rows = shape[0];
+  size_t n_cols = shape[1];
+
+  auto accumulate = [&src, &push] (size_t i, size_t first, size_t last, std::vector<Accumulator>& accs)
+  {
+    for (size_t j = first; j < last; ++j)
+    {
+      auto v = src(i, j);
+      if (!std::isnan(v)) push(accs[j - first], j, static_cast<double>(v));
+    }
+  };
+
+  if (n_cols < 64)
+  {
+    auto accs = reduceRows(n_rows, std::vector<Accumulator>(n_cols),
+      [&accumulate, n_cols] (size_t i, std::vector<Accumulator>& accs) { accumulate(i, 0, n_cols, accs); },
+      [] (std::vector<Accumulator> a, const std::vector<Accumulator>& b)
+      {
+        for (size_t j = 0; j < a.size(); ++j) a[j].merge(b[j]);
+        return a;
+      }
+    );
+    for (size_t j = 0; j < n_cols; ++j) store(j, accs[j]);
+    return;
+  }
+
+  auto reduceColumns = [&accumulate, &store, n_rows] (size_t first, size_t last)
+  {
+    std::vector<Accumulator> accs(last - first);
+    for (size_t i = 0; i < n_rows; ++i) accumulate(i, first, last, accs);
+    for (size_t j = first; j < last; ++j) store(j, accs[j - first]);
+  };
+
+#if defined(FOAM_USE_TBB)
+  tbb::parallel_for(tbb::blocked_range<size_t>(0, n_cols, 64),
+    [&reduceColumns] (const tbb::blocked_range<size_t> &block)
+    {
+      reduceColumns(block.begin(), block.end());
+    }
+  );
+#else
+  reduceColumns(0, n_cols);
+#endif
+}
+
+/**
+ * Reduce a 2D array along the second axis with an accumulator, ignoring nan.
+ *
+ * @param store: callable which stores the accumulator of a row, i.e. store(row, acc).
+ * @param push: callable which pushes a non-nan value of a column into an
+ *    accumulator, i.e. push(acc, col, value).
+ */
+template<typename Accumulator, typename E, typename S, typename P = PushValue>
+inline void nanreduceAxis1Imp(E&& src, const S& store, const P& push = P())
+{
+  auto shape = src.shape();
+
+#if defined(FOAM_USE_TBB)
+  tbb::parallel_for(tbb::blocked_range<size_t>(0, shape[0]),
+    [&src, &store, &push, &shape] (const tbb::blocked_range<size_t> &block)
+    {
+      for(size_t i=block.begin(); i != block.end(); ++i)
+      {
+#else
+      for (size_t i = 0; i < shape[0]; ++i)
+      {
+#endif
+        Accumulator acc;
+        for (size_t j = 0; j < shape[1]; ++j)
+        {
+          auto v = src(i, j);
+          if (!std::isnan(v)) push(acc, j, static_cast<double>(v));
+        }
+        store(i, acc);
+      }
+#if defined(FOAM_USE_TBB)
+    }
+  );
+#endif
+}
+
+/**
+ * Return the steps along each axis which down-sample an array to no more
+ * than max_size elements by repeatedly halving its longest axis.
+ */
+template<typename S>
+inline auto downsampleSteps(const S& shape, size_t max_size)
+{
+  std::vector<size_t> sizes(shape.begin(), shape.end());
+  std::vector<size_t> steps(sizes.size(), 1);
+
+  auto size = [&sizes] ()
+  {
+    size_t n = 1;
+    for (auto v : sizes) n *= v;
+    return n;
+  };
+
+  while (size() > max_size)
+  {
+    auto k = std::max_element(sizes.begin(), sizes.end()) - sizes.begin();
+    sizes[k] = (sizes[k] + 1) / 2;
+    steps[k] *= 2;
+  }
+  return steps;
+}
+
+/**
+ * Return the lower and upper quantiles of values with the 'nearest' method
+ * of numpy.quantile.
+ *
+ * The values are partially reordered.
+ *
+ * @param values: values without nan.
+ * @param q: quantile of the upper value, which must be within [0.5, 1]. The
+ *    lower value is the (1 - q) quantile.
+ */
+inline std::pair<double, double> nearestQuantiles(std::vector<double>& values, double q)
+{
+  if (values.empty())
+  {
+    return std::make_pair(std::numeric_limits<double>::quiet_NaN(),
+                          std::numeric_limits<double>::quiet_NaN());
+  }
+
+  if (q == 1.)
+  {
+    auto [lo, hi] = std::minmax_element(values.begin(), values.end());
+    return std::make_pair(*lo, *hi);
+  }
+
+  // ties are rounded to the nearest even index as numpy does
+  auto n = static_cast<double>(values.size() - 1);
+  auto lo = values.begin() + static_cast<long>(std::nearbyint((1. - q) * n));
+  auto hi = values.begin() + static_cast<long>(std::nearbyint(q * n));
+
+  std::nth_element(values.begin(), lo, values.end());
+  double v_lo = *lo;
+  std::nth_element(lo, hi, values.end());
+  return std::make_pair(v_lo, *hi);
+}
+
+} // detail
+
+/**
+ * Reducer policies for nanreduce, nanreduceAxis0 and nanreduceAxis1.
+ *
+ * Sums are compensated and variances are computed with Welford's algorithm,
+ * both in double precision regardless of the type of the input. The sum, mean,
+ * variance and standard deviation policies also apply to weighted reductions,
+ * where the mean is sum(w * x) / sum(w) and the variance is
+ * sum(w * (x - mean)^2) / sum(w).
+ */
+struct NansumPolicy
+{
+  using Accumulator = detail::KahanAccumulator;
+
+  static double result(const Accumulator& acc) { return acc.value(); }
+};
+
+struct NanmeanPolicy
+{
+  using Accumulator = detail::KahanAccumulator;
+
+  static double result(const Accumulator& acc)
+  {
+    if (acc.count == 0) return std::numeric_limits<double>::quiet_NaN();
+    return acc.value() / acc.weight;
+  }
+};
+
+struct NanvarPolicy
+{
+  using Accumulator = detail::WelfordAccumulator;
+
+  static double result(const Accumulator& acc)
+  {
+    if (acc.count == 0) return std::numeric_limits<double>::quiet_NaN();
+    return acc.m2 / acc.weight;
+  }
+};
+
+struct NanstdPolicy
+{
+  using Accumulator = detail::WelfordAccumulator;
+
+  static double result(const Accumulator& acc) { return std::sqrt(NanvarPolicy::result(acc)); }
+};
+
+struct NanminPolicy
+{
+  using Accumulator = detail::ExtremumAccumulator<std::less<double>>;
+
+  static double result(const Accumulator& acc)
+  {
+    return acc.count == 0 ? std::numeric_limits<double>::quiet_NaN() : acc.value;
+  }
+};
+
+struct NanmaxPolicy
+{
+  using Accumulator = detail::ExtremumAccumulator<std::greater<double>>;
+
+  static double result(const Accumulator& acc)
+  {
+    return acc.count == 0 ? std::numeric_limits<double>::quiet_NaN() : acc.value;
+  }
+};
+
+namespace detail
+{
+
+/**
+ * Accumulator of the count, compensated sum, variance, minimum and maximum
+ * of a stream of values.
+ */
+struct DescribeAccumulator
+{
+  KahanAccumulator sum;
+  WelfordAccumulator moments;
+  ExtremumAccumulator<std::less<double>> min;
+  ExtremumAccumulator<std::greater<double>> max;
+
+  void push(double v)
+  {
+    sum.push(v);
+    moments.push(v);
+    min.push(v);
+    max.push(v);
+  }
+
+  void merge(const DescribeAccumulator& other)
+  {
+    sum.merge(other.sum);
+    moments.merge(other.moments);
+    min.merge(other.min);
+    max.merge(other.max);
+  }
+};
+
+/**
+ * Store the count and the statistics (sum, mean, var, min, max) of the i-th
+ * reduced row or column.
+ */
+template<typename C, typename O>
+inline void storeDescription(size_t i, const DescribeAccumulator& acc, C& count, O& stats)
+{
+  using count_type = typename std::decay_t<C>::value_type;
+  using stats_type = typename std::decay_t<O>::value_type;
+
+  count(i) = static_cast<count_type>(acc.sum.count);
+  stats(0, i) = static_cast<stats_type>(NansumPolicy::result(acc.sum));
+  stats(1, i) = static_cast<stats_type>(NanmeanPolicy::result(acc.sum));
+  stats(2, i) = static_cast<stats_type>(NanvarPolicy::result(acc.moments));
+  stats(3, i) = static_cast<stats_type>(NanminPolicy::result(acc.min));
+  stats(4, i) = static_cast<stats_type>(NanmaxPolicy::result(acc.max));
+}
+
+} // detail
+
+/**
+ * @brief Compute the histogram and statistics of an array, ignoring nan.
+ *
+ * @param src: data. shape = (n,)
+ * @param lb: lower boundary of the histogram.
+ * @param ub: upper boundary of the histogram.
+ * @param n_bins: number of bins.
+ *
+ * @return: (histogram, lower outer edge, upper outer edge, mean, median, std).
+ *    mean, median and std are nan if there is no valid value.
+ */
+template<typename E, EnableIf<std::decay_t<E>, IsVector> = false>
+inline auto nanhistWithStats(E&& src, double lb, double ub, size_t n_bins)
+{
+  // split the array into rows which can be processed in parallel and pad
+  // the last row with nan
+  constexpr size_t n_cols = 4096;
+  size_t n = src.size();
+  return detail::nanhistWithStatsImp(
+    [&src, n] (size_t r, size_t c)
+    {
+      size_t i = r * n_cols + c;
+      return i < n ? static_cast<double>(src(i)) : std::numeric_limits<double>::quiet_NaN();
+    },
+    (n + n_cols - 1) / n_cols, n_cols, lb, ub, n_bins);
+}
+
+/**
+ * @brief Compute the histogram and statistics of an image, ignoring nan.
+ *
+ * Only the values within [lb, ub] are taken into account. The histogram,
+ * count, mean and standard deviation are computed in a single pass over the
+ * data. The median is then selected by refining the histogram around the
+ * middle rank(s) with a fixed number of sub-bins, which takes one or more
+ * further passes depending on the distribution of the data but bounded
+ * memory. The input is never copied.
+ *
+ * If lb or ub is infinite, the corresponding outer edge of the histogram is
+ * determined from the data in the same way as numpy.histogram, which requires
+ * an extra pass.
+ *
+ * @param src: image data. shape = (y, x)
+ * @param lb: lower boundary of the histogram.
+ * @param ub: upper boundary of the histogram.
+ * @param n_bins: number of bins.
+ *
+ * @return: (histogram, lower outer edge, upper outer edge, mean, median, std).
+ *    mean, median and std are nan if there is no valid value.
+ */
+template<typename E, EnableIf<std::decay_t<E>, IsImage> = false>
+inline auto nanhistWithStats(E&& src, double lb, double ub, size_t n_bins)
+{
+  auto shape = src.shape();
+  return detail::nanhistWithStatsImp(
+    [&src] (size_t r, size_t c) { return static_cast<double>(src(r, c)); },
+    shape[0], shape[1], lb, ub, n_bins);
+}
+
+/**
+ * @brief Compute the histogram and statistics of an array of images, ignoring nan.
+ *
+ * @param src: image data. shape = (indices, y, x)
+ * @param lb: lower boundary of the histogram.
+ * @param ub: upper boundary of the histogram.
+ * @param n_bins: number of bins.
+ *
+ * @return: (histogram, lower outer edge, upper outer edge, mean, median, std).
+ *    mean, median and std are nan if there is no valid value.
+ */
+template<typename E, EnableIf<std::decay_t<E>, IsImageArray> = false>
+inline auto nanhistWithStats(E&& src, double lb, double ub, size_t n_bins)
+{
+  auto shape = src.shape();
+  size_t h = shape[1];
+  return detail::nanhistWithStatsImp(
+    [&src, h] (size_t r, size_t c) { return static_cast<double>(src(r / h, r % h, c)); },
+    shape[0] * shape[1], shape[2], lb, ub, n_bins);
+}
+
+/**
+ * @brief Compute the histogram of an array.
+ *
+ * The histogram is filled in parallel with thread-local bins. nan and values
+ * outside [left, right] are ignored. Values are assigned to bins in the same
+ * way as numpy.histogram.
+ *
+ * @param src: data. shape = (n,)
+ * @param left: lower edge of the bins.
+ * @param right: upper edge of the bins.
+ * @param n_bins: number of bins.
+ *
+ * @return: the histogram. shape = (n_bins,)
+ */
+template<typename E, EnableIf<std::decay_t<E>, IsVector> = false>
+inline auto histogram1d(E&& src, double left, double right, size_t n_bins)
+{
+  detail::UniformBins bins(left, right, n_bins);
+  return detail::toTensor(detail::histogramImp<long long>(
+    src.size(), [&src] (size_t i) { return src(i); }, [] (size_t) { return 1; }, bins));
+}
+
+/**
+ * @brief Compute the weighted histogram of an array.
+ *
+ * @param src: data. shape = (n,)
+ * @param weights: weight of each value. shape = (n,)
+ * @param left: lower edge of the bins.
+ * @param right: upper edge of the bins.
+ * @param n_bins: number of bins.
+ *
+ * @return: the sum of weights in each bin. shape = (n_bins,)
+ */
+template<typename E, typename W,
+  EnableIf<std::decay_t<E>, IsVector> = false, EnableIf<std::decay_t<W>, IsVector> = false>
+inline auto histogram1d(E&& src, W&& weights, double left, double right, size_t n_bins)
+{
+  utils::checkShape(src.shape(), weights.shape(), "Data and weights have different shapes");
+
+  detail::UniformBins bins(left, right, n_bins);
+  return detail::toTensor(detail::histogramImp<double>(
+    src.size(), [&src] (size_t i) { return src(i); }, [&weights] (size_t i) { return weights(i); }, bins));
+}
+
+/**
+ * @brief Compute the histogram of each row of a 2D array.
+ *
+ * For example, the pixel-value histograms of all the pulses in a train can be
+ * computed in one call with an array of shape (pulses, y * x).
+ *
+ * @param src: data. shape = (rows, n)
+ * @param left: lower edge of the bins.
+ * @param right: upper edge of the bins.
+ * @param n_bins: number of bins.
+ *
+ * @return: the histograms. shape = (rows, n_bins)
+ */
+template<typename E, EnableIf<std::decay_t<E>, IsImage> = false>
+inline auto histogram1d(E&& src, double left, double right, size_t n_bins)
+{
+  return detail::histogramRowsImp<long long>(
+    std::forward<E>(src), [] (size_t, size_t) { return 1; }, left, right, n_bins);
+}
+
+/**
+ * @brief Compute the weighted histogram of each row of a 2D array.
+ *
+ * @param src: data. shape = (rows, n)
+ * @param weights: weight of each value. shape = (rows, n)
+ * @param left: lower edge of the bins.
+ * @param right: upper edge of the bins.
+ * @param n_bins: number of bins.
+ *
+ * @return: the sums of weights in each bin. shape = (rows, n_bins)
+ */
+template<typename E, typename W,
+  EnableIf<std::decay_t<E>, IsImage> = false, EnableIf<std::decay_t<W>, IsImage> = false>
+inline auto histogram1d(E&& src, W&& weights, double left, double right, size_t n_bins)
+{
+  utils::checkShape(src.shape(), weights.shape(), "Data and weights have different shapes");
+
+  return detail::histogramRowsImp<double>(
+    std::forward<E>(src), [&weights] (size_t i, size_t j) { return weights(i, j); }, left, right, n_bins);
+}
+
+/**
+ * @brief Compute the 2D histogram of two arrays.
+ *
+ * nan and value pairs outside the bins are ignored.
+ *
+ * @param x: data along the first dimension. shape = (n,)
+ * @param y: data along the second dimension. shape = (n,)
+ * @param x_left: lower edge of the bins along the first dimension.
+ * @param x_right: upper edge of the bins along the first dimension.
+ * @param x_bins: number of bins along the first dimension.
+ * @param y_left: lower edge of the bins along the second dimension.
+ * @param y_right: upper edge of the bins along the second dimension.
+ * @param y_bins: number of bins along the second dimension.
+ *
+ * @return: the histogram. shape = (x_bins, y_bins)
+ */
+template<typename E, EnableIf<std::decay_t<E>, IsVector> = false>
+inline auto histogram2d(E&& x, E&& y,
+                        double x_left, double x_right, size_t x_bins,
+                        double y_left, double y_right, size_t y_bins)
+{
+  utils::checkShape(x.shape(), y.shape(), "x and y have different shapes");
+
+  detail::UniformBins bx(x_left, x_right, x_bins);
+  detail::UniformBins by(y_left, y_right, y_bins);
+  auto hist = detail::histogram2dImp<long long>(
+    x.size(), [&x, &y] (size_t i) { return std::make_pair(x(i), y(i)); }, [] (size_t) { return 1; }, bx, by);
+
+  xt::xtensor<long long, 2> ret = xt::empty<long long>({x_bins, y_bins});
+  std::copy(hist.begin(), hist.end(), ret.begin());
+  return ret;
+}
+
+/**
+ * @brief Compute the weighted 2D histogram of two arrays.
+ *
+ * @param x: data along the first dimension. shape = (n,)
+ * @param y: data along the second dimension. shape = (n,)
+ * @param weights: weight of each value pair. shape = (n,)
+ * @param x_left: lower edge of the bins along the first dimension.
+ * @param x_right: upper edge of the bins along the first dimension.
+ * @param x_bins: number of bins along the first dimension.
+ * @param y_left: lower edge of the bins along the second dimension.
+ * @param y_right: upper edge of the bins along the second dimension.
+ * @param y_bins: number of bins along the second dimension.
+ *
+ * @return: the sum of weights in each bin. shape = (x_bins, y_bins)
+ */
+template<typename E, typename W,
+  EnableIf<std::decay_t<E>, IsVector> = false, EnableIf<std::decay_t<W>, IsVector> = false>
+inline auto histogram2d(E&& x, E&& y, W&& weights,
+                        double x_left, double x_right, size_t x_bins,
+                        double y_left, double y_right, size_t y_bins)
+{
+  utils::checkShape(x.shape(), y.shape(), "x and y have different shapes");
+  utils::checkShape(x.shape(), weights.shape(), "Data and weights have different shapes");
+
+  detail::UniformBins bx(x_left, x_right, x_bins);
+  detail::UniformBins by(y_left, y_right, y_bins);
+  auto hist = detail::histogram2dImp<double>(
+    x.size(), [&x, &y] (size_t i) { return std::make_pair(x(i), y(i)); },
+    [&weights] (size_t i) { return weights(i); }, bx, by);
+
+  xt::xtensor<double, 2> ret = xt::empty<double>({x_bins, y_bins});
+  std::copy(hist.begin(), hist.end(), ret.begin());
+  return ret;
+}
+
+/**
+ * @brief Reduce an array with a reducer policy, ignoring nan.
+ *
+ * The reduction is carried out in parallel and in double precision.
+ *
+ * @tparam Policy: reducer policy, e.g. NansumPolicy, NanmeanPolicy.
+ *
+ * @param src: data. shape = (n,)
+ *
+ * @return: the reduced value. The result of an all-nan array is 0 for
+ *    NansumPolicy and nan otherwise.
+ */
+template<typename Policy, typename E, EnableIf<std::decay_t<E>, IsVector> = false>
+inline auto nanreduce(E&& src)
+{
+  using value_type = typename std::decay_t<E>::value_type;
+  return static_cast<value_type>(Policy::result(detail::nanreduceImp<typename Policy::Accumulator>(
+    src.size(), [&src] (size_t i) { return src(i); })));
+}
+
+/**
+ * @brief Reduce a 2D array along the first axis with a reducer policy, ignoring nan.
+ *
+ * An array can be reduced over any number of its leading axes without copying
+ * by viewing it as a 2D array, e.g. (pulses, y, x) -> (pulses, y * x).
+ *
+ * @tparam Policy: reducer policy, e.g. NansumPolicy, NanmeanPolicy.
+ *
+ * @param src: data. shape = (rows, cols)
+ * @param out: array to store the result. shape = (cols,)
+ */
+template<typename Policy, typename E, typename O,
+  EnableIf<std::decay_t<E>, IsImage> = false, EnableIf<std::decay_t<O>, IsVector> = false>
+inline void nanreduceAxis0(E&& src, O& out)
+{
+  utils::checkShape(src.shape(), out.shape(), "Inconsistent data and output shapes", 1, 0);
+
+  using out_type = typename std::decay_t<O>::value_type;
+  detail::nanreduceAxis0Imp<typename Policy::Accumulator>(std::forward<E>(src),
+    [&out] (size_t i, const auto& acc) { out(i) = static_cast<out_type>(Policy::result(acc)); });
+}
+
+/**
+ * @brief Reduce a 2D array along the second axis with a reducer policy, ignoring nan.
+ *
+ * An array can be reduced over any number of its trailing axes without copying
+ * by viewing it as a 2D array, e.g. (pulses, y, x) -> (pulses, y * x).
+ *
+ * @tparam Policy: reducer policy, e.g. NansumPolicy, NanmeanPolicy.
+ *
+ * @param src: data. shape = (rows, cols)
+ * @param out: array to store the result. shape = (rows,)
+ */
+template<typename Policy, typename E, typename O,
+  EnableIf<std::decay_t<E>, IsImage> = false, EnableIf<std::decay_t<O>, IsVector> = false>
+inline void nanreduceAxis1(E&& src, O& out)
+{
+  FOAM_ASSERT_ARGUMENT(src.shape()[0] == out.shape()[0], "Inconsistent data and output shapes")
+
+  using out_type = typename std::decay_t<O>::value_type;
+  detail::nanreduceAxis1Imp<typename Policy::Accumulator>(std::forward<E>(src),
+    [&out] (size_t i, const auto& acc) { out(i) = static_cast<out_type>(Policy::result(acc)); });
+}
+
+/**
+ * @brief Reduce a 2D array with a reducer policy, ignoring nan, masked columns
+ *    and columns with zero weights.
+ *
+ * An array of images can be reduced by viewing it as a 2D array, e.g.
+ * (pulses, y, x) -> (pulses, y * x), with the mask and the weights of the
+ * pixels being broadcast over the pulses.
+ *
+ * @tparam Policy: reducer policy, i.e. NansumPolicy, NanmeanPolicy,
+ *    NanvarPolicy or NanstdPolicy.
+ *
+ * @param src: data. shape = (rows, cols)
+ * @param mask: columns being true are excluded. shape = (cols,)
+ * @param weights: weight of each column. shape = (cols,)
+ *
+ * @return: the reduced value.
+ */
+template<typename Policy, typename E, typename M, typename W,
+  EnableIf<std::decay_t<E>, IsImage> = false,
+  EnableIf<std::decay_t<M>, IsVector> = false, EnableIf<std::decay_t<W>, IsVector> = false>
+inline auto nanreduce(E&& src, const M& mask, const W& weights)
+{
+  utils::checkShape(src.shape(), mask.shape(), "Inconsistent data and mask shapes", 1, 0);
+  utils::checkShape(src.shape(), weights.shape(), "Inconsistent data and weights shapes", 1, 0);
+
+  using value_type = typename std::decay_t<E>::value_type;
+  using Accumulator = typename Policy::Accumulator;
+
+  // the columns are reduced in parallel and then merged in order
+  std::vector<Accumulator> accs(src.shape()[1]);
+  detail::nanreduceAxis0Imp<Accumulator>(std::forward<E>(src),
+    [&accs] (size_t j, const Accumulator& acc) { accs[j] = acc; },
+    detail::PushMaskedWeighted<M, W>{mask, weights});
+
+  Accumulator acc;
+  for (const auto& col : accs) acc.merge(col);
+  return static_cast<value_type>(Policy::result(acc));
+}
+
+/**
+ * @brief Reduce a 2D array along the first axis with a reducer policy,
+ *    ignoring nan, masked columns and columns with zero weights.
+ *
+ * @tparam Policy: reducer policy, i.e. NansumPolicy, NanmeanPolicy,
+ *    NanvarPolicy or NanstdPolicy.
+ *
+ * @param src: data. shape = (rows, cols)
+ * @param mask: columns being true are excluded. shape = (cols,)
+ * @param weights: weight of each column. shape = (cols,)
+ * @param out: array to store the result. shape = (cols,)
+ */
+template<typename Policy, typename E, typename M, typename W, typename O,
+  EnableIf<std::decay_t<E>, IsImage> = false, EnableIf<std::decay_t<M>, IsVector> = false,
+  EnableIf<std::decay_t<W>, IsVector> = false, EnableIf<std::decay_t<O>, IsVector> = false>
+inline void nanreduceAxis0(E&& src, const M& mask, const W& weights, O& out)
+{
+  utils::checkShape(src.shape(), out.shape(), "Inconsistent data and output shapes", 1, 0);
+  utils::checkShape(src.shape(), mask.shape(), "Inconsistent data and mask shapes", 1, 0);
+  utils::checkShape(src.shape(), weights.shape(), "Inconsistent data and weights shapes", 1, 0);
+
+  using out_type = typename std::decay_t<O>::value_type;
+  detail::nanreduceAxis0Imp<typename Policy::Accumulator>(std::forward<E>(src),
+    [&out] (size_t i, const auto& acc) { out(i) = static_cast<out_type>(Policy::result(acc)); },
+    detail::PushMaskedWeighted<M, W>{mask, weights});
+}
+
+/**
+ * @brief Reduce a 2D array along the second axis with a reducer policy,
+ *    ignoring nan, masked columns and columns with zero weights.
+ *
+ * @tparam Policy: reducer policy, i.e. NansumPolicy, NanmeanPolicy,
+ *    NanvarPolicy or NanstdPolicy.
+ *
+ * @param src: data. shape = (rows, cols)
+ * @param mask: columns being true are excluded. shape = (cols,)
+ * @param weights: weight of each column. shape = (cols,)
+ * @param out: array to store the result. shape = (rows,)
+ */
+template<typename Policy, typename E, typename M, typename W, typename O,
+  EnableIf<std::decay_t<E>, IsImage> = false, EnableIf<std::decay_t<M>, IsVector> = false,
+  EnableIf<std::decay_t<W>, IsVector> = false, EnableIf<std::decay_t<O>, IsVector> = false>
+inline void nanreduceAxis1(E&& src, const M& mask, const W& weights, O& out)
+{
+  FOAM_ASSERT_ARGUMENT(src.shape()[0] == out.shape()[0], "Inconsistent data and output shapes")
+  utils::checkShape(src.shape(), mask.shape(), "Inconsistent data and mask shapes", 1, 0);
+  utils::checkShape(src.shape(), weights.shape(), "Inconsistent data and weights shapes", 1, 0);
+
+  using out_type = typename std::decay_t<O>::value_type;
+  detail::nanreduceAxis1Imp<typename Policy::Accumulator>(std::forward<E>(src),
+    [&out] (size_t i, const auto& acc) { out(i) = static_cast<out_type>(Policy::result(acc)); },
+    detail::PushMaskedWeighted<M, W>{mask, weights});
+}
+
+/**
+ * @brief Compute the count, sum, mean, variance, minimum and maximum of an
+ *    array in a single pass, ignoring nan.
+ *
+ * @param src: data. shape = (n,)
+ *
+ * @return: (count, sum, mean, var, min, max). The sum of an all-nan array
+ *    is 0 and the other statistics are nan.
+ */
+template<typename E, EnableIf<std::decay_t<E>, IsVector> = false>
+inline auto nanDescribe(E&& src)
+{
+  using value_type = typename std::decay_t<E>::value_type;
+  auto acc = detail::nanreduceImp<detail::DescribeAccumulator>(
+    src.size(), [&src] (size_t i) { return src(i); });
+
+  return std::make_tuple(acc.sum.count,
+                         static_cast<value_type>(NansumPolicy::result(acc.sum)),
+                         static_cast<value_type>(NanmeanPolicy::result(acc.sum)),
+                         static_cast<value_type>(NanvarPolicy::result(acc.moments)),
+                         static_cast<value_type>(NanminPolicy::result(acc.min)),
+                         static_cast<value_type>(NanmaxPolicy::result(acc.max)));
+}
+
+/**
+ * @brief Compute the count, sum, mean, variance, minimum and maximum of a 2D
+ *    array along the first axis in a single pass, ignoring nan.
+ *
+ * @param src: data. shape = (rows, cols)
+ * @param count: array to store the count of valid values. shape = (cols,)
+ * @param stats: array to store the sum, mean, var, min and max. shape = (5, cols)
+ */
+template<typename E, typename C, typename O,
+  EnableIf<std::decay_t<E>, IsImage> = false, EnableIf<std::decay_t<C>, IsVector> = false,
+  EnableIf<std::decay_t<O>, IsImage> = false>
+inline void nanDescribeAxis0(E&& src, C& count, O& stats)
+{
+  utils::checkShape(src.shape(), count.shape(), "Inconsistent data and count shapes", 1, 0);
+  utils::checkShape(src.shape(), stats.shape(), "Inconsistent data and statistics shapes", 1, 1);
+  FOAM_ASSERT_ARGUMENT(stats.shape()[0] == 5, "Statistics must have the shape (5, cols)")
+
+  detail::nanreduceAxis0Imp<detail::DescribeAccumulator>(std::forward<E>(src),
+    [&count, &stats] (size_t i, const auto& acc) { detail::storeDescription(i, acc, count, stats); });
+}
+
+/**
+ * @brief Compute the count, sum, mean, variance, minimum and maximum of a 2D
+ *    array along the second axis in a single pass, ignoring nan.
+ *
+ * @param src: data. shape = (rows, cols)
+ * @param count: array to store the count of valid values. shape = (rows,)
+ * @param stats: array to store the sum, mean, var, min and max. shape = (5, rows)
+ */
+template<typename E, typename C, typename O,
+  EnableIf<std::decay_t<E>, IsImage> = false, EnableIf<std::decay_t<C>, IsVector> = false,
+  EnableIf<std::decay_t<O>, IsImage> = false>
+inline void nanDescribeAxis1(E&& src, C& count, O& stats)
+{
+  FOAM_ASSERT_ARGUMENT(src.shape()[0] == count.shape()[0], "Inconsistent data and count shapes")
+  FOAM_ASSERT_ARGUMENT(stats.shape()[0] == 5 && stats.shape()[1] == src.shape()[0],
+                       "Statistics must have the shape (5, rows)")
+
+  detail::nanreduceAxis1Imp<detail::DescribeAccumulator>(std::forward<E>(src),
+    [&count, &stats] (size_t i, const auto& acc) { detail::storeDescription(i, acc, count, stats); });
+}
+
+/**
+ * @brief Estimate the min/max values of an image by down-sampling, ignoring nan.
+ *
+ * The longest axis is halved repeatedly until there are no more than max_size
+ * elements left, which are accessed with strides without copying the image.
+ *
+ * @param src: image data. shape = (y, x)
+ * @param q: quantile when calculating the min/max, which must be within [0, 1].
+ *    The max is the max(q, 1 - q) quantile and the min is the min(q, 1 - q)
+ *    quantile of the down-sampled data using the 'nearest' method.
+ * @param max_size: maximum number of elements after down-sampling.
+ *
+ * @return: (min, max). Both are nan if there is no valid value.
+ */
+template<typename E, EnableIf<std::decay_t<E>, IsImage> = false>
+inline auto quickMinMax(E&& src, double q = 1., size_t max_size = 100000)
+{
+  FOAM_ASSERT_ARGUMENT(q >= 0. && q <= 1., "Quantile must be within [0, 1]")
+
+  auto shape = src.shape();
+  auto steps = detail::downsampleSteps(shape, max_size);
+
+  std::vector<double> values;
+  for (size_t i = 0; i < shape[0]; i += steps[0])
+  {
+    for (size_t j = 0; j < shape[1]; j += steps[1])
+    {
+      auto v = src(i, j);
+      if (!std::isnan(v)) values.push_back(static_cast<double>(v));
+    }
+  }
+
+  return detail::nearestQuantiles(values, q < 0.5 ? 1. - q : q);
+}
+
+/**
+ * @brief Estimate the min/max values of an array of images by down-sampling, ignoring nan.
+ *
+ * @param src: image data. shape = (indices, y, x)
+ * @param q: quantile when calculating the min/max, which must be within [0, 1].
+ * @param max_size: maximum number of elements after down-sampling.
+ *
+ * @return: (min, max). Both are nan if there is no valid value.
+ */
+template<typename E, EnableIf<std::decay_t<E>, IsImageArray> = false>
+inline auto quickMinMax(E&& src, double q = 1., size_t max_size = 100000)
+{
+  FOAM_ASSERT_ARGUMENT(q >= 0. && q <= 1., "Quantile must be within [0, 1]")
+
+  auto shape = src.shape();
+  auto steps = detail::downsampleSteps(shape, max_size);
+
+  std::vector<double> values;
+  for (size_t k = 0; k < shape[0]; k += steps[0])
+  {
+    for (size_t i = 0; i < shape[1]; i += steps[1])
+    {
+      for (size_t j = 0; j < shape[2]; j += steps[2])
+      {
+        auto v = src(k, i, j);
+        if (!std::isnan(v)) values.push_back(static_cast<double>(v));
+      }
+    }
+  }
+
+  return detail::nearestQuantiles(values, q < 0.5 ? 1. - q : q);
+}
+
+/**
+ * @class KllSketch
+ * @brief Mergeable streaming quantile sketch.
+ *
+ * Implementation of the KLL sketch (Karnin, Lang and Liberty, 2016). Values
+ * are kept in a hierarchy of compactors. When a compactor is full, it is
+ * sorted and every other value, starting from a random offset, is promoted to
+ * the next level with a doubled weight. The memory is bounded by O(k log(n / k))
+ * and the amortized update cost is O(log k), independent of the number of
+ * values seen.
+ *
+ * The rank error of a quantile is roughly 1.7 / k with high probability.
+ * The minimum and the maximum are tracked exactly.
+ */
+class KllSketch
+{
+public:
+
+  /**
+   * Internal state for serialization.
+   */
+  struct State
+  {
+    size_t count;
+    double min;
+    double max;
+    std::vector<std::vector<double>> compactors;
+    std::string rng; // textual state of the random number generator
+  };
+
+private:
+
+  size_t k_;
+  std::vector<std::vector<double>> compactors_;
+
+  size_t count_ = 0; // number of values seen
+  size_t size_ = 0; // number of retained values
+  size_t max_size_ = 0;
+
+  double min_ = std::numeric_limits<double>::quiet_NaN();
+  double max_ = std::numeric_limits<double>::quiet_NaN();
+
+  std::mt19937 rng_;
+
+  size_t capacity(size_t h) const;
+
+  void grow();
+
+  void compress();
+
+  /**
+   * Return the retained values and their weights sorted by value.
+   */
+  std::vector<std::pair<double, size_t>> weightedValues() const;
+
+public:
+
+  /**
+   * Constructor.
+   *
+   * @param k: parameter which controls the accuracy and the memory usage.
+   * @param seed: seed of the random number generator.
+   */
+  explicit KllSketch(size_t k = 200, unsigned int seed = 0);
+
+  ~KllSketch() = default;
+
+  /**
+   * Add a value. nan is ignored.
+   */
+  void update(double v);
+
+  /**
+   * Add an array of values. nan is ignored.
+   *
+   * @param src: data. shape = (n,)
+   */
+  template<typename E, EnableIf<std::decay_t<E>, IsVector> = false>
+  void update(E&& src);
+
+  /**
+   * Merge another sketch with the same k.
+   */
+  void merge(const KllSketch& other);
+
+  /**
+   * Return the approximate q-th quantile, or nan if there is no value.
+   *
+   * @param q: quantile, which must be within [0, 1].
+   */
+  double quantile(double q) const;
+
+  /**
+   * Return the approximate quantiles, or nan if there is no value.
+   *
+   * @param qs: quantiles, which must be within [0, 1].
+   */
+  std::vector<double> quantiles(const std::vector<double>& qs) const;
+
+  /**
+   * Return the approximate fraction of values which are not larger than v.
+   */
+  double cdf(double v) const;
+
+  /**
+   * Reset the sketch.
+   */
+  void reset();
+
+  size_t k() const { return k_; }
+
+  size_t count() const { return count_; }
+
+  /**
+   * Return the number of retained values.
+   */
+  size_t size() const { return size_; }
+
+  double min() const { return min_; }
+
+  double max() const { return max_; }
+
+  /**
+   * Return the internal state for serialization.
+   */
+  State state() const;
+
+  /**
+   * Restore the internal state returned by state() of a sketch with the same k.
+   */
+  void setState(State state);
+};
+
+inline KllSketch::KllSketch(size_t k, unsigned int seed) : k_(k), rng_(seed)
+{
+  FOAM_ASSERT_ARGUMENT(k >= 2, "k must be at least 2")
+  grow();
+}
+
+inline size_t KllSketch::capacity(size_t h) const
+{
+  // lower compactors have geometrically decreasing capacities
+  auto depth = static_cast<double>(compactors_.size() - h - 1);
+  return static_cast<size_t>(std::ceil(std::pow(2. / 3., depth) * static_cast<double>(k_))) + 1;
+}
+
+inline void KllSketch::grow()
+{
+  compactors_.emplace_back();
+  max_size_ = 0;
+  for (size_t h = 0; h < compactors_.size(); ++h) max_size_ += capacity(h);
+}
+
+inline void KllSketch::compress()
+{
+  for (size_t h = 0; h < compactors_.size(); ++h)
+  {
+    if (compactors_[h].size() < capacity(h)) continue;
+
+    if (h + 1 == compactors_.size()) grow();
+
+    auto& src = compactors_[h];
+    auto& dst = compactors_[h + 1];
+    std::sort(src.begin(), src.end());
+
+    // keep the smallest value at this level if the size is odd
+    size_t n_pairs = src.size() / 2;
+    size_t first = src.size() - 2 * n_pairs;
+    size_t offset = std::uniform_int_distribution<size_t>(0, 1)(rng_);
+    for (size_t i = 0; i < n_pairs; ++i) dst.push_back(src[first + 2 * i + offset]);
+
+    src.erase(src.begin() + first, src.end());
+    size_ -= n_pairs;
+
+    if (size_ < max_size_) break;
+  }
+}
+
+inline void KllSketch::update(double v)
+{
+  if (std::isnan(v)) return;
+
+  if (count_ == 0 || v < min_) min_ = v;
+  if (count_ == 0 || v > max_) max_ = v;
+  ++count_;
+
+  compactors_[0].push_back(v);
+  ++size_;
+  if (size_ >= max_size_) compress();
+}
+
+template<typename E, EnableIf<std::decay_t<E>, IsVector>>
+inline void KllSketch::update(E&& src)
+{
+  for (size_t i = 0; i < src.size(); ++i) update(static_cast<double>(src(i)));
+}
+
+inline void KllSketch::merge(const KllSketch& other)
+{
+  FOAM_ASSERT_ARGUMENT(k_ == other.k_, "Sketches with different k cannot be merged")
+
+  if (other.count_ == 0) return;
+
+  while (compactors_.size() < other.compactors_.size()) grow();
+  for (size_t h = 0; h < other.compactors_.size(); ++h)
+  {
+    auto& dst = compactors_[h];
+    dst.insert(dst.end(), other.compactors_[h].begin(), other.compactors_[h].end());
+  }
+  size_ += other.size_;
+
+  if (count_ == 0 || other.min_ < min_) min_ = other.min_;
+  if (count_ == 0 || other.max_ > max_) max_ = other.max_;
+  count_ += other.count_;
+
+  while (size_ >= max_size_) compress();
+}
+
+inline std::vector<std::pair<double, size_t>> KllSketch::weightedValues() const
+{
+  std::vector<std::pair<double, size_t>> ret;
+  ret.reserve(size_);
+  for (size_t h = 0; h < compactors_.size(); ++h)
+  {
+    for (auto v : compactors_[h]) ret.emplace_back(v, size_t(1) << h);
+  }
+  std::sort(ret.begin(), ret.end());
+  return ret;
+}
+
+inline std::vector<double> KllSketch::quantiles(const std::vector<double>& qs) const
+{
+  for (auto q : qs) FOAM_ASSERT_ARGUMENT(q >= 0. && q <= 1., "Quantile must be within [0, 1]")
+
+  std::vector<double> ret(qs.size(), std::numeric_limits<double>::quiet_NaN());
+  if (count_ == 0) return ret;
+
+  auto values = weightedValues();
+  std::vector<size_t> cum_weights(values.size());
+  size_t total = 0;
+  for (size_t i = 0; i < values.size(); ++i)
+  {
+    total += values[i].second;
+    cum_weights[i] = total;
+  }
+
+  for (size_t i = 0; i < qs.size(); ++i)
+  {
+    double q = qs[i];
+    if (q == 0.)
+    {
+      ret[i] = min_;
+    } else if (q == 1.)
+    {
+      ret[i] = max_;
+    } else
+    {
+      auto target = static_cast<size_t>(std::ceil(q * static_cast<double>(total)));
+      auto it = std::lower_bound(cum_weights.begin(), cum_weights.end(), target);
+      ret[i] = values[it - cum_weights.begin()].first;
+    }
+  }
+  return ret;
+}
+
+inline double KllSketch::quantile(double q) const
+{
+  return quantiles({q})[0];
+}
+
+inline double KllSketch::cdf(double v) const
+{
+  if (count_ == 0) return std::numeric_limits<double>::quiet_NaN();
+
+  size_t rank = 0;
+  for (size_t h = 0; h < compactors_.size(); ++h)
+  {
+    for (auto x : compactors_[h])
+    {
+      if (x <= v) rank += size_t(1) << h;
+    }
+  }
+  return static_cast<double>(rank) / static_cast<double>(count_);
+}
+
+inline KllSketch::State KllSketch::state() const
+{
+  std::ostringstream rng;
+  rng << rng_;
+  return State { count_, min_, max_, compactors_, rng.str() };
+}
+
+inline void KllSketch::setState(State state)
+{
+  FOAM_ASSERT_ARGUMENT(!state.compactors.empty(), "Sketch must have at least one compactor")
+  // the total weight of the retained values is the number of values seen
+  size_t total = 0;
+  for (size_t h = 0; h < state.compactors.size(); ++h) total += state.compactors[h].size() << h;
+  FOAM_ASSERT_ARGUMENT(total == state.count, "Inconsistent weights of the retained values")
+
+  std::mt19937 rng;
+  std::istringstream rng_state(state.rng);
+  rng_state >> rng;
+  FOAM_ASSERT_ARGUMENT(!rng_state.fail(), "Invalid state of the random number generator")
+
+  rng_ = rng;
+  count_ = state.count;
+  min_ = state.min;
+  max_ = state.max;
+  compactors_.clear();
+  size_ = 0;
+  for (auto& values : state.compactors)
+  {
+    size_ += values.size();
+    compactors_.push_back(std::move(values));
+  }
+  max_size_ = 0;
+  for (size_t h = 0; h < compactors_.size(); ++h) max_size_ += capacity(h);
+}
+
+inline void KllSketch::reset()
+{
+  compactors_.clear();
+  count_ = 0;
+  size_ = 0;
+  min_ = std::numeric_limits<double>::quiet_NaN();
+  max_ = std::numeric_limits<double>::quiet_NaN();
+  grow();
+}
+
+namespace detail
+{
+
+/**
+ * @class AccumulatorArray
+ * @brief Array of mergeable accumulators, one for each variable.
+ *
+ * It implements the bookkeeping shared by the online statistics. Acc must have
+ * a count, merge(const Acc&) and fields(), which ties the other members to be
+ * serialized.
+ */
+template<typename Derived, typename Acc>
+class AccumulatorArray
+{
+protected:
+
+  std::vector<Acc> stats_;
+
+  explicit AccumulatorArray(size_t size) : stats_(size) {}
+
+  /**
+   * Apply f to the accumulator of each variable. The result is nan for the
+   * variables without any sample.
+   */
+  template<typename F>
+  xt::xtensor<double, 1> collect(const F& f) const;
+
+public:
+
+  // number of rows of the state
+  static constexpr size_t n_states =
+    1 + std::tuple_size<decltype(std::declval<Acc&>().fields())>::value;
+
+  /**
+   * Merge the statistics of another instance of the same size.
+   */
+  void merge(const Derived& other);
+
+  /**
+   * Reset the statistics.
+   */
+  void reset();
+
+  size_t size() const { return stats_.size(); }
+
+  /**
+   * Return the number of valid samples of each variable.
+   */
+  xt::xtensor<size_t, 1> count() const;
+
+  /**
+   * Return the internal state for serialization.
+   *
+   * @return: (count, fields...) of each variable. shape = (n_states, size)
+   */
+  xt::xtensor<double, 2> state() const;
+
+  /**
+   * Restore the internal state returned by state().
+   */
+  template<typename E, EnableIf<std::decay_t<E>, IsImage> = false>
+  void setState(E&& state);
+};
+
+template<typename Derived, typename Acc>
+template<typename F>
+inline xt::xtensor<double, 1> AccumulatorArray<Derived, Acc>::collect(const F& f) const
+{
+  xt::xtensor<double, 1> ret = xt::empty<double>({stats_.size()});
+  for (size_t i = 0; i < stats_.size(); ++i)
+  {
+    ret(i) = stats_[i].count == 0 ? std::numeric_limits<double>::quiet_NaN() : f(stats_[i]);
+  }
+  return ret;
+}
+
+template<typename Derived, typename Acc>
+inline void AccumulatorArray<Derived, Acc>::merge(const Derived& other)
+{
+  const auto& other_stats = static_cast<const AccumulatorArray&>(other).stats_;
+  FOAM_ASSERT_ARGUMENT(other_stats.size() == stats_.size(), "Inconsistent number of variables")
+
+  for (size_t i = 0; i < stats_.size(); ++i) stats_[i].merge(other_stats[i]);
+}
+
+template<typename Derived, typename Acc>
+inline void AccumulatorArray<Derived, Acc>::reset()
+{
+  std::fill(stats_.begin(), stats_.end(), Acc());
+}
+
+template<typename Derived, typename Acc>
+inline xt::xtensor<size_t, 1> AccumulatorArray<Derived, Acc>::count() const
+{
+  xt::xtensor<size_t, 1> ret = xt::empty<size_t>({stats_.size()});
+  for (size_t i = 0; i < stats_.size(); ++i) ret(i) = stats_[i].count;
+  return ret;
+}
+
+template<typename Derived, typename Acc>
+inline xt::xtensor<double, 2> AccumulatorArray<Derived, Acc>::state() const
+{
+  xt::xtensor<double, 2> ret = xt::empty<double>({n_states, stats_.size()});
+  for (size_t i = 0; i < stats_.size(); ++i)
+  {
+    Acc acc = stats_[i];
+    ret(0, i) = static_cast<double>(acc.count);
+    size_t row = 1;
+    std::apply([&ret, &row, i] (auto&... v) { ((ret(row++, i) = v), ...); }, acc.fields());
+  }
+  return ret;
+}
+
+template<typename Derived, typename Acc>
+template<typename E, EnableIf<std::decay_t<E>, IsImage>>
+inline void AccumulatorArray<Derived, Acc>::setState(E&& state)
+{
+  FOAM_ASSERT_ARGUMENT(state.shape()[0] == n_states && state.shape()[1] == stats_.size(),
+                       "State must have the shape (" + std::to_string(n_states) + ", size)")
+
+  for (size_t i = 0; i < stats_.size(); ++i)
+  {
+    auto& acc = stats_[i];
+    acc.count = static_cast<size_t>(state(0, i));
+    size_t row = 1;
+    std::apply([&state, &row, i] (auto&... v) { ((v = state(row++, i)), ...); }, acc.fields());
+  }
+}
+
+} // detail
+
+/**
+ * @class RunningStats
+ * @brief Online statistics of an array of independent variables.
+ *
+ * The count, mean, variance (Welford), minimum and maximum of each variable
+ * are updated from batches of samples, ignoring nan. Instances can be merged
+ * exactly (Chan et al.), e.g. to combine the statistics accumulated by
+ * different workers. The state is (count, sum, mean, m2, min, max).
+ */
+class RunningStats : public detail::AccumulatorArray<RunningStats, detail::MomentsAccumulator>
+{
+public:
+
+  /**
+   * Constructor.
+   *
+   * @param size: number of variables.
+   */
+  explicit RunningStats(size_t size) : AccumulatorArray(size) {}
+
+  ~RunningStats() = default;
+
+  /**
+   * Accumulate a batch of samples in parallel.
+   *
+   * @param src: samples. shape = (samples, size)
+   */
+  template<typename E, EnableIf<std::decay_t<E>, IsImage> = false>
+  void update(E&& src);
+
+  /**
+   * Return the mean of each variable, or nan if there is no valid sample.
+   */
+  xt::xtensor<double, 1> mean() const;
+
+  /**
+   * Return the population variance of each variable, or nan if there is no valid sample.
+   */
+  xt::xtensor<double, 1> variance() const;
+
+  /**
+   * Return the minimum of each variable, or nan if there is no valid sample.
+   */
+  xt::xtensor<double, 1> min() const;
+
+  /**
+   * Return the maximum of each variable, or nan if there is no valid sample.
+   */
+  xt::xtensor<double, 1> max() const;
+};
+
+template<typename E, EnableIf<std::decay_t<E>, IsImage>>
+inline void RunningStats::update(E&& src)
+{
+  FOAM_ASSERT_ARGUMENT(src.shape()[1] == stats_.size(), "Inconsistent number of variables")
+
+  detail::nanreduceAxis0Imp<detail::MomentsAccumulator>(std::forward<E>(src),
+    [this] (size_t i, const auto& acc) { stats_[i].merge(acc); });
+}
+
+inline xt::xtensor<double, 1> RunningStats::mean() const
+{
+  return collect([] (const auto& acc) { return acc.mean; });
+}
+
+inline xt::xtensor<double, 1> RunningStats::variance() const
+{
+  return collect([] (const auto& acc) { return acc.variance(); });
+}
+
+inline xt::xtensor<double, 1> RunningStats::min() const
+{
+  return collect([] (const auto& acc) { return acc.min; });
+}
+
+inline xt::xtensor<double, 1> RunningStats::max() const
+{
+  return collect([] (const auto& acc) { return acc.max; });
+}
+
+namespace detail
+{
+
+/**
+ * Co-moments of a pair of variables (Welford), which can be merged exactly.
+ */
+struct CoMoments
+{
+  size_t count = 0;
+  double mean_x = 0.;
+  double mean_y = 0.;
+  double m2_x = 0.;
+  double m2_y = 0.;
+  double c_xy = 0.;
+
+  void push(double x, double y)
+  {
+    ++count;
+    auto n = static_cast<double>(count);
+    double dx = x - mean_x;
+    mean_x += dx / n;
+    double dy = y - mean_y;
+    mean_y += dy / n;
+    m2_x += dx * (x - mean_x);
+    m2_y += dy * (y - mean_y);
+    c_xy += dx * (y - mean_y);
+  }
+
+  void merge(const CoMoments& other)
+  {
+    if (other.count == 0) return;
+    if (count == 0)
+    {
+      *this = other;
+      return;
+    }
+
+    auto na = static_cast<double>(count);
+    auto nb = static_cast<double>(other.count);
+    double n = na + nb;
+    double dx = other.mean_x - mean_x;
+    double dy = other.mean_y - mean_y;
+    mean_x += dx * nb / n;
+    mean_y += dy * nb / n;
+    m2_x += other.m2_x + dx * dx * na * nb / n;
+    m2_y += other.m2_y + dy * dy * na * nb / n;
+    c_xy += other.c_xy + dx * dy * na * nb / n;
+    count += other.count;
+  }
+
+  /**
+   * Return the members other than count for serialization.
+   */
+  auto fields() { return std::tie(mean_x, mean_y, m2_x, m2_y, c_xy); }
+};
+
+} // detail
+
+/**
+ * @class PixelCorrelation
+ * @brief Online correlation between an array of variables and a reference.
+ *
+ * For example, the correlation between each pixel of the images and a
+ * per-pulse scalar such as the intensity monitor. The co-moments of each
+ * (variable, reference) pair are accumulated with Welford's algorithm in a
+ * single pass, ignoring pairs in which either value is nan. Instances can be
+ * merged exactly, e.g. to accumulate over trains. The state is
+ * (count, mean_x, mean_y, m2_x, m2_y, c_xy).
+ */
+class PixelCorrelation : public detail::AccumulatorArray<PixelCorrelation, detail::CoMoments>
+{
+public:
+
+  /**
+   * Constructor.
+   *
+   * @param size: number of variables, e.g. number of pixels.
+   */
+  explicit PixelCorrelation(size_t size) : AccumulatorArray(size) {}
+
+  ~PixelCorrelation() = default;
+
+  /**
+   * Accumulate a batch of samples in parallel.
+   *
+   * @param src: samples of the variables. shape = (samples, size)
+   * @param ref: samples of the reference. shape = (samples,)
+   */
+  template<typename E, typename V,
+    EnableIf<std::decay_t<E>, IsImage> = false, EnableIf<std::decay_t<V>, IsVector> = false>
+  void update(E&& src, V&& ref);
+
+  /**
+   * Return the population covariance between each variable and the reference.
+   */
+  xt::xtensor<double, 1> covariance() const;
+
+  /**
+   * Return the Pearson correlation coefficient between each variable and the
+   * reference. It is nan if either variance is zero.
+   */
+  xt::xtensor<double, 1> correlation() const;
+
+  /**
+   * Return the slope of the linear regression of each variable on the
+   * reference. It is nan if the variance of the reference is zero.
+   */
+  xt::xtensor<double, 1> slope() const;
+};
+
+template<typename E, typename V,
+  EnableIf<std::decay_t<E>, IsImage>, EnableIf<std::decay_t<V>, IsVector>>
+inline void PixelCorrelation::update(E&& src, V&& ref)
+{
+  auto shape = src.shape();
+  FOAM_ASSERT_ARGUMENT(shape[1] == stats_.size(), "Inconsistent number of variables")
+  FOAM_ASSERT_ARGUMENT(shape[0] == ref.size(), "Inconsistent numbers of samples")
+
+  auto updateColumns = [this, &src, &ref, &shape] (size_t first, size_t last)
+  {
+    for (size_t i = 0; i < shape[0]; ++i)
+    {
+      auto y = static_cast<double>(ref(i));
+      if (std::isnan(y)) continue;
+      for (size_t j = first; j < last; ++j)
+      {
+        auto x = src(i, j);
+        if (!std::isnan(x)) stats_[j].push(static_cast<double>(x), y);
+      }
+    }
+  };
+
+#if defined(FOAM_USE_TBB)
+  tbb::parallel_for(tbb::blocked_range<size_t>(0, shape[1], 64),
+    [&updateColumns] (const tbb::blocked_range<size_t> &block)
+    {
+      updateColumns(block.begin(), block.end());
+    }
+  );
+#else
+  updateColumns(0, shape[1]);
+#endif
+}
+
+inline xt::xtensor<double, 1> PixelCorrelation::covariance() const
+{
+  return collect([] (const auto& acc) { return acc.c_xy / static_cast<double>(acc.count); });
+}
+
+inline xt::xtensor<double, 1> PixelCorrelation::correlation() const
+{
+  return collect([] (const auto& acc)
+  {
+    double denominator = std::sqrt(acc.m2_x * acc.m2_y);
+    return denominator > 0. ? acc.c_xy / denominator : std::numeric_limits<double>::quiet_NaN();
+  });
+}
+
+inline xt::xtensor<double, 1> PixelCorrelation::slope() const
+{
+  return collect([] (const auto& acc)
+  {
+    return acc.m2_y > 0. ? acc.c_xy / acc.m2_y : std::numeric_limits<double>::quiet_NaN();
+  });
+}
+
 } // foam
 
 
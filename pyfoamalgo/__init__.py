@@ -6,6 +6,7 @@ The full license is in the file LICENSE, distributed with this software.
 Copyright (C) 2020, Jun Zhu. All rights reserved.
 """
 from .azimuthal_integration import *
+from .calibration import *
 from .computer_vision import *
 from .data_structures import *
 from .imageproc import *
@@ -17,6 +18,7 @@ from .statistics import *
 __all__ = []
 
 __all__ += azimuthal_integration.__all__
+__all__ += calibration.__all__
 __all__ += computer_vision.__all__
 __all__ += data_structures.__all__
 __all__ += imageproc.__all__
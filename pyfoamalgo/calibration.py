@@ -0,0 +1,219 @@
+"""
+Distributed under the terms of the GNU General Public License v3.0.
+
+The full license is in the file LICENSE, distributed with this software.
+
+Copyright (C) 2020, Jun Zhu. All rights reserved.
+"""
+import math
+import numpy as np
+
+from .config import __XFEL_IMAGE_DTYPE__ as IMAGE_DTYPE
+
+from pyfoamalgo.lib.calibration import DarkBuilder as _DarkBuilderCpp
+from pyfoamalgo.lib.calibration import correctMultiGainImageData
+from pyfoamalgo.lib.calibration import (
+    correctJungFrauCommonModeMedian, correctJungFrauCommonModeMean,
+    correctEPix100CommonModeMedian, correctEPix100CommonModeMean
+)
+
+__all__ = [
+    'DarkBuilder',
+    'correct_common_mode',
+    'correct_multi_gain_image_data',
+]
+
+_COMMON_MODE_CORRECTORS = {
+    ("JungFrau", "median"): correctJungFrauCommonModeMedian,
+    ("JungFrau", "mean"): correctJungFrauCommonModeMean,
+    ("ePix100", "median"): correctEPix100CommonModeMedian,
+    ("ePix100", "mean"): correctEPix100CommonModeMean,
+}
+
+
+class DarkBuilder:
+    """Build pulse-resolved offset and noise constants from dark runs.
+
+    Dark trains are streamed in one by one and the statistics of every
+    pixel in every memory cell are accumulated online, so that the whole
+    run is never held in memory.
+
+    Outliers are rejected by iterative sigma-clipping, which requires
+    streaming the run once more per iteration:
+
+    .. code-block:: python
+
+        builder = DarkBuilder(n_cells, h, w)
+        for i in range(n_iterations + 1):
+            if i > 0:
+                builder.next_pass(sigma=3)
+            for train in run:
+                builder.update(train)
+
+        offset, noise = builder.offset(), builder.noise()
+        mask = builder.bad_pixel_mask()
+    """
+    def __init__(self, n_cells, h, w):
+        """Initialization.
+
+        :param int n_cells: Number of memory cells.
+        :param int h: Height of the image.
+        :param int w: Width of the image.
+        """
+        self._builder = _DarkBuilderCpp(n_cells, h, w)
+
+    @property
+    def shape(self):
+        """(memory cells, y, x) of the constants."""
+        return tuple(self._builder.shape())
+
+    def update(self, data, *, cell_ids=None):
+        """Accumulate a dark train.
+
+        :param numpy.ndarray data: Dark train, uint16 or float32.
+            Shape = (pulses, y, x)
+        :param None/list cell_ids: Memory cell ID of each pulse. If None,
+            the i-th pulse belongs to the i-th memory cell.
+        """
+        if cell_ids is None:
+            self._builder.update(data)
+        else:
+            self._builder.update(data, cell_ids)
+
+    def next_pass(self, sigma=3.):
+        """Freeze the current offset and noise and start a new pass.
+
+        In the new pass, samples outside
+        [offset - sigma * noise, offset + sigma * noise] are rejected.
+
+        :param float sigma: Width of the clipping window in unit of noise.
+        """
+        self._builder.nextPass(sigma)
+
+    @property
+    def n_passes(self):
+        """Index of the current pass, starting from 1."""
+        return self._builder.nPasses()
+
+    def reset(self):
+        """Remove all the data and restart from the first pass."""
+        self._builder.reset()
+
+    def offset(self):
+        """Return the offset, nan for pixels without accepted sample.
+
+        :return numpy.ndarray: Shape = (memory cells, y, x)
+        """
+        return self._builder.offset()
+
+    def noise(self):
+        """Return the noise, nan for pixels without accepted sample.
+
+        :return numpy.ndarray: Shape = (memory cells, y, x)
+        """
+        return self._builder.noise()
+
+    def count(self):
+        """Return the number of accepted samples in the current pass.
+
+        :return numpy.ndarray: Shape = (memory cells, y, x)
+        """
+        return self._builder.count()
+
+    def bad_pixel_mask(self, *, offset_range=None, noise_range=None):
+        """Generate the bad pixel mask.
+
+        A pixel is bad if it has no accepted sample, zero noise, or its
+        offset or noise lies outside the given range.
+
+        :param None/tuple offset_range: (min, max) of a good offset.
+        :param None/tuple noise_range: (min, max) of a good noise.
+
+        :return numpy.ndarray: Mask with bad pixels being True.
+            Shape = (memory cells, y, x)
+        """
+        if offset_range is None:
+            offset_range = (-math.inf, math.inf)
+        if noise_range is None:
+            noise_range = (-math.inf, math.inf)
+
+        return self._builder.badPixelMask(*offset_range, *noise_range)
+
+
+def correct_common_mode(data, *,
+                        detector,
+                        mask=None,
+                        threshold=math.inf,
+                        method="median",
+                        per_row=False):
+    """Inplace apply common-mode correction to offset corrected image data.
+
+    The common mode is estimated for each ASIC, or for each row of each
+    ASIC, from the pixels which are not hit by photons.
+
+    :param numpy.ndarray data: Image data of a single module, float32.
+        Shape = (y, x) or (indices, y, x)
+    :param str detector: Detector name, "JungFrau" or "ePix100".
+    :param None/numpy.ndarray mask: Pixels being True do not contribute
+        to the common mode. Shape = (y, x)
+    :param float threshold: Pixels with absolute values above the
+        threshold are regarded as being hit by photons.
+    :param str method: Estimator of the common mode, "median" or "mean".
+    :param bool per_row: True for estimating the common mode for each
+        row of each ASIC instead of for each ASIC.
+
+    :raise ValueError: If the detector or method is not supported.
+    """
+    try:
+        corrector = _COMMON_MODE_CORRECTORS[(detector, method)]
+    except KeyError:
+        raise ValueError(f"Unsupported detector and method combination: "
+                         f"{detector}, {method}")
+
+    if mask is None:
+        corrector(data, threshold, per_row)
+    else:
+        corrector(data, mask, threshold, per_row)
+
+
+def correct_multi_gain_image_data(data, gain_stage, *,
+                                  gain,
+                                  offset,
+                                  cell_ids=None,
+                                  out=None):
+    """Apply gain-stage-resolved gain and offset correction to raw data.
+
+    For each pixel, the constants of the gain stage in which it was
+    recorded are selected, i.e. gain[g, c] * (data - offset[g, c]), where
+    g is the gain stage and c is the memory cell. Pixels with gain stages
+    outside [0, gain stages) are set to nan. Therefore, raw gain bits which
+    are not contiguous, e.g. 0, 1 and 3 for JungFrau, must be remapped to
+    0, 1 and 2 by the caller.
+
+    :param numpy.ndarray data: Raw image data, uint16 or float32.
+        Shape = (pulses, y, x)
+    :param numpy.ndarray gain_stage: Gain stage of each pixel, uint8.
+        Shape = (pulses, y, x)
+    :param numpy.ndarray gain: Gain constants, float32.
+        Shape = (gain stages, memory cells, y, x)
+    :param numpy.ndarray offset: Offset constants, float32.
+        Shape = (gain stages, memory cells, y, x)
+    :param None/list cell_ids: Memory cell ID of each pulse. If None,
+        the i-th pulse belongs to the i-th memory cell and the numbers of
+        pulses and memory cells must be the same.
+    :param None/numpy.ndarray out: Array to store the corrected data,
+        float32. Shape = (pulses, y, x)
+
+    :return numpy.ndarray: Corrected image data.
+
+    :raise ValueError: If the shapes of the inputs do not match or a cell
+        ID is out of range.
+    """
+    if out is None:
+        out = np.empty(data.shape, dtype=IMAGE_DTYPE)
+
+    if cell_ids is None:
+        correctMultiGainImageData(data, gain_stage, gain, offset, out)
+    else:
+        correctMultiGainImageData(data, gain_stage, gain, offset, cell_ids, out)
+    return out
@@ -20,9 +20,23 @@ __all__ = [
 ]
 
 
+def _copy(a, pool):
+    if pool is None:
+        return np.copy(a)
+    out = pool.get(a.shape, a.dtype)
+    np.copyto(out, a)
+    return out
+
+
+def _zeros(shape, dtype, pool):
+    if pool is None:
+        return np.zeros(shape, dtype=dtype)
+    return pool.get(shape, dtype, fill_value=0)
+
+
 def edge_detect(image, *,
                 kernel_size=3, sigma=1, threshold=(0, 1),
-                mask_nan=True):
+                mask_nan=True, pool=None):
     """Detect edges in an image.
 
     :param numpy.ndarray image: image data. Shape = (y, x)
@@ -31,36 +45,48 @@ def edge_detect(image, *,
     :param tuple threshold: (first, second) thresholds for the hysteresis
         procedure.
     :param bool mask_nan: whether to mask nan values to 0.
+    :param None/BufferPool pool: if given, the output and intermediate
+        arrays are taken from the pool and the intermediate arrays are
+        returned to it.
     """
     masked = image
     if mask_nan:
-        masked = np.copy(image)
+        masked = _copy(image, pool)
         mask_image_data(masked, keep_nan=False)
 
-    blurred = np.zeros_like(masked)
+    # the pixels on the edges are not written
+    blurred = _zeros(masked.shape, masked.dtype, pool)
     gaussianBlur(masked, blurred, kernel_size, sigma)
-    out = np.zeros_like(blurred, dtype=np.uint8)
+    out = _zeros(blurred.shape, np.uint8, pool)
     cannyEdge(blurred, out, threshold[0], threshold[1])
 
+    if pool is not None:
+        if mask_nan:
+            pool.put(masked)
+        pool.put(blurred)
     return out
 
 
-def fourier_transform_2d(image, *, logrithmic=True, mask_nan=True):
+def fourier_transform_2d(image, *, logrithmic=True, mask_nan=True, pool=None):
     """Compute the 2-dimensional discrete Fourier Transform.
 
     :param numpy.ndarray image: image data. Shape = (y, x)
     :param logrithmic: True for returning logrithmic values of the real part
         of the transform.
     :param bool mask_nan: whether to mask nan values to 0.
+    :param None/BufferPool pool: if given, the intermediate array is taken
+        from and returned to the pool.
 
     :return numpy.ndarray: transformed image data. Shape = (y, x)
     """
-    masked = np.copy(image)
+    masked = _copy(image, pool)
     if mask_nan:
         mask_image_data(masked, keep_nan=False)
 
     # TODO: improve performance
     out = fft.fftshift(fft.fft2(masked, overwrite_x=True))
+    if pool is not None:
+        pool.put(masked)
 
     np.abs(out, out=out)
     if logrithmic:
@@ -12,22 +12,48 @@ from collections import deque, namedtuple, OrderedDict
 from collections.abc import MutableSet, Sequence
 from queue import Empty, Full
 from threading import Lock
+import os
+import sys
+import time
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    # Python < 3.8
+    shared_memory = None
 
 import numpy as np
 
 from pyfoamalgo.lib.imageproc import movingAvgImageData
+from pyfoamalgo.lib.data_structures import (
+    BinnedAccumulator2d as _BinnedAccumulator2dCpp,
+    OneWayAccuPairSequence as _OneWayAccuPairSequenceCpp,
+    OneWayAccuPairSequenceF as _OneWayAccuPairSequenceFCpp,
+    SpscQueue as _SpscQueueCpp
+)
+from pyfoamalgo.lib.statistics import KllSketch as _KllSketchCpp
 
 
 __all__ = [
     'OrderedSet',
+    'IndexSet',
     'Stack',
     'SimpleSequence',
     'SimpleVectorSequence',
     'SimplePairSequence',
+    'TimeIndexedSequence',
+    'DecimatedSequence',
+    'SharedSimpleSequence',
+    'SharedSimpleVectorSequence',
+    'SharedSequenceReader',
     'OneWayAccuPairSequence',
+    'BinnedAccumulator2d',
+    'QuantileSketch',
     'MovingAverageScalar',
     'MovingAverageArray',
     'SimpleQueue',
+    'SpscQueue',
+    'BufferPool',
 ]
 
 
@@ -53,10 +79,10 @@ class Stack:
 
         :raise IndexError: If the stack is empty.
         """
-        if not self.__items:
-            raise IndexError("Stack is empty")
-
-        return self.__items[-1]
+        try:
+            return self.__items[-1]
+        except IndexError:
+            raise IndexError("Stack is empty") from None
 
     def empty(self):
         """Check whether the stack is empty."""
@@ -102,6 +128,144 @@ class OrderedSet(MutableSet):
         return f"{self.__class__.__name__}({list(self._data.keys())})"
 
 
+class IndexSet(MutableSet):
+    """A set of indices within [0, capacity) which remembers the insertion order.
+
+    It is a replacement of OrderedSet for bookkeeping indices, e.g. the
+    selected pulses in a train. A position map makes add, discard and
+    membership test O(1) and the indices are kept in an order array, so
+    that as_array() can be passed to the C++ functions without converting
+    a Python container, e.g. nanmean_image_data(data, kept=s.as_array()).
+
+    Discarded indices leave holes in the order array, which are removed
+    when it is full or as_array() is called.
+    """
+    def __init__(self, capacity, indices=None):
+        """Initialization.
+
+        :param int capacity: Upper bound (exclusive) of the indices.
+        :param None/array-like indices: Initial indices.
+        """
+        super().__init__()
+
+        self._capacity = capacity
+        # position of each index in the order array, -1 if not in the set
+        self._pos = np.full(capacity, -1, dtype=np.int64)
+        self._order = np.empty(capacity, dtype=np.uint64)
+        self._end = 0
+        self._len = 0
+
+        if indices is not None:
+            self.update(indices)
+
+    def _compact(self):
+        if self._end == self._len:
+            return
+        order = self._order[:self._end]
+        kept = order[self._pos[order] == np.arange(self._end)]
+        self._end = self._len
+        self._order[:self._end] = kept
+        self._pos[kept] = np.arange(self._end)
+
+    def _check(self, item):
+        if not isinstance(item, (int, np.integer)):
+            raise TypeError(f"Index must be an integer: {item!r}")
+        if not 0 <= item < self._capacity:
+            raise IndexError(f"Index {item} out of range [0, {self._capacity})")
+
+    @property
+    def capacity(self):
+        """Upper bound (exclusive) of the indices."""
+        return self._capacity
+
+    def __contains__(self, item):
+        """Override."""
+        return (isinstance(item, (int, np.integer))
+                and 0 <= item < self._capacity
+                and self._pos[item] >= 0)
+
+    def __iter__(self):
+        """Override."""
+        return iter(self.as_array().tolist())
+
+    def __len__(self):
+        """Override."""
+        return self._len
+
+    def add(self, item):
+        """Override.
+
+        :raise TypeError: If the index is not an integer.
+        :raise IndexError: If the index is out of range.
+        """
+        self._check(item)
+        if self._pos[item] >= 0:
+            return
+        if self._end == self._capacity:
+            self._compact()
+        self._order[self._end] = item
+        self._pos[item] = self._end
+        self._end += 1
+        self._len += 1
+
+    def discard(self, item):
+        """Override."""
+        if item in self:
+            self._pos[item] = -1
+            self._len -= 1
+
+    def update(self, indices):
+        """Add an array of indices.
+
+        :param array-like indices: Indices to add.
+
+        :raise TypeError: If the indices are not integers.
+        :raise IndexError: If any of the indices is out of range, in which
+            case none of them is added.
+        """
+        indices = np.asarray(indices).ravel()
+        if indices.size == 0:
+            return
+        if indices.dtype.kind not in 'iu':
+            raise TypeError(f"Indices must be integers: {indices.dtype}")
+        indices = indices.astype(np.int64, copy=False)
+        for i in (indices.min(), indices.max()):
+            self._check(i)
+
+        # keep the first occurrence of each new index
+        _, first = np.unique(indices, return_index=True)
+        indices = indices[np.sort(first)]
+        indices = indices[self._pos[indices] < 0]
+
+        if self._end + len(indices) > self._capacity:
+            self._compact()
+        slots = np.arange(self._end, self._end + len(indices))
+        self._order[slots] = indices
+        self._pos[indices] = slots
+        self._end += len(indices)
+        self._len += len(indices)
+
+    def clear(self):
+        """Override."""
+        self._pos[self._order[:self._end]] = -1
+        self._end = 0
+        self._len = 0
+
+    def as_array(self):
+        """Return the indices in insertion order as a read-only uint64 array.
+
+        The array is a view of the storage and is invalidated by the
+        subsequent modification of the set.
+        """
+        self._compact()
+        ret = self._order[:self._end]
+        ret.flags.writeable = False
+        return ret
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.as_array().tolist()})"
+
+
 class _AbstractSequence(Sequence):
     """Abstract class for 'Sequence' data.
 
@@ -144,6 +308,41 @@ class _AbstractSequence(Sequence):
         """Construct from array(s)."""
         raise NotImplementedError
 
+    def _extend_buffers(self, buffers, arrays):
+        """Append arrays of data points to the buffers.
+
+        It is equivalent to appending the data points one by one, but the
+        data points are copied slice by slice and the buffers are rolled
+        over once each time the over-capacity region is filled.
+
+        :param list buffers: Buffers which store the data points along
+            the first axis.
+        :param list arrays: Arrays of the new data points, one for each
+            buffer. They must have the same length.
+        """
+        n = len(arrays[0])
+        max_len = self._max_len
+
+        # fill the buffers up to the maximum length
+        k = min(n, max_len - self._len)
+        if k > 0:
+            i = self._i0 + self._len
+            for buf, arr in zip(buffers, arrays):
+                buf[i:i + k] = arr[:k]
+            self._len += k
+
+        while k < n:
+            chunk = min(n - k, max_len - self._i0)
+            i = self._i0 + max_len
+            for buf, arr in zip(buffers, arrays):
+                buf[i:i + chunk] = arr[k:k + chunk]
+            k += chunk
+            self._i0 += chunk
+            if self._i0 == max_len:
+                self._i0 = 0
+                for buf in buffers:
+                    buf[:max_len] = buf[max_len:]
+
 
 class SimpleSequence(_AbstractSequence):
     """Store the history of scalar data."""
@@ -174,8 +373,12 @@ class SimpleSequence(_AbstractSequence):
                 self._x[:max_len] = self._x[max_len:]
 
     def extend(self, items):
-        for item in items:
-            self.append(item)
+        """Override."""
+        if not isinstance(items, np.ndarray):
+            items = np.array(list(items))
+        if len(items) == 0:
+            return
+        self._extend_buffers([self._x], [items])
 
     def reset(self):
         """Override."""
@@ -186,8 +389,7 @@ class SimpleSequence(_AbstractSequence):
     @classmethod
     def from_array(cls, ax, *args, **kwargs):
         instance = cls(*args, **kwargs)
-        for x in ax:
-            instance.append(x)
+        instance.extend(ax)
         return instance
 
 
@@ -234,9 +436,18 @@ class SimpleVectorSequence(_AbstractSequence):
                 self._x[:max_len, :] = self._x[max_len:, :]
 
     def extend(self, items):
-        """Override."""
-        for item in items:
-            self.append(item)
+        """Override.
+
+        :raises: ValueError, if any item has different size.
+        """
+        if not isinstance(items, np.ndarray):
+            items = np.array(list(items))
+        if len(items) == 0:
+            return
+        if items.ndim != 2 or items.shape[1] != self._size:
+            raise ValueError(f"Items with shape {items.shape} are not "
+                             f"vectors with size {self._size}!")
+        self._extend_buffers([self._x], [items])
 
     def reset(self):
         """Override."""
@@ -247,8 +458,7 @@ class SimpleVectorSequence(_AbstractSequence):
     @classmethod
     def from_array(cls, ax, *args, **kwargs):
         instance = cls(*args, **kwargs)
-        for x in ax:
-            instance.append(x)
+        instance.extend(ax)
         return instance
 
 
@@ -290,9 +500,17 @@ class SimplePairSequence(_AbstractSequence):
                 self._y[:max_len] = self._y[max_len:]
 
     def extend(self, items):
-        """Override."""
-        for item in items:
-            self.append(item)
+        """Override.
+
+        :raises: ValueError, if any item is not a pair.
+        """
+        if not isinstance(items, np.ndarray):
+            items = np.array(list(items))
+        if len(items) == 0:
+            return
+        if items.ndim != 2 or items.shape[1] != 2:
+            raise ValueError(f"Items with shape {items.shape} are not pairs!")
+        self._extend_buffers([self._x, self._y], [items[:, 0], items[:, 1]])
 
     def reset(self):
         """Override."""
@@ -308,13 +526,495 @@ class SimplePairSequence(_AbstractSequence):
                              f"Actual: {len(ax)}, {len(ay)}")
 
         instance = cls(*args, **kwargs)
-        for x, y in zip(ax, ay):
-            instance.append((x, y))
+        if len(ax) > 0:
+            instance._extend_buffers([instance._x, instance._y],
+                                     [np.asarray(ax), np.asarray(ay)])
+        return instance
+
+
+class TimeIndexedSequence(SimplePairSequence):
+    """Store the history of scalar data indexed by an increasing key.
+
+    Each data point is pair of data: (key, value), where the key is, for
+    example, a train ID or a timestamp. Keys must be monotonically
+    increasing, so that the data within a key range can be found by
+    binary search.
+    """
+
+    def __init__(self, *, max_len=100000, dtype=np.float64,
+                 key_dtype=np.float64):
+        """Initialization.
+
+        :param int max_len: Maximum length of the sequence.
+        :param numpy.dtype dtype: Data type of values.
+        :param numpy.dtype key_dtype: Data type of keys, e.g. np.uint64
+            for train IDs.
+        """
+        _AbstractSequence.__init__(self, max_len=max_len)
+        self._x = np.zeros(self._OVER_CAPACITY * max_len, dtype=key_dtype)
+        self._y = np.zeros(self._OVER_CAPACITY * max_len, dtype=dtype)
+
+    def _last_key(self):
+        return self._x[self._i0 + self._len - 1]
+
+    def append(self, item):
+        """Override.
+
+        :raises: ValueError, if the key is smaller than the last key.
+        """
+        key, _ = item
+        if self._len > 0 and key < self._last_key():
+            raise ValueError(f"Key {key} is smaller than the last key "
+                             f"{self._last_key()}!")
+        super().append(item)
+
+    def extend(self, items):
+        """Override.
+
+        :raises: ValueError, if any item is not a pair or the keys are
+            not monotonically increasing.
+        """
+        if not isinstance(items, np.ndarray):
+            items = np.array(list(items))
+        if len(items) == 0:
+            return
+        if items.ndim != 2 or items.shape[1] != 2:
+            raise ValueError(f"Items with shape {items.shape} are not pairs!")
+        self._extend(items[:, 0], items[:, 1])
+
+    def _extend(self, keys, values):
+        if np.any(keys[1:] < keys[:-1]) or \
+                (self._len > 0 and keys[0] < self._last_key()):
+            raise ValueError("Keys must be monotonically increasing!")
+        self._extend_buffers([self._x, self._y], [keys, values])
+
+    def range(self, k0, k1):
+        """Return the data whose keys are within [k0, k1].
+
+        The returned arrays are views of the internal buffers.
+
+        :return: (keys, values)
+        """
+        keys, values = self.data()
+        i = np.searchsorted(keys, k0, side='left')
+        j = np.searchsorted(keys, k1, side='right')
+        return keys[i:j], values[i:j]
+
+    def latest(self, span):
+        """Return the data whose keys are within span of the last key.
+
+        For example, latest(5) returns the data in the last 5 seconds
+        if the keys are timestamps in seconds.
+
+        :return: (keys, values)
+        """
+        if self._len == 0:
+            return self.data()
+        k1 = self._last_key().item()
+        return self.range(k1 - span, k1)
+
+    @classmethod
+    def from_array(cls, ax, ay, *args, **kwargs):
+        if len(ax) != len(ay):
+            raise ValueError(f"ax and ay must have the same length. "
+                             f"Actual: {len(ax)}, {len(ay)}")
+
+        instance = cls(*args, **kwargs)
+        if len(ax) > 0:
+            instance._extend(np.asarray(ax), np.asarray(ay))
         return instance
 
 
+class DecimatedSequence(SimpleSequence):
+    """Store the history of scalar data with decimated levels.
+
+    Level l aggregates blocks of 4^l consecutive data points into their
+    minimum, maximum and sum. A block is aggregated once when it is
+    complete, so that the levels are maintained in amortized constant
+    time per data point. data(resolution) then returns at most resolution
+    representative points without scanning the whole history.
+    """
+    _FACTOR_SHIFT = 2  # blocks of 4 ** level data points
+
+    def __init__(self, *, max_len=100000, dtype=np.float64):
+        super().__init__(max_len=max_len, dtype=dtype)
+
+        self._n_total = 0  # number of data points ever appended
+        # (min, max, sum) of the blocks at each level, indexed by the
+        # block index modulo the capacity
+        self._levels = []
+        level = 1
+        while 1 << (self._FACTOR_SHIFT * level) <= max_len:
+            capacity = (max_len >> (self._FACTOR_SHIFT * level)) + 2
+            self._levels.append((np.zeros(capacity, dtype=dtype),
+                                 np.zeros(capacity, dtype=dtype),
+                                 np.zeros(capacity, dtype=np.float64)))
+            level += 1
+
+    def _start(self):
+        """Return the absolute index of the first visible data point."""
+        return self._n_total - self._len
+
+    def _update_levels(self, n0):
+        """Aggregate the blocks completed since n0 data points were appended.
+
+        Only the blocks within the visible data are aggregated.
+        """
+        n1 = self._n_total
+        start = self._start()
+        for level, (mins, maxs, sums) in enumerate(self._levels, 1):
+            shift = self._FACTOR_SHIFT * level
+            b_lo = max(n0 >> shift, -(-start >> shift))
+            b_hi = n1 >> shift
+            if b_lo >= b_hi:
+                # no block at a higher level can be complete
+                break
+
+            if level == 1:
+                i = self._i0 + (b_lo << shift) - start
+                x = self._x[i:i + ((b_hi - b_lo) << shift)].reshape(-1, 4)
+                b_min = x.min(axis=1)
+                b_max = x.max(axis=1)
+                b_sum = x.sum(axis=1, dtype=np.float64)
+            else:
+                c_mins, c_maxs, c_sums = self._levels[level - 2]
+                idx = np.arange(4 * b_lo, 4 * b_hi) % len(c_mins)
+                b_min = c_mins[idx].reshape(-1, 4).min(axis=1)
+                b_max = c_maxs[idx].reshape(-1, 4).max(axis=1)
+                b_sum = c_sums[idx].reshape(-1, 4).sum(axis=1)
+
+            idx = np.arange(b_lo, b_hi) % len(mins)
+            mins[idx] = b_min
+            maxs[idx] = b_max
+            sums[idx] = b_sum
+
+    def _reduce_raw(self, a0, a1, level):
+        """Aggregate data points [a0, a1) into blocks at the given level.
+
+        :return: (positions, means, mins, maxs)
+        """
+        start = self._start()
+        shift = self._FACTOR_SHIFT * level
+        i = self._i0 + a0 - start
+        x = self._x[i:i + a1 - a0]
+        bounds = np.arange(((a0 >> shift) + 1) << shift, a1, 1 << shift)
+        idx = np.concatenate(([0], bounds - a0)).astype(np.intp)
+        counts = np.diff(np.append(idx, len(x)))
+        return (idx + (a0 - start),
+                np.add.reduceat(x, idx, dtype=np.float64) / counts,
+                np.minimum.reduceat(x, idx),
+                np.maximum.reduceat(x, idx))
+
+    def data(self, resolution=None):
+        """Override.
+
+        :param None/int resolution: If None, return all the data.
+            Otherwise, return at most resolution representative points.
+
+        :return: all the data or (positions, means, mins, maxs) of the
+            representative points, where positions are the indices of the
+            first data points aggregated into the representative points.
+
+        :raises: ValueError, if resolution is smaller than 2.
+        """
+        if resolution is None:
+            return super().data()
+
+        if resolution < 2:
+            raise ValueError("resolution must be at least 2!")
+
+        n1 = self._n_total
+        start = self._start()
+        if self._len <= resolution:
+            x = super().data()
+            return np.arange(len(x)), x.astype(np.float64), x, x
+
+        level = 1
+        while ((n1 - 1) >> (self._FACTOR_SHIFT * level)) - \
+                (start >> (self._FACTOR_SHIFT * level)) + 1 > resolution:
+            level += 1
+
+        shift = self._FACTOR_SHIFT * level
+        b0 = start >> shift
+        b1 = (n1 - 1) >> shift
+        if level > len(self._levels) or b1 - b0 < 2:
+            return self._reduce_raw(start, n1, level)
+
+        # the first and the last blocks can be incomplete
+        head = self._reduce_raw(start, (b0 + 1) << shift, level)
+        tail = self._reduce_raw(b1 << shift, n1, level)
+
+        mins, maxs, sums = self._levels[level - 1]
+        blocks = np.arange(b0 + 1, b1)
+        idx = blocks % len(mins)
+        middle = ((blocks << shift) - start,
+                  sums[idx] / (1 << shift),
+                  mins[idx],
+                  maxs[idx])
+
+        return tuple(np.concatenate(arrs) for arrs in zip(head, middle, tail))
+
+    def append(self, item):
+        """Override."""
+        super().append(item)
+        self._n_total += 1
+        if self._n_total % 4 == 0:
+            self._update_levels(self._n_total - 1)
+
+    def extend(self, items):
+        """Override."""
+        if not isinstance(items, np.ndarray):
+            items = np.array(list(items))
+        n0 = self._n_total
+        super().extend(items)
+        self._n_total += len(items)
+        self._update_levels(n0)
+
+    def reset(self):
+        """Override."""
+        super().reset()
+        self._n_total = 0
+
+
+# names of the shared memory created in this process
+_OWNED_SHARED_MEMORY = set()
+
+
+def _attach_shared_memory(name):
+    """Attach to an existing shared memory without taking its ownership.
+
+    Before Python 3.13, attaching registers the shared memory with the
+    resource tracker of this process, which unlinks it and warns about a
+    leak when the process exits.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+
+    shm = shared_memory.SharedMemory(name=name)
+    if os.name == "posix" and shm._name not in _OWNED_SHARED_MEMORY:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+class _SharedSequenceMixin:
+    """Mixin which places the buffer of a sequence in shared memory.
+
+    The shared memory starts with a header of int64 values:
+    (version, starting index, length, max_len, vector size, dtype code).
+    The version is a sequence lock: it is odd while the data is being
+    modified, so that readers can detect torn reads.
+    """
+    _HEADER_LEN = 8
+    _VERSION, _I0, _LEN, _MAX_LEN, _SIZE, _DTYPE = range(6)
+
+    def _create_shared_buffer(self, shape, dtype, name):
+        if shared_memory is None:
+            raise RuntimeError("Shared memory requires Python 3.8 or later!")
+
+        dtype = np.dtype(dtype)
+        header_size = self._HEADER_LEN * np.dtype(np.int64).itemsize
+        self._shm = shared_memory.SharedMemory(
+            name=name, create=True,
+            size=header_size + int(np.prod(shape)) * dtype.itemsize)
+        _OWNED_SHARED_MEMORY.add(self._shm._name)
+        self._header = np.ndarray(
+            (self._HEADER_LEN,), dtype=np.int64, buffer=self._shm.buf)
+        self._header[:] = 0
+        self._header[self._MAX_LEN] = self._max_len
+        self._header[self._SIZE] = shape[1] if len(shape) > 1 else 0
+        self._header[self._DTYPE] = ord(dtype.char)
+
+        x = np.ndarray(shape, dtype=dtype, buffer=self._shm.buf,
+                       offset=header_size)
+        x.fill(0)
+        return x
+
+    @property
+    def name(self):
+        """Name of the shared memory, which is used to attach readers."""
+        return self._shm.name
+
+    def _write(self, f, *args):
+        header = self._header
+        header[self._VERSION] += 1
+        try:
+            f(*args)
+        finally:
+            header[self._I0] = self._i0
+            header[self._LEN] = self._len
+            header[self._VERSION] += 1
+
+    def close(self):
+        """Close access to the shared memory from this instance."""
+        self._x = None
+        self._header = None
+        self._shm.close()
+
+    def unlink(self):
+        """Request the shared memory to be destroyed.
+
+        It should be called once by the owner after all the readers have
+        closed the shared memory.
+        """
+        self._shm.unlink()
+        _OWNED_SHARED_MEMORY.discard(self._shm._name)
+
+
+class SharedSimpleSequence(_SharedSequenceMixin, SimpleSequence):
+    """Store the history of scalar data in shared memory.
+
+    Readers in other processes attach to it by name with
+    :class:`SharedSequenceReader`. Only one process should write to it.
+    """
+
+    def __init__(self, *, max_len=100000, dtype=np.float64, name=None):
+        """Initialization.
+
+        :param int max_len: Maximum length of the sequence.
+        :param numpy.dtype dtype: Data type.
+        :param None/str name: Name of the shared memory. If None, a unique
+            name is generated.
+        """
+        _AbstractSequence.__init__(self, max_len=max_len)
+        self._x = self._create_shared_buffer(
+            (self._OVER_CAPACITY * max_len,), dtype, name)
+
+    def append(self, item):
+        """Override."""
+        self._write(super().append, item)
+
+    def extend(self, items):
+        """Override."""
+        self._write(super().extend, items)
+
+    def reset(self):
+        """Override."""
+        self._write(super().reset)
+
+
+class SharedSimpleVectorSequence(_SharedSequenceMixin, SimpleVectorSequence):
+    """Store the history of vector data in shared memory.
+
+    Readers in other processes attach to it by name with
+    :class:`SharedSequenceReader`. Only one process should write to it.
+    """
+
+    def __init__(self, size, *, max_len=100000, dtype=np.float64, name=None):
+        """Initialization.
+
+        :param int size: Size of a vector.
+        :param int max_len: Maximum length of the sequence.
+        :param numpy.dtype dtype: Data type.
+        :param None/str name: Name of the shared memory. If None, a unique
+            name is generated.
+        """
+        _AbstractSequence.__init__(self, max_len=max_len)
+        self._x = self._create_shared_buffer(
+            (self._OVER_CAPACITY * max_len, size), dtype, name)
+        self._size = size
+
+    def append(self, item):
+        """Override."""
+        self._write(super().append, item)
+
+    def extend(self, items):
+        """Override."""
+        self._write(super().extend, items)
+
+    def reset(self):
+        """Override."""
+        self._write(super().reset)
+
+
+class SharedSequenceReader:
+    """Read a shared-memory sequence in another process.
+
+    The data can be read without copying:
+
+    .. code-block:: python
+
+        reader = SharedSequenceReader(name)
+        while True:
+            version, data = reader.view()
+            result = process(data)
+            if reader.validate(version):
+                break
+    """
+    _HEADER_LEN = _SharedSequenceMixin._HEADER_LEN
+    _VERSION, _I0, _LEN, _MAX_LEN, _SIZE, _DTYPE = range(6)
+
+    def __init__(self, name):
+        """Initialization.
+
+        :param str name: Name of the shared memory of a
+            SharedSimpleSequence or a SharedSimpleVectorSequence.
+        """
+        if shared_memory is None:
+            raise RuntimeError("Shared memory requires Python 3.8 or later!")
+
+        self._shm = _attach_shared_memory(name)
+        self._header = np.ndarray(
+            (self._HEADER_LEN,), dtype=np.int64, buffer=self._shm.buf)
+
+        capacity = _AbstractSequence._OVER_CAPACITY * int(self._header[self._MAX_LEN])
+        size = int(self._header[self._SIZE])
+        self._x = np.ndarray(
+            (capacity,) if size == 0 else (capacity, size),
+            dtype=np.dtype(chr(self._header[self._DTYPE])),
+            buffer=self._shm.buf,
+            offset=self._HEADER_LEN * np.dtype(np.int64).itemsize)
+        self._x.flags.writeable = False
+
+    @property
+    def version(self):
+        """Current version of the data, which is odd during writing."""
+        return int(self._header[self._VERSION])
+
+    def view(self):
+        """Return a view of the data without copying.
+
+        The view is only consistent if validate(version) returns True
+        after the view has been used.
+
+        :return: (version, data)
+        """
+        while True:
+            version = self.version
+            if version % 2 == 0:
+                break
+            # the writer is modifying the data
+            time.sleep(0)
+
+        i0 = int(self._header[self._I0])
+        n = int(self._header[self._LEN])
+        return version, self._x[i0:i0 + n]
+
+    def validate(self, version):
+        """Return whether the data has not been modified since the version."""
+        return self.version == version
+
+    def data(self):
+        """Return a consistent copy of the data."""
+        while True:
+            version, view = self.view()
+            data = view.copy()
+            if self.validate(version):
+                return data
+
+    def close(self):
+        """Close access to the shared memory from this instance."""
+        self._x = None
+        self._header = None
+        self._shm.close()
+
+
 _StatDataItem = namedtuple('_StatDataItem', ['avg', 'min', 'max', 'count'])
 
+_ONE_WAY_ACCU_PAIR_SEQUENCES = {
+    np.dtype(np.float64): _OneWayAccuPairSequenceCpp,
+    np.dtype(np.float32): _OneWayAccuPairSequenceFCpp,
+}
+
 
 class OneWayAccuPairSequence(_AbstractSequence):
     """Store the history a pair of accumulative scalar data.
@@ -325,34 +1025,65 @@ class OneWayAccuPairSequence(_AbstractSequence):
     example, will stop in a location and collect data for a period
     of time. Then, each data point in the accumulated pair data is
     the average of the data during this period.
+
+    The data points are accumulated by the C++ implementation and
+    data() returns views of its storage without copying. Bulk consumers
+    should prefer records(), which returns all the statistics in a single
+    structured array.
     """
 
     def __init__(self, resolution, *,
                  max_len=3000, dtype=np.float64, min_count=2):
-        super().__init__(max_len=max_len)
+        """Initialization.
 
-        self._min_count = min_count
+        :param float resolution: Samples whose x values differ by no more
+            than the resolution from the average x of the last data point
+            are accumulated into it.
+        :param int max_len: Maximum number of data points.
+        :param numpy.dtype dtype: Data type, float32 or float64.
+        :param int min_count: Minimum number of samples of a data point.
+            Data points with less samples are discarded.
+
+        :raises: ValueError, if resolution or min_count is not positive
+            or dtype is not supported.
+        """
+        super().__init__(max_len=max_len)
 
         if resolution <= 0:
             raise ValueError("resolution must be positive!")
+        try:
+            seq_cpp = _ONE_WAY_ACCU_PAIR_SEQUENCES[np.dtype(dtype)]
+        except KeyError:
+            raise ValueError(f"Unsupported dtype: {dtype}")
+        self._seq = seq_cpp(resolution, max_len, min_count)
         self._resolution = resolution
+        self._dtype = np.dtype(dtype)
+        self._min_count = min_count
 
-        self._x_avg = np.zeros(self._OVER_CAPACITY * max_len, dtype=dtype)
-        self._count = np.zeros(
-            self._OVER_CAPACITY * max_len, dtype=np.uint64)
-        self._y_avg = np.zeros(
-            self._OVER_CAPACITY * max_len, dtype=dtype)
-        self._y_min = np.zeros(
-            self._OVER_CAPACITY * max_len, dtype=dtype)
-        self._y_max = np.zeros(
-            self._OVER_CAPACITY * max_len, dtype=dtype)
-        self._y_std = np.zeros(
-            self._OVER_CAPACITY * max_len, dtype=dtype)
+        self._records = self._seq.points()
+        self._records.flags.writeable = False
+        self._x_avg = self._records['x']
+        self._y_avg = self._records['avg']
+        self._y_min = self._records['min']
+        self._y_max = self._records['max']
+        self._count = self._records['count']
 
-        self._last = 0
+    def _sync(self):
+        self._i0 = self._seq.start()
+        self._len = self._seq.size()
 
     def __getitem__(self, index):
         """Override."""
+        if isinstance(index, (int, np.integer)):
+            if index < 0:
+                index += self._len
+            if not 0 <= index < self._len:
+                raise IndexError("Sequence index out of range")
+            # numpy scalars as the field views
+            record = self._records[self._i0 + index]
+            return record['x'], _StatDataItem(
+                record['avg'], record['min'], record['max'], record['count'])
+
         s = slice(self._i0, self._i0 + self._len)
 
         x = self._x_avg[s][index]
@@ -362,13 +1093,15 @@ class OneWayAccuPairSequence(_AbstractSequence):
                           self._count[s][index])
         return x, y
 
-    def data(self):
-        """Override."""
+    def _data_slice(self):
         last = self._i0 + self._len - 1
         if self._len > 0 and self._count[last] < self._min_count:
-            s = slice(self._i0, last)
-        else:
-            s = slice(self._i0, last + 1)
+            return slice(self._i0, last)
+        return slice(self._i0, last + 1)
+
+    def data(self):
+        """Override."""
+        s = self._data_slice()
 
         x = self._x_avg[s]
         y = _StatDataItem(self._y_avg[s],
@@ -377,97 +1110,57 @@ class OneWayAccuPairSequence(_AbstractSequence):
                           self._count[s])
         return x, y
 
+    def records(self):
+        """Return all the data points as a read-only structured array.
+
+        The array is a view of the storage and has fields 'x', 'avg',
+        'min', 'max', 'std' and 'count'. It is the fast path for bulk
+        consumers.
+        """
+        return self._records[self._data_slice()]
+
     def append(self, item):
         """Override."""
         x, y = item
-
-        new_pt = False
-        last = self._last
-        if self._len > 0 or self._count[0] > 0:
-            if abs(x - self._x_avg[last]) <= self._resolution:
-                self._count[last] += 1
-                self._x_avg[last] += (x - self._x_avg[last]) / self._count[last]
-                avg_prev = self._y_avg[last]
-                self._y_avg[last] += (y - self._y_avg[last]) / self._count[last]
-                self._y_std[last] += (y - avg_prev)*(y - self._y_avg[last])
-                # self._y_min and self._y_max does not store min and max
-                # Only Standard deviation will be plotted. Min Max functionality
-                # does not exist as of now.
-                # self._y_min stores y_avg - 0.5*std_dev
-                # self._y_max stores y_avg + 0.5*std_dev
-                self._y_min[last] = self._y_avg[last] - 0.5*np.sqrt(
-                    self._y_std[last]/self._count[last])
-                self._y_max[last] = self._y_avg[last] + 0.5*np.sqrt(
-                    self._y_std[last]/self._count[last])
-
-                if self._count[last] == self._min_count:
-                    new_pt = True
-
-            else:
-                # If the number of data at a location is less than
-                # min_count, the data at this location will be discarded.
-                if self._count[last] >= self._min_count:
-                    self._last += 1
-                    last = self._last
-
-                self._x_avg[last] = x
-                self._count[last] = 1
-                self._y_avg[last] = y
-                self._y_min[last] = y
-                self._y_max[last] = y
-                self._y_std[last] = 0.0
-
-        else:
-            self._x_avg[0] = x
-            self._count[0] = 1
-            self._y_avg[0] = y
-            self._y_min[0] = y
-            self._y_max[0] = y
-            self._y_std[0] = 0.0
-
-        if new_pt:
-            max_len = self._max_len
-            if self._len < max_len:
-                self._len += 1
-            else:
-                self._i0 += 1
-                if self._i0 == max_len:
-                    self._i0 = 0
-                    self._last -= max_len
-                    self._x_avg[:max_len] = self._x_avg[max_len:]
-                    self._count[:max_len] = self._count[max_len:]
-                    self._y_avg[:max_len] = self._y_avg[max_len:]
-                    self._y_min[:max_len] = self._y_min[max_len:]
-                    self._y_max[:max_len] = self._y_max[max_len:]
-                    self._y_std[:max_len] = self._y_std[max_len:]
+        self._seq.append(x, y)
+        self._sync()
 
     def append_dry(self, x):
         """Return whether append the given item will start a new position."""
-        next_pos = False
-        if self._len > 0 or self._count[0] > 0:
-            if abs(x - self._x_avg[self._last]) > self._resolution:
-                next_pos = True
-        else:
-            next_pos = True
-
-        return next_pos
+        return self._seq.appendDry(x)
 
     def extend(self, items):
         """Override."""
-        for item in items:
-            self.append(item)
+        if not isinstance(items, np.ndarray):
+            items = np.array(list(items), dtype=np.float64)
+        if len(items) == 0:
+            return
+        if items.ndim != 2 or items.shape[1] != 2:
+            raise ValueError(f"Items with shape {items.shape} are not pairs!")
+        self._extend(items[:, 0], items[:, 1])
+
+    def _extend(self, ax, ay):
+        self._seq.extend(np.ascontiguousarray(ax, dtype=np.float64),
+                         np.ascontiguousarray(ay, dtype=np.float64))
+        self._sync()
 
     def reset(self):
         """Overload."""
-        self._i0 = 0
-        self._len = 0
-        self._last = 0
-        self._x_avg.fill(0)
-        self._count.fill(0)
-        self._y_avg.fill(0)
-        self._y_min.fill(0)
-        self._y_max.fill(0)
-        self._y_std.fill(0)
+        self._seq.reset()
+        self._sync()
+
+    def __getstate__(self):
+        return {'resolution': self._resolution,
+                'max_len': self._max_len,
+                'dtype': self._dtype,
+                'min_count': self._min_count,
+                'state': self._seq.state()}
+
+    def __setstate__(self, state):
+        self.__init__(state['resolution'], max_len=state['max_len'],
+                      dtype=state['dtype'], min_count=state['min_count'])
+        self._seq.setState(*state['state'])
+        self._sync()
 
     @classmethod
     def from_array(cls, ax, ay, *args, **kwargs):
@@ -476,11 +1169,191 @@ class OneWayAccuPairSequence(_AbstractSequence):
                              f"Actual: {len(ax)}, {len(ay)}")
 
         instance = cls(*args, **kwargs)
-        for x, y in zip(ax, ay):
-            instance.append((x, y))
+        instance._extend(ax, ay)
         return instance
 
 
+class BinnedAccumulator2d:
+    """Accumulate values on a 2D grid of bins, e.g. a 2D motor scan.
+
+    The count, mean and standard deviation of the values falling in each
+    bin are accumulated online, so that the samples are never stored.
+    Samples with nan are ignored.
+
+    The bins are defined as in numpy.histogram2d. If auto_grow is True,
+    the grid grows by whole bins of the same width to include the samples
+    outside it. Otherwise, these samples are ignored.
+    """
+    def __init__(self, range, bins=10, *, auto_grow=False, max_bins=4096):
+        """Initialization.
+
+        :param tuple range: ((xmin, xmax), (ymin, ymax)) of the bins.
+        :param int/tuple bins: Number of bins along both axes, or
+            (nx, ny).
+        :param bool auto_grow: True for growing the grid to include the
+            samples outside it.
+        :param int max_bins: Maximum number of bins along each axis when
+            the grid grows.
+
+        :raises: ValueError, if the range or bins are invalid.
+        """
+        if isinstance(bins, (int, np.integer)):
+            nx = ny = bins
+        else:
+            nx, ny = bins
+        (x_left, x_right), (y_left, y_right) = range
+
+        self._acc = _BinnedAccumulator2dCpp(
+            x_left, x_right, nx, y_left, y_right, ny, auto_grow, max_bins)
+
+    def update(self, x, y, value):
+        """Accumulate a sample or an array of samples.
+
+        :param float/array-like x: x position(s).
+        :param float/array-like y: y position(s).
+        :param float/array-like value: Value(s).
+
+        :raises: ValueError, if x, y and value have different lengths or
+            the grid cannot grow to include all the samples, in which case
+            none of the samples is accumulated.
+        """
+        if np.ndim(x) == 0 and np.ndim(y) == 0 and np.ndim(value) == 0:
+            self._acc.update(float(x), float(y), float(value))
+            return
+
+        self._acc.update(np.ascontiguousarray(x, dtype=np.float64).ravel(),
+                         np.ascontiguousarray(y, dtype=np.float64).ravel(),
+                         np.ascontiguousarray(value, dtype=np.float64).ravel())
+
+    @property
+    def x_edges(self):
+        """Bin edges along x."""
+        return self._acc.xEdges()
+
+    @property
+    def y_edges(self):
+        """Bin edges along y."""
+        return self._acc.yEdges()
+
+    def data(self):
+        """Return the accumulated statistics.
+
+        The arrays are read-only views of the storage. They are no longer
+        updated after the grid grows or the accumulator is reset.
+
+        :return tuple: (count, mean, std). The mean and std of empty bins
+            are nan. Shape = (x bins, y bins)
+        """
+        ret = self._acc.count(), self._acc.mean(), self._acc.stdDev()
+        for a in ret:
+            a.flags.writeable = False
+        return ret
+
+    def reset(self):
+        """Remove all the data and restore the initial grid."""
+        self._acc.reset()
+
+
+class QuantileSketch:
+    """Mergeable streaming quantile sketch of scalar data.
+
+    Unlike the sequences, it does not store the history. It keeps a
+    bounded number of representative values instead (KLL sketch), so that
+    the costs of update and query are independent of the number of data
+    points seen. The rank error of a quantile is roughly 1.7 / k. nan is
+    ignored.
+
+    Sketches filled in different processes can be combined with merge().
+    """
+    def __init__(self, k=200, *, seed=None):
+        """Initialization.
+
+        :param int k: Parameter which controls the accuracy and the
+            memory usage.
+        :param None/int seed: Seed of the random number generator used
+            to compact the sketch.
+
+        :raise ValueError: If k is smaller than 2.
+        """
+        if seed is None:
+            seed = np.random.randint(0, 2 ** 31)
+        self._sketch = _KllSketchCpp(k, seed)
+
+    @property
+    def k(self):
+        """Parameter which controls the accuracy and the memory usage."""
+        return self._sketch.k()
+
+    @property
+    def size(self):
+        """Number of retained values."""
+        return self._sketch.size()
+
+    @property
+    def min(self):
+        """Minimum of the data points, or nan if there is no data point."""
+        return self._sketch.min()
+
+    @property
+    def max(self):
+        """Maximum of the data points, or nan if there is no data point."""
+        return self._sketch.max()
+
+    def __len__(self):
+        """Return the number of data points seen."""
+        return self._sketch.count()
+
+    def append(self, item):
+        """Add a new data point."""
+        self._sketch.update(float(item))
+
+    def extend(self, items):
+        """Add a list of data points."""
+        self._sketch.update(np.ascontiguousarray(items, dtype=np.float64).ravel())
+
+    def quantile(self, q):
+        """Return the approximate quantile(s).
+
+        :param float/array-like q: Quantile or sequence of quantiles,
+            which must be within [0, 1].
+
+        :return float/numpy.ndarray: nan if there is no data point.
+
+        :raise ValueError: If q is outside [0, 1].
+        """
+        if np.ndim(q) == 0:
+            return self._sketch.quantile(float(q))
+        return np.array(
+            self._sketch.quantiles(np.ravel(q).tolist())).reshape(np.shape(q))
+
+    def cdf(self, v):
+        """Return the approximate fraction of data points not larger than v.
+
+        :return float: nan if there is no data point.
+        """
+        return self._sketch.cdf(float(v))
+
+    def merge(self, other):
+        """Merge another sketch.
+
+        :param QuantileSketch other: Sketch with the same k.
+
+        :raise ValueError: If the sketches have different k.
+        """
+        self._sketch.merge(other._sketch)
+
+    def reset(self):
+        """Remove all the data points."""
+        self._sketch.reset()
+
+    def __getstate__(self):
+        return {'k': self.k, 'state': self._sketch.state()}
+
+    def __setstate__(self, state):
+        self.__init__(state['k'])
+        self._sketch.setState(*state['state'])
+
+
 class _MovingAverageBase:
     def __init__(self, window=1):
         """Initialization.
@@ -646,3 +1519,201 @@ class SimpleQueue:
         """Clear the queue."""
         with self._mutex:
             self._queue.clear()
+
+
+class SpscQueue:
+    """A bounded lock-free queue for one producer and one consumer thread.
+
+    Only one thread should put items and only one thread should get items.
+    Unlike SimpleQueue, no lock is acquired and the GIL is released while
+    waiting.
+    """
+    def __init__(self, maxsize):
+        """Initialization.
+
+        :param int maxsize: maximum number of items in the queue.
+
+        :raise ValueError: if maxsize is not positive.
+        """
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive!")
+        self._queue = _SpscQueueCpp(maxsize)
+
+    @staticmethod
+    def _timeout(block, timeout):
+        if not block:
+            return 0.
+        if timeout is None:
+            return -1.
+        if timeout < 0:
+            raise ValueError("'timeout' must be a non-negative number")
+        return float(timeout)
+
+    def get(self, block=False, timeout=None):
+        """Remove and return an item from the queue.
+
+        :param bool block: whether to wait for an item.
+        :param None/float timeout: maximum waiting time in seconds if block
+            is True. If None, wait until an item is available.
+
+        :raise Empty: if the queue is Empty.
+        """
+        items = self._queue.getMany(1, self._timeout(block, timeout))
+        if not items:
+            raise Empty
+        return items[0]
+
+    def get_many(self, n, block=False, timeout=None):
+        """Remove and return up to n items from the queue.
+
+        :param int n: maximum number of items.
+        :param bool block: whether to wait for the first item.
+        :param None/float timeout: maximum waiting time in seconds if block
+            is True. If None, wait until an item is available.
+
+        :return list: items in the order of insertion, which is empty if
+            no item is available.
+        """
+        return self._queue.getMany(n, self._timeout(block, timeout))
+
+    def put(self, item, block=False, timeout=None):
+        """Put an item into the queue.
+
+        :param bool block: whether to wait for a free slot.
+        :param None/float timeout: maximum waiting time in seconds if block
+            is True. If None, wait until a free slot is available.
+
+        :raise Full: if the queue is already full.
+        """
+        if not self._queue.put(item, self._timeout(block, timeout)):
+            raise Full
+
+    def put_pop(self, item):
+        """Put an item into the queue.
+
+        If the queue is already full, the first item will be removed.
+        """
+        self._queue.putPop(item)
+
+    def qsize(self):
+        """Return the approximate number of elements in the queue."""
+        return self._queue.size()
+
+    def empty(self):
+        """Check whether the queue is empty."""
+        return self._queue.empty()
+
+    def full(self):
+        """Check whether the queue is full."""
+        return self._queue.full()
+
+    def clear(self):
+        """Clear the queue.
+
+        It should be called by the consumer.
+        """
+        self._queue.clear()
+
+
+class BufferPool:
+    """A thread-safe pool of recycled numpy arrays.
+
+    Arrays returned to the pool are handed out again for the same shape and
+    dtype, which avoids page-faulting freshly allocated memory. The least
+    recently returned arrays are released once the arrays held by the pool
+    exceed the memory limit.
+    """
+    def __init__(self, max_bytes=1 << 30):
+        """Initialization.
+
+        :param int max_bytes: maximum total size in bytes of the arrays
+            held by the pool.
+        """
+        self._max_bytes = max_bytes
+        # (shape, dtype): [arrays]
+        self._buffers = OrderedDict()
+        self._nbytes = 0
+        self._mutex = Lock()
+
+    @staticmethod
+    def _key(shape, dtype):
+        if isinstance(shape, int):
+            shape = (shape,)
+        return tuple(shape), np.dtype(dtype)
+
+    def get(self, shape, dtype=np.float64, *, fill_value=None):
+        """Return an array from the pool or a new one if none is available.
+
+        :param int/tuple shape: shape of the array.
+        :param numpy.dtype dtype: dtype of the array.
+        :param None/scalar fill_value: value to fill the array with. If None,
+            the content of the array is arbitrary.
+        """
+        key = self._key(shape, dtype)
+        with self._mutex:
+            arrays = self._buffers.get(key)
+            if arrays:
+                arr = arrays.pop()
+                if not arrays:
+                    del self._buffers[key]
+                self._nbytes -= arr.nbytes
+            else:
+                arr = None
+
+        if arr is None:
+            if fill_value is None:
+                return np.empty(*key)
+            return np.full(*key, fill_value)
+
+        if fill_value is not None:
+            arr.fill(fill_value)
+        return arr
+
+    def put(self, array):
+        """Return an array to the pool.
+
+        The array must not be used by the caller afterwards.
+
+        :param numpy.ndarray array: array which owns its data.
+
+        :raise ValueError: if the array does not own its data or it is
+            already in the pool.
+        """
+        if not array.flags.owndata:
+            raise ValueError("Only arrays which own their data can be "
+                             "returned to the pool!")
+
+        if array.nbytes > self._max_bytes:
+            return
+
+        key = self._key(array.shape, array.dtype)
+        with self._mutex:
+            arrays = self._buffers.setdefault(key, [])
+            if any(a is array for a in arrays):
+                raise ValueError("Array is already in the pool!")
+            arrays.append(array)
+            self._buffers.move_to_end(key)
+            self._nbytes += array.nbytes
+
+            while self._nbytes > self._max_bytes:
+                lru_key, lru_arrays = next(iter(self._buffers.items()))
+                self._nbytes -= lru_arrays.pop(0).nbytes
+                if not lru_arrays:
+                    del self._buffers[lru_key]
+
+    @property
+    def nbytes(self):
+        """Total size in bytes of the arrays held by the pool."""
+        with self._mutex:
+            return self._nbytes
+
+    def __len__(self):
+        """Return the number of arrays held by the pool."""
+        with self._mutex:
+            return sum(len(v) for v in self._buffers.values())
+
+    def clear(self):
+        """Release all the arrays held by the pool."""
+        with self._mutex:
+            self._buffers.clear()
+            self._nbytes = 0
@@ -19,7 +19,15 @@ class _GeometryMixin:
     The mixin class implements the API methods which have the same signatures
     as those implemented in EXtra-geom.
     """
-    def output_array_for_position_fast(self, extra_shape=(), dtype=IMAGE_DTYPE):
+    @staticmethod
+    def _full_output_array(shape, dtype, pool):
+        fill_value = 0 if dtype == bool else np.nan
+        if pool is None:
+            return np.full(shape, fill_value, dtype=dtype)
+        return pool.get(shape, dtype, fill_value=fill_value)
+
+    def output_array_for_position_fast(self, extra_shape=(), dtype=IMAGE_DTYPE,
+                                       *, pool=None):
         """Make an array with the shape of assembled data filled with nan.
 
         :param tuple extra_shape: By default, a 2D array is generated to hold
@@ -27,11 +35,11 @@ class _GeometryMixin:
             assembling multiple pulses at once, pass ``extra_shape=(pulses,)``
             to return a 3D array.
         :param numpy.dtype dtype: dtype of the output array.
+        :param None/BufferPool pool: if given, the array is taken from the
+            pool instead of being allocated.
         """
         shape = extra_shape + tuple(self.assembledShape())
-        if dtype == bool:
-            return np.full(shape, 0, dtype=dtype)
-        return np.full(shape, np.nan, dtype=dtype)
+        return self._full_output_array(shape, dtype, pool)
 
     @abc.abstractmethod
     def position_all_modules(self, modules, out, *,
@@ -52,7 +60,8 @@ class _GeometryMixin:
         pass
 
     @abc.abstractmethod
-    def output_array_for_dismantle_fast(self, extra_shape=(), dtype=IMAGE_DTYPE):
+    def output_array_for_dismantle_fast(self, extra_shape=(), dtype=IMAGE_DTYPE,
+                                        *, pool=None):
         """Make an array with the shape of data in modules filled with nan.
 
         :param tuple extra_shape: By default, a 3D array is generated to hold
@@ -60,11 +69,11 @@ class _GeometryMixin:
             dismantling multiple images at once, pass ``extra_shape=(pulses,)``
             to return a 4D array.
         :param numpy.dtype dtype: dtype of the output array.
+        :param None/BufferPool pool: if given, the array is taken from the
+            pool instead of being allocated.
         """
         shape = extra_shape + (self.n_modules, *self.module_shape)
-        if dtype == bool:
-            return np.full(shape, 0, dtype=dtype)
-        return np.full(shape, np.nan, dtype=dtype)
+        return self._full_output_array(shape, dtype, pool)
 
     def dismantle_all_modules(self, assembled, out):
         """Dismantle assembled data into data in modules.
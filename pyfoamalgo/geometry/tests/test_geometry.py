@@ -6,6 +6,7 @@ import numpy as np
 
 from pyfoamalgo.config import __XFEL_IMAGE_DTYPE__ as IMAGE_DTYPE
 from pyfoamalgo.config import __XFEL_RAW_IMAGE_DTYPE__ as RAW_IMAGE_DTYPE
+from pyfoamalgo import BufferPool
 from pyfoamalgo.geometry import EPix100Geometry, JungFrauGeometry
 from pyfoamalgo.geometry.geometry_utils import StackView
 
@@ -83,6 +84,21 @@ class TestJungFrauGeometry:
             geom.position_all_modules(modules, assembled)
             assert assembled_shape_gt == assembled.shape[-2:]
 
+    def testOutputArrayFromPool(self):
+        geom = self.geom_21_stack
+        pool = BufferPool()
+
+        assembled = geom.output_array_for_position_fast((self.n_pulses,), pool=pool)
+        assembled.fill(1)
+        pool.put(assembled)
+        recycled = geom.output_array_for_position_fast((self.n_pulses,), pool=pool)
+        assert recycled is assembled
+        assert np.isnan(recycled).all()
+
+        mask = geom.output_array_for_dismantle_fast((self.n_pulses,), bool, pool=pool)
+        assert (self.n_pulses, 2, *self.module_shape) == mask.shape
+        assert not mask.any()
+
     @pytest.mark.parametrize("src_dtype,dst_dtype",
                              [(IMAGE_DTYPE, IMAGE_DTYPE),
                               (RAW_IMAGE_DTYPE, IMAGE_DTYPE)])
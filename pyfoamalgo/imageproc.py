@@ -7,10 +7,13 @@ Author: Jun Zhu <jun.zhu@xfel.eu>, Ebad Kamil <ebad.kamil@xfel.eu>
 Copyright (C) European X-Ray Free-Electron Laser Facility GmbH.
 All rights reserved.
 """
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
 from pyfoamalgo.lib.imageproc import (
-    nanmeanImageArray,
+    nanmeanImageArray, nanAccumulateImageArray,
+    nanmedianImageArray, nanpercentileImageArray,
     imageDataNanMask, maskImageDataNan, maskImageDataZero,
     correctGain, correctOffset, correctDsscOffset, correctGainOffset
 )
@@ -18,6 +21,9 @@ from pyfoamalgo.lib.imageproc import (
 __all__ = [
     'nanmean_image_data',
     'nanmean_images',
+    'nanmean_image_chunks',
+    'nanmedian_image_data',
+    'nanpercentile_image_data',
     'correct_image_data',
     'mask_image_data',
 ]
@@ -30,7 +36,8 @@ def nanmean_image_data(data, *, kept=None):
         copy will be returned. This seemingly awkward 'feature' is a sugar for
         having clean code in EXtra-foam in order to deal train- and
         pulse-resolved detectors at the same time.
-    :param None/list kept: Indices of the kept images.
+    :param None/list/numpy.ndarray kept: Indices of the kept images,
+        e.g. IndexSet.as_array().
 
     :return: nanmean of the input data.
     :rtype: numpy.ndarray.
@@ -44,6 +51,50 @@ def nanmean_image_data(data, *, kept=None):
     return nanmeanImageArray(data, kept)
 
 
+def nanmedian_image_data(data, *, kept=None):
+    """Compute pixel-wise nanmedian of an array of images.
+
+    :param numpy.array data: a 2D or 3D array. If the input is a 2D array, a
+        copy will be returned.
+    :param None/list/numpy.ndarray kept: Indices of the kept images,
+        e.g. IndexSet.as_array().
+
+    :return: nanmedian of the input data.
+    :rtype: numpy.ndarray.
+    """
+    if data.ndim == 2:
+        return data.copy()
+
+    if kept is None:
+        return nanmedianImageArray(data)
+
+    return nanmedianImageArray(data, kept)
+
+
+def nanpercentile_image_data(data, q, *, kept=None):
+    """Compute pixel-wise q-th nanpercentile of an array of images.
+
+    The percentile is linearly interpolated between the two nearest ranks,
+    which is the default method of numpy.nanpercentile.
+
+    :param numpy.array data: a 2D or 3D array. If the input is a 2D array, a
+        copy will be returned.
+    :param float q: Percentile, which must be within [0, 100].
+    :param None/list/numpy.ndarray kept: Indices of the kept images,
+        e.g. IndexSet.as_array().
+
+    :return: nanpercentile of the input data.
+    :rtype: numpy.ndarray.
+    """
+    if data.ndim == 2:
+        return data.copy()
+
+    if kept is None:
+        return nanpercentileImageArray(data, q)
+
+    return nanpercentileImageArray(data, q, kept)
+
+
 def nanmean_images(image1, image2):
     """Compute nanmean of two images.
 
@@ -58,6 +109,58 @@ def nanmean_images(image1, image2):
     return nanmeanImageArray(image1, image2)
 
 
+def nanmean_image_chunks(data, *, chunk_size=64):
+    """Compute nanmean of a stack of images which does not fit into memory.
+
+    The stack is reduced chunk by chunk and the next chunk is loaded on a
+    background thread while the current one is being reduced. The sum is
+    accumulated in float64, so that the result equals the one of
+    nanmean_image_data within float tolerance.
+
+    :param numpy.array/iterable data: a 3D array-like, e.g. numpy.memmap
+        or h5py.Dataset, which will be split into chunks along the first
+        axis, or an iterable of 3D arrays. Shape = (indices, y, x)
+    :param int chunk_size: Number of images in a chunk. Only used if
+        data is a 3D array-like.
+
+    :return: nanmean of the input data.
+    :rtype: numpy.ndarray.
+
+    :raise ValueError: If data does not contain any image.
+    """
+    if getattr(data, "ndim", None) == 3:
+        chunks = (data[i:i + chunk_size]
+                  for i in range(0, data.shape[0], chunk_size))
+    else:
+        chunks = iter(data)
+
+    def _load():
+        chunk = next(chunks, None)
+        return None if chunk is None else np.ascontiguousarray(chunk)
+
+    s = count = dtype = None
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(_load)
+        while True:
+            chunk = future.result()
+            if chunk is None:
+                break
+            future = executor.submit(_load)
+
+            if s is None:
+                dtype = chunk.dtype
+                s = np.zeros(chunk.shape[1:], dtype=np.float64)
+                count = np.zeros(chunk.shape[1:], dtype=np.uint64)
+            nanAccumulateImageArray(chunk, s, count)
+
+    if s is None:
+        raise ValueError("Input data does not contain any image!")
+
+    mean = np.full_like(s, np.nan)
+    np.divide(s, count, out=mean, where=count > 0)
+    return mean.astype(dtype, copy=False)
+
+
 def correct_image_data(data, *,
                        gain=None,
                        offset=None,
@@ -0,0 +1,108 @@
+/**
+ * Distributed under the terms of the GNU General Public License v3.0.
+ *
+ * The full license is in the file LICENSE, distributed with this software.
+ *
+ * Copyright (C) 2020, Jun Zhu. All rights reserved.
+ */
+#include "pybind11/pybind11.h"
+#include "pybind11/stl.h"
+
+#include "foamalgo/calibration.hpp"
+#include "foamalgo/geometry.hpp"
+#include "pyconfig.hpp"
+
+namespace py = pybind11;
+
+
+template<typename T>
+void declareDarkBuilder(py::module& m)
+{
+  using Builder = foam::DarkBuilder<T>;
+
+  std::string py_class_name = "DarkBuilder";
+  py::class_<Builder> cls(m, py_class_name.c_str());
+
+  cls.def(py::init<size_t, size_t, size_t>(), py::arg("n_cells"), py::arg("h"), py::arg("w"))
+    .def("nextPass", &Builder::nextPass, py::arg("sigma"))
+    .def("reset", &Builder::reset)
+    .def("offset", &Builder::offset)
+    .def("noise", &Builder::noise)
+    .def("count", &Builder::count)
+    .def("badPixelMask", &Builder::badPixelMask,
+         py::arg("offset_lb"), py::arg("offset_ub"), py::arg("noise_lb"), py::arg("noise_ub"))
+    .def("nPasses", &Builder::nPasses)
+    .def("shape", &Builder::shape);
+
+#define FOAM_DARK_BUILDER_UPDATE(DTYPE)                                                             \
+  cls.def("update",                                                                                 \
+    (void (Builder::*)(const xt::pytensor<DTYPE, 3>&)) &Builder::update,                            \
+    py::arg("src").noconvert(), py::call_guard<py::gil_scoped_release>());                          \
+  cls.def("update",                                                                                 \
+    (void (Builder::*)(const xt::pytensor<DTYPE, 3>&, const std::vector<size_t>&)) &Builder::update, \
+    py::arg("src").noconvert(), py::arg("cell_ids"), py::call_guard<py::gil_scoped_release>());
+
+  FOAM_DARK_BUILDER_UPDATE(uint16_t)
+  FOAM_DARK_BUILDER_UPDATE(float)
+}
+
+
+PYBIND11_MODULE(calibration, m)
+{
+  xt::import_numpy();
+
+  m.doc() = "A collection of detector calibration functions.";
+
+  declareDarkBuilder<float>(m);
+
+  //
+  // common-mode correction
+  //
+
+#define FOAM_CORRECT_COMMON_MODE_IMPL(DETECTOR, METHOD, VALUE_TYPE, N_DIM)                               \
+  m.def("correct" #DETECTOR "CommonMode" #METHOD,                                                       \
+    (void (*)(xt::pytensor<VALUE_TYPE, N_DIM>&, VALUE_TYPE, bool))                                      \
+    &foam::correctCommonMode<foam::DETECTOR, foam::METHOD##CommonModePolicy,                            \
+                             xt::pytensor<VALUE_TYPE, N_DIM>>,                                          \
+    py::arg("src").noconvert(), py::arg("threshold"), py::arg("per_row"));                              \
+  m.def("correct" #DETECTOR "CommonMode" #METHOD,                                                       \
+    (void (*)(xt::pytensor<VALUE_TYPE, N_DIM>&, const xt::pytensor<bool, 2>&, VALUE_TYPE, bool))        \
+    &foam::correctCommonMode<foam::DETECTOR, foam::METHOD##CommonModePolicy,                            \
+                             xt::pytensor<VALUE_TYPE, N_DIM>, xt::pytensor<bool, 2>>,                   \
+    py::arg("src").noconvert(), py::arg("mask").noconvert(), py::arg("threshold"), py::arg("per_row"));
+
+#define FOAM_CORRECT_COMMON_MODE(DETECTOR)                                                              \
+  FOAM_CORRECT_COMMON_MODE_IMPL(DETECTOR, Median, float, 2)                                             \
+  FOAM_CORRECT_COMMON_MODE_IMPL(DETECTOR, Median, float, 3)                                             \
+  FOAM_CORRECT_COMMON_MODE_IMPL(DETECTOR, Mean, float, 2)                                               \
+  FOAM_CORRECT_COMMON_MODE_IMPL(DETECTOR, Mean, float, 3)
+
+  FOAM_CORRECT_COMMON_MODE(JungFrau)
+  FOAM_CORRECT_COMMON_MODE(EPix100)
+
+  //
+  // multi-gain correction
+  //
+
+#define FOAM_CORRECT_MULTI_GAIN_IMPL(VALUE_TYPE, STAGE_TYPE)                                             \
+  m.def("correctMultiGainImageData",                                                                     \
+    (void (*)(const xt::pytensor<VALUE_TYPE, 3>&, const xt::pytensor<STAGE_TYPE, 3>&,                    \
+              const xt::pytensor<float, 4>&, const xt::pytensor<float, 4>&, xt::pytensor<float, 3>&))    \
+    &foam::correctMultiGainImageData<xt::pytensor<VALUE_TYPE, 3>, xt::pytensor<STAGE_TYPE, 3>,           \
+                                     xt::pytensor<float, 4>, xt::pytensor<float, 3>>,                    \
+    py::arg("src").noconvert(), py::arg("stages").noconvert(),                                           \
+    py::arg("gain").noconvert(), py::arg("offset").noconvert(), py::arg("out").noconvert(),              \
+    py::call_guard<py::gil_scoped_release>());                                                           \
+  m.def("correctMultiGainImageData",                                                                     \
+    (void (*)(const xt::pytensor<VALUE_TYPE, 3>&, const xt::pytensor<STAGE_TYPE, 3>&,                    \
+              const xt::pytensor<float, 4>&, const xt::pytensor<float, 4>&,                              \
+              const std::vector<size_t>&, xt::pytensor<float, 3>&))                                      \
+    &foam::correctMultiGainImageData<xt::pytensor<VALUE_TYPE, 3>, xt::pytensor<STAGE_TYPE, 3>,           \
+                                     xt::pytensor<float, 4>, xt::pytensor<float, 3>>,                    \
+    py::arg("src").noconvert(), py::arg("stages").noconvert(),                                           \
+    py::arg("gain").noconvert(), py::arg("offset").noconvert(), py::arg("cell_ids"),                     \
+    py::arg("out").noconvert(), py::call_guard<py::gil_scoped_release>());
+
+  FOAM_CORRECT_MULTI_GAIN_IMPL(uint16_t, uint8_t)
+  FOAM_CORRECT_MULTI_GAIN_IMPL(float, uint8_t)
+}
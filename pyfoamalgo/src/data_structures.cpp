@@ -0,0 +1,189 @@
+/**
+ * Distributed under the terms of the GNU General Public License v3.0.
+ *
+ * The full license is in the file LICENSE, distributed with this software.
+ *
+ * Copyright (C) 2020, Jun Zhu. All rights reserved.
+ */
+#include <iterator>
+#include <memory>
+#include <vector>
+
+#include "pybind11/pybind11.h"
+#include "pybind11/numpy.h"
+
+#include "foamalgo/data_structures.hpp"
+#include "pyconfig.hpp"
+
+namespace py = pybind11;
+
+
+template<typename T>
+void declareOneWayAccuPairSequence(py::module& m, const std::string& py_class_name)
+{
+  using Sequence = foam::OneWayAccuPairSequence<T>;
+  using Point = typename Sequence::PointType;
+
+  PYBIND11_NUMPY_DTYPE_EX(Point, x_avg, "x", y_avg, "avg", y_min, "min", y_max, "max",
+                          y_std, "std", count, "count");
+
+  py::class_<Sequence> cls(m, py_class_name.c_str());
+
+  cls.def(py::init<double, size_t, size_t>(),
+          py::arg("resolution"), py::arg("max_len"), py::arg("min_count"))
+    .def("append", &Sequence::append, py::arg("x"), py::arg("y"))
+    .def("appendDry", &Sequence::appendDry, py::arg("x"))
+    .def("reset", &Sequence::reset)
+    .def("start", &Sequence::start)
+    .def("size", &Sequence::size)
+    // the storage is exposed as a structured array without copying
+    .def("points", [] (py::object self)
+    {
+      const auto& points = self.cast<const Sequence&>().points();
+      return py::array_t<Point>({points.size()}, {sizeof(Point)}, points.data(), self);
+    })
+    .def("state", [] (const Sequence& self)
+    {
+      auto state = self.state();
+      return py::make_tuple(state.i0, state.len, state.last,
+                            py::array_t<Point>(state.points.size(), state.points.data()),
+                            py::array_t<T>(state.m2.size(), state.m2.data()));
+    })
+    .def("setState", [] (Sequence& self, size_t i0, size_t len, size_t last,
+                         py::array_t<Point, py::array::c_style> points,
+                         py::array_t<T, py::array::c_style> m2)
+    {
+      self.setState(typename Sequence::State {
+        i0, len, last,
+        typename Sequence::ContainerType(points.data(), points.data() + points.size()),
+        std::vector<T>(m2.data(), m2.data() + m2.size())
+      });
+    }, py::arg("i0"), py::arg("len"), py::arg("last"), py::arg("points"), py::arg("m2"));
+
+  cls.def("extend",
+    &Sequence::template extend<xt::pytensor<double, 1>, xt::pytensor<double, 1>>,
+    py::arg("xs").noconvert(), py::arg("ys").noconvert(), py::call_guard<py::gil_scoped_release>());
+}
+
+
+/**
+ * Expose a shared map as a numpy array without copying.
+ *
+ * The array keeps the storage alive.
+ */
+template<typename T>
+py::array_t<T> sharedMap(std::shared_ptr<const xt::xtensor<T, 2>> map)
+{
+  using Holder = std::shared_ptr<const xt::xtensor<T, 2>>;
+
+  auto shape = map->shape();
+  const T* ptr = map->data();
+  py::capsule base(new Holder(std::move(map)), [] (void* p) { delete static_cast<Holder*>(p); });
+  return py::array_t<T>({shape[0], shape[1]}, ptr, base);
+}
+
+
+/**
+ * SpscQueue of Python objects.
+ *
+ * The queue owns a reference to each item. References are only changed
+ * while holding the GIL, which is released during waiting.
+ */
+class SpscObjectQueue
+{
+  foam::SpscQueue<PyObject*> queue_;
+
+public:
+
+  explicit SpscObjectQueue(size_t capacity) : queue_(capacity) {}
+
+  ~SpscObjectQueue() { clear(); }
+
+  bool put(py::object item, double timeout)
+  {
+    PyObject* ptr = item.release().ptr();
+    bool success;
+    {
+      py::gil_scoped_release release;
+      success = queue_.push(ptr, timeout);
+    }
+    if (!success) Py_DECREF(ptr);
+    return success;
+  }
+
+  void putPop(py::object item)
+  {
+    PyObject* dropped;
+    if (queue_.pushPop(item.release().ptr(), dropped)) Py_DECREF(dropped);
+  }
+
+  py::list getMany(size_t n, double timeout)
+  {
+    std::vector<PyObject*> items;
+    items.reserve(std::min(n, queue_.capacity()));
+    {
+      py::gil_scoped_release release;
+      queue_.popMany(std::back_inserter(items), n, timeout);
+    }
+
+    py::list ret;
+    for (auto ptr : items) ret.append(py::reinterpret_steal<py::object>(ptr));
+    return ret;
+  }
+
+  void clear()
+  {
+    PyObject* ptr;
+    while (queue_.tryPop(ptr)) Py_DECREF(ptr);
+  }
+
+  size_t size() const { return queue_.size(); }
+
+  bool empty() const { return queue_.empty(); }
+
+  bool full() const { return queue_.full(); }
+
+  size_t capacity() const { return queue_.capacity(); }
+};
+
+
+PYBIND11_MODULE(data_structures, m)
+{
+  xt::import_numpy();
+
+  m.doc() = "A collection of data structures.";
+
+  declareOneWayAccuPairSequence<double>(m, "OneWayAccuPairSequence");
+  declareOneWayAccuPairSequence<float>(m, "OneWayAccuPairSequenceF");
+
+  using foam::BinnedAccumulator2d;
+  using Vector = xt::pytensor<double, 1>;
+
+  py::class_<BinnedAccumulator2d>(m, "BinnedAccumulator2d")
+    .def(py::init<double, double, size_t, double, double, size_t, bool, size_t>(),
+         py::arg("x_left"), py::arg("x_right"), py::arg("x_bins"),
+         py::arg("y_left"), py::arg("y_right"), py::arg("y_bins"),
+         py::arg("auto_grow"), py::arg("max_bins"))
+    .def("update", (void (BinnedAccumulator2d::*)(double, double, double)) &BinnedAccumulator2d::update,
+         py::arg("x"), py::arg("y"), py::arg("v"))
+    .def("update", &BinnedAccumulator2d::update<Vector, Vector, Vector>,
+         py::arg("xs").noconvert(), py::arg("ys").noconvert(), py::arg("vs").noconvert(),
+         py::call_guard<py::gil_scoped_release>())
+    .def("reset", &BinnedAccumulator2d::reset)
+    .def("xEdges", &BinnedAccumulator2d::xEdges)
+    .def("yEdges", &BinnedAccumulator2d::yEdges)
+    .def("count", [] (const BinnedAccumulator2d& self) { return sharedMap(self.count()); })
+    .def("mean", [] (const BinnedAccumulator2d& self) { return sharedMap(self.mean()); })
+    .def("stdDev", [] (const BinnedAccumulator2d& self) { return sharedMap(self.stdDev()); });
+
+  py::class_<SpscObjectQueue>(m, "SpscQueue")
+    .def(py::init<size_t>(), py::arg("capacity"))
+    .def("put", &SpscObjectQueue::put, py::arg("item"), py::arg("timeout"))
+    .def("putPop", &SpscObjectQueue::putPop, py::arg("item"))
+    .def("getMany", &SpscObjectQueue::getMany, py::arg("n"), py::arg("timeout"))
+    .def("clear", &SpscObjectQueue::clear)
+    .def("size", &SpscObjectQueue::size)
+    .def("empty", &SpscObjectQueue::empty)
+    .def("full", &SpscObjectQueue::full)
+    .def("capacity", &SpscObjectQueue::capacity);
+}
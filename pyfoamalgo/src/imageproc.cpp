@@ -5,6 +5,8 @@
  *
  * Copyright (C) 2020, Jun Zhu. All rights reserved.
  */
+#include <vector>
+
 #include "pybind11/pybind11.h"
 #include "pybind11/stl.h"
 
@@ -16,6 +18,16 @@
 namespace py = pybind11;
 
 
+/**
+ * Convert an array of indices, e.g. IndexSet.as_array(), without iterating
+ * over Python objects.
+ */
+inline std::vector<size_t> toIndices(const xt::pytensor<size_t, 1>& keep)
+{
+  return std::vector<size_t>(keep.begin(), keep.end());
+}
+
+
 PYBIND11_MODULE(imageproc, m)
 {
   xt::import_numpy();
@@ -29,6 +41,10 @@ PYBIND11_MODULE(imageproc, m)
     { return nanmeanImageArray(src); }, py::arg("src").noconvert());
 
 #define FOAM_NANMEAN_IMAGE_ARRAY_WITH_FILTER_IMPL(VALUE_TYPE)                                   \
+  m.def("nanmeanImageArray",                                                                    \
+    [] (const xt::pytensor<VALUE_TYPE, 3>& src, const xt::pytensor<size_t, 1>& keep)            \
+    { return nanmeanImageArray(src, toIndices(keep)); },                                        \
+    py::arg("src").noconvert(), py::arg("keep").noconvert());                                   \
   m.def("nanmeanImageArray",                                                                    \
     [] (const xt::pytensor<VALUE_TYPE, 3>& src, const std::vector<size_t>& keep)                \
     { return nanmeanImageArray(src, keep); }, py::arg("src").noconvert(), py::arg("keep"));
@@ -48,6 +64,41 @@ PYBIND11_MODULE(imageproc, m)
   FOAM_NANMEAN_IMAGE_ARRAY_WITH_FILTER_IMPL(double)
   FOAM_NANMEAN_IMAGE_ARRAY_BINARY_IMPL(double)
 
+#define FOAM_NANMEDIAN_IMAGE_ARRAY_IMPL(VALUE_TYPE)                                                      \
+  m.def("nanmedianImageArray", [] (const xt::pytensor<VALUE_TYPE, 3>& src)                              \
+    { return nanmedianImageArray(src); }, py::arg("src").noconvert());                                  \
+  m.def("nanmedianImageArray",                                                                          \
+    [] (const xt::pytensor<VALUE_TYPE, 3>& src, const xt::pytensor<size_t, 1>& keep)                    \
+    { return nanmedianImageArray(src, toIndices(keep)); },                                              \
+    py::arg("src").noconvert(), py::arg("keep").noconvert());                                           \
+  m.def("nanmedianImageArray",                                                                          \
+    [] (const xt::pytensor<VALUE_TYPE, 3>& src, const std::vector<size_t>& keep)                        \
+    { return nanmedianImageArray(src, keep); }, py::arg("src").noconvert(), py::arg("keep"));           \
+  m.def("nanpercentileImageArray", [] (const xt::pytensor<VALUE_TYPE, 3>& src, double q)                \
+    { return nanpercentileImageArray(src, q); }, py::arg("src").noconvert(), py::arg("q"));             \
+  m.def("nanpercentileImageArray",                                                                      \
+    [] (const xt::pytensor<VALUE_TYPE, 3>& src, double q, const xt::pytensor<size_t, 1>& keep)          \
+    { return nanpercentileImageArray(src, q, toIndices(keep)); },                                       \
+    py::arg("src").noconvert(), py::arg("q"), py::arg("keep").noconvert());                             \
+  m.def("nanpercentileImageArray",                                                                      \
+    [] (const xt::pytensor<VALUE_TYPE, 3>& src, double q, const std::vector<size_t>& keep)              \
+    { return nanpercentileImageArray(src, q, keep); },                                                  \
+    py::arg("src").noconvert(), py::arg("q"), py::arg("keep"));
+
+  FOAM_NANMEDIAN_IMAGE_ARRAY_IMPL(float)
+  FOAM_NANMEDIAN_IMAGE_ARRAY_IMPL(double)
+
+#define FOAM_NAN_ACCUMULATE_IMAGE_ARRAY_IMPL(VALUE_TYPE, SUM_TYPE)                                       \
+  m.def("nanAccumulateImageArray",                                                                      \
+    &nanAccumulateImageArray<xt::pytensor<VALUE_TYPE, 3>, xt::pytensor<SUM_TYPE, 2>,                    \
+                             xt::pytensor<uint64_t, 2>>,                                                \
+    py::arg("src").noconvert(), py::arg("sum").noconvert(), py::arg("count").noconvert(),               \
+    py::call_guard<py::gil_scoped_release>());
+
+  FOAM_NAN_ACCUMULATE_IMAGE_ARRAY_IMPL(float, float)
+  FOAM_NAN_ACCUMULATE_IMAGE_ARRAY_IMPL(float, double)
+  FOAM_NAN_ACCUMULATE_IMAGE_ARRAY_IMPL(double, double)
+
 #define FOAM_MOVING_AVG_IMAGE_DATA_IMPL(VALUE_TYPE, N_DIM)                                     \
   m.def("movingAvgImageData",                                                                  \
     &movingAvgImageData<xt::pytensor<VALUE_TYPE, N_DIM>>,                                      \
@@ -5,6 +5,8 @@
  *
  * Copyright (C) 2020, Jun Zhu. All rights reserved.
  */
+#include <string>
+#include <utility>
 #include <vector>
 
 #include "pybind11/pybind11.h"
@@ -57,21 +59,260 @@ PYBIND11_MODULE(statistics, m)
   FOAM_NAN_REDUCER(nanmin)
   FOAM_NAN_REDUCER(nanmax)
 
+#define FOAM_PARALLEL_NAN_REDUCER_IMP(REDUCER, POLICY, VALUE_TYPE)                                 \
+  m.def(#REDUCER "All", [] (const xt::pytensor<VALUE_TYPE, 1>& src)                               \
+  {                                                                                               \
+    return nanreduce<POLICY>(src);                                                                \
+  }, py::arg("src").noconvert(), py::call_guard<py::gil_scoped_release>());                       \
+  m.def(#REDUCER "Axis0", [] (const xt::pytensor<VALUE_TYPE, 2>& src,                             \
+                              xt::pytensor<VALUE_TYPE, 1>& out)                                   \
+  {                                                                                               \
+    nanreduceAxis0<POLICY>(src, out);                                                             \
+  }, py::arg("src").noconvert(), py::arg("out").noconvert(),                                      \
+     py::call_guard<py::gil_scoped_release>());                                                   \
+  m.def(#REDUCER "Axis1", [] (const xt::pytensor<VALUE_TYPE, 2>& src,                             \
+                              xt::pytensor<VALUE_TYPE, 1>& out)                                   \
+  {                                                                                               \
+    nanreduceAxis1<POLICY>(src, out);                                                             \
+  }, py::arg("src").noconvert(), py::arg("out").noconvert(),                                      \
+     py::call_guard<py::gil_scoped_release>());
+
+#define FOAM_PARALLEL_NAN_REDUCER(REDUCER, POLICY)                                                 \
+  FOAM_PARALLEL_NAN_REDUCER_IMP(REDUCER, POLICY, float)                                           \
+  FOAM_PARALLEL_NAN_REDUCER_IMP(REDUCER, POLICY, double)
+
+  FOAM_PARALLEL_NAN_REDUCER(nansum, NansumPolicy)
+  FOAM_PARALLEL_NAN_REDUCER(nanmean, NanmeanPolicy)
+  FOAM_PARALLEL_NAN_REDUCER(nanstd, NanstdPolicy)
+  FOAM_PARALLEL_NAN_REDUCER(nanvar, NanvarPolicy)
+  FOAM_PARALLEL_NAN_REDUCER(nanmin, NanminPolicy)
+  FOAM_PARALLEL_NAN_REDUCER(nanmax, NanmaxPolicy)
+
+#define FOAM_WEIGHTED_NAN_REDUCER_IMP(REDUCER, POLICY, VALUE_TYPE)                                 \
+  m.def(#REDUCER "All", [] (const xt::pytensor<VALUE_TYPE, 2>& src,                               \
+                            const xt::pytensor<bool, 1>& mask,                                    \
+                            const xt::pytensor<double, 1>& weights)                               \
+  {                                                                                               \
+    return nanreduce<POLICY>(src, mask, weights);                                                 \
+  }, py::arg("src").noconvert(), py::arg("mask").noconvert(), py::arg("weights").noconvert(),     \
+     py::call_guard<py::gil_scoped_release>());                                                   \
+  m.def(#REDUCER "Axis0", [] (const xt::pytensor<VALUE_TYPE, 2>& src,                             \
+                              const xt::pytensor<bool, 1>& mask,                                  \
+                              const xt::pytensor<double, 1>& weights,                             \
+                              xt::pytensor<VALUE_TYPE, 1>& out)                                   \
+  {                                                                                               \
+    nanreduceAxis0<POLICY>(src, mask, weights, out);                                              \
+  }, py::arg("src").noconvert(), py::arg("mask").noconvert(), py::arg("weights").noconvert(),     \
+     py::arg("out").noconvert(), py::call_guard<py::gil_scoped_release>());                       \
+  m.def(#REDUCER "Axis1", [] (const xt::pytensor<VALUE_TYPE, 2>& src,                             \
+                              const xt::pytensor<bool, 1>& mask,                                  \
+                              const xt::pytensor<double, 1>& weights,                             \
+                              xt::pytensor<VALUE_TYPE, 1>& out)                                   \
+  {                                                                                               \
+    nanreduceAxis1<POLICY>(src, mask, weights, out);                                              \
+  }, py::arg("src").noconvert(), py::arg("mask").noconvert(), py::arg("weights").noconvert(),     \
+     py::arg("out").noconvert(), py::call_guard<py::gil_scoped_release>());
+
+#define FOAM_WEIGHTED_NAN_REDUCER(REDUCER, POLICY)                                                 \
+  FOAM_WEIGHTED_NAN_REDUCER_IMP(REDUCER, POLICY, float)                                           \
+  FOAM_WEIGHTED_NAN_REDUCER_IMP(REDUCER, POLICY, double)
+
+  FOAM_WEIGHTED_NAN_REDUCER(nansum, NansumPolicy)
+  FOAM_WEIGHTED_NAN_REDUCER(nanmean, NanmeanPolicy)
+  FOAM_WEIGHTED_NAN_REDUCER(nanstd, NanstdPolicy)
+  FOAM_WEIGHTED_NAN_REDUCER(nanvar, NanvarPolicy)
+
+#define FOAM_NAN_DESCRIBE_IMP(VALUE_TYPE)                                                         \
+  m.def("nanDescribe", [] (const xt::pytensor<VALUE_TYPE, 1>& src)                                \
+  {                                                                                               \
+    return nanDescribe(src);                                                                      \
+  }, py::arg("src").noconvert(), py::call_guard<py::gil_scoped_release>());                       \
+  m.def("nanDescribeAxis0", [] (const xt::pytensor<VALUE_TYPE, 2>& src,                           \
+                                xt::pytensor<int64_t, 1>& count,                                  \
+                                xt::pytensor<VALUE_TYPE, 2>& stats)                               \
+  {                                                                                               \
+    nanDescribeAxis0(src, count, stats);                                                          \
+  }, py::arg("src").noconvert(), py::arg("count").noconvert(), py::arg("stats").noconvert(),      \
+     py::call_guard<py::gil_scoped_release>());                                                   \
+  m.def("nanDescribeAxis1", [] (const xt::pytensor<VALUE_TYPE, 2>& src,                           \
+                                xt::pytensor<int64_t, 1>& count,                                  \
+                                xt::pytensor<VALUE_TYPE, 2>& stats)                               \
+  {                                                                                               \
+    nanDescribeAxis1(src, count, stats);                                                          \
+  }, py::arg("src").noconvert(), py::arg("count").noconvert(), py::arg("stats").noconvert(),      \
+     py::call_guard<py::gil_scoped_release>());
+
+  FOAM_NAN_DESCRIBE_IMP(float)
+  FOAM_NAN_DESCRIBE_IMP(double)
+
+#define FOAM_QUICK_MIN_MAX_IMP(VALUE_TYPE, N_DIM)                                                 \
+  m.def("quickMinMax", [] (const xt::pytensor<VALUE_TYPE, N_DIM>& src, double q)                  \
+  {                                                                                               \
+    return quickMinMax(src, q);                                                                   \
+  }, py::arg("src").noconvert(), py::arg("q"), py::call_guard<py::gil_scoped_release>());
+
+  FOAM_QUICK_MIN_MAX_IMP(float, 2)
+  FOAM_QUICK_MIN_MAX_IMP(float, 3)
+  FOAM_QUICK_MIN_MAX_IMP(double, 2)
+  FOAM_QUICK_MIN_MAX_IMP(double, 3)
+
+  py::class_<KllSketch> kll(m, "KllSketch");
+
+  kll.def(py::init<size_t, unsigned int>(), py::arg("k"), py::arg("seed"))
+    .def("merge", &KllSketch::merge, py::arg("other"))
+    .def("quantile", &KllSketch::quantile, py::arg("q"))
+    .def("quantiles", &KllSketch::quantiles, py::arg("qs"))
+    .def("cdf", &KllSketch::cdf, py::arg("v"))
+    .def("reset", &KllSketch::reset)
+    .def("k", &KllSketch::k)
+    .def("count", &KllSketch::count)
+    .def("size", &KllSketch::size)
+    .def("min", &KllSketch::min)
+    .def("max", &KllSketch::max)
+    .def("state", [] (const KllSketch& self)
+    {
+      auto state = self.state();
+      return py::make_tuple(state.count, state.min, state.max, state.compactors, state.rng);
+    })
+    .def("setState", [] (KllSketch& self, size_t count, double min, double max,
+                         std::vector<std::vector<double>> compactors, std::string rng)
+    {
+      self.setState(KllSketch::State { count, min, max, std::move(compactors), std::move(rng) });
+    }, py::arg("count"), py::arg("min"), py::arg("max"), py::arg("compactors"), py::arg("rng"));
+
+#define FOAM_KLL_SKETCH_UPDATE(VALUE_TYPE)                                                        \
+  kll.def("update",                                                                               \
+    (void (KllSketch::*)(const xt::pytensor<VALUE_TYPE, 1>&)) &KllSketch::update,                 \
+    py::arg("src").noconvert(), py::call_guard<py::gil_scoped_release>());
 
-#define FOAM_HISTOGRAM_IMP(VALUE_TYPE)                                                                \
-  m.def("histogram1d", [] (const xt::pytensor<VALUE_TYPE, 1>& src,                                    \
-                           VALUE_TYPE left,                                                           \
-                           VALUE_TYPE right,                                                          \
+  FOAM_KLL_SKETCH_UPDATE(float)
+  FOAM_KLL_SKETCH_UPDATE(double)
+
+  kll.def("update", (void (KllSketch::*)(double)) &KllSketch::update, py::arg("v"));
+
+  py::class_<RunningStats> running_stats(m, "RunningStats");
+
+  running_stats.def(py::init<size_t>(), py::arg("size"))
+    .def("merge", &RunningStats::merge, py::arg("other"))
+    .def("reset", &RunningStats::reset)
+    .def("size", &RunningStats::size)
+    .def("count", &RunningStats::count)
+    .def("mean", &RunningStats::mean)
+    .def("variance", &RunningStats::variance)
+    .def("min", &RunningStats::min)
+    .def("max", &RunningStats::max)
+    .def("state", &RunningStats::state)
+    .def("setState",
+         &RunningStats::template setState<const xt::pytensor<double, 2>&>,
+         py::arg("state").noconvert());
+
+#define FOAM_RUNNING_STATS_UPDATE(VALUE_TYPE)                                                     \
+  running_stats.def("update",                                                                     \
+    (void (RunningStats::*)(const xt::pytensor<VALUE_TYPE, 2>&)) &RunningStats::update,           \
+    py::arg("src").noconvert(), py::call_guard<py::gil_scoped_release>());
+
+  FOAM_RUNNING_STATS_UPDATE(float)
+  FOAM_RUNNING_STATS_UPDATE(double)
+
+  py::class_<PixelCorrelation> pixel_correlation(m, "PixelCorrelation");
+
+  pixel_correlation.def(py::init<size_t>(), py::arg("size"))
+    .def("merge", &PixelCorrelation::merge, py::arg("other"))
+    .def("reset", &PixelCorrelation::reset)
+    .def("size", &PixelCorrelation::size)
+    .def("count", &PixelCorrelation::count)
+    .def("covariance", &PixelCorrelation::covariance)
+    .def("correlation", &PixelCorrelation::correlation)
+    .def("slope", &PixelCorrelation::slope)
+    .def("state", &PixelCorrelation::state)
+    .def("setState",
+         &PixelCorrelation::template setState<const xt::pytensor<double, 2>&>,
+         py::arg("state").noconvert());
+
+#define FOAM_PIXEL_CORRELATION_UPDATE(VALUE_TYPE)                                                 \
+  pixel_correlation.def("update",                                                                 \
+    (void (PixelCorrelation::*)(const xt::pytensor<VALUE_TYPE, 2>&, const xt::pytensor<double, 1>&)) \
+    &PixelCorrelation::update,                                                                    \
+    py::arg("src").noconvert(), py::arg("ref").noconvert(), py::call_guard<py::gil_scoped_release>());
+
+  FOAM_PIXEL_CORRELATION_UPDATE(float)
+  FOAM_PIXEL_CORRELATION_UPDATE(double)
+
+
+#define FOAM_HISTOGRAM_IMP(VALUE_TYPE, N_DIM)                                                          \
+  m.def("histogram1d", [] (const xt::pytensor<VALUE_TYPE, N_DIM>& src,                                \
+                           double left,                                                               \
+                           double right,                                                              \
                            size_t bins)                                                               \
   {                                                                                                   \
-    return xt::histogram<long long>(src, bins, left, right);                                          \
-  }, py::arg("src").noconvert(), py::arg("left"), py::arg("right"), py::arg("bins"));
-
-  FOAM_HISTOGRAM_IMP(int)
-  FOAM_HISTOGRAM_IMP(unsigned int)
-  FOAM_HISTOGRAM_IMP(long long)
-  FOAM_HISTOGRAM_IMP(unsigned long long)
-  FOAM_HISTOGRAM_IMP(float)
-  FOAM_HISTOGRAM_IMP(double)
+    return histogram1d(src, left, right, bins);                                                       \
+  }, py::arg("src").noconvert(), py::arg("left"), py::arg("right"), py::arg("bins"),                  \
+     py::call_guard<py::gil_scoped_release>());                                                       \
+  m.def("histogram1d", [] (const xt::pytensor<VALUE_TYPE, N_DIM>& src,                                \
+                           const xt::pytensor<double, N_DIM>& weights,                                \
+                           double left,                                                               \
+                           double right,                                                              \
+                           size_t bins)                                                               \
+  {                                                                                                   \
+    return histogram1d(src, weights, left, right, bins);                                              \
+  }, py::arg("src").noconvert(), py::arg("weights").noconvert(),                                      \
+     py::arg("left"), py::arg("right"), py::arg("bins"), py::call_guard<py::gil_scoped_release>());
+
+#define FOAM_HISTOGRAM2D_IMP(VALUE_TYPE)                                                              \
+  m.def("histogram2d", [] (const xt::pytensor<VALUE_TYPE, 1>& x,                                      \
+                           const xt::pytensor<VALUE_TYPE, 1>& y,                                      \
+                           double x_left, double x_right, size_t x_bins,                              \
+                           double y_left, double y_right, size_t y_bins)                              \
+  {                                                                                                   \
+    return histogram2d(x, y, x_left, x_right, x_bins, y_left, y_right, y_bins);                       \
+  }, py::arg("x").noconvert(), py::arg("y").noconvert(),                                              \
+     py::arg("x_left"), py::arg("x_right"), py::arg("x_bins"),                                        \
+     py::arg("y_left"), py::arg("y_right"), py::arg("y_bins"),                                        \
+     py::call_guard<py::gil_scoped_release>());                                                       \
+  m.def("histogram2d", [] (const xt::pytensor<VALUE_TYPE, 1>& x,                                      \
+                           const xt::pytensor<VALUE_TYPE, 1>& y,                                      \
+                           const xt::pytensor<double, 1>& weights,                                    \
+                           double x_left, double x_right, size_t x_bins,                              \
+                           double y_left, double y_right, size_t y_bins)                              \
+  {                                                                                                   \
+    return histogram2d(x, y, weights, x_left, x_right, x_bins, y_left, y_right, y_bins);              \
+  }, py::arg("x").noconvert(), py::arg("y").noconvert(), py::arg("weights").noconvert(),              \
+     py::arg("x_left"), py::arg("x_right"), py::arg("x_bins"),                                        \
+     py::arg("y_left"), py::arg("y_right"), py::arg("y_bins"),                                        \
+     py::call_guard<py::gil_scoped_release>());
+
+#define FOAM_HISTOGRAM(VALUE_TYPE)                                                                    \
+  FOAM_HISTOGRAM_IMP(VALUE_TYPE, 1)                                                                   \
+  FOAM_HISTOGRAM_IMP(VALUE_TYPE, 2)                                                                   \
+  FOAM_HISTOGRAM2D_IMP(VALUE_TYPE)
+
+  FOAM_HISTOGRAM(int)
+  FOAM_HISTOGRAM(unsigned int)
+  FOAM_HISTOGRAM(long long)
+  FOAM_HISTOGRAM(unsigned long long)
+  FOAM_HISTOGRAM(float)
+  FOAM_HISTOGRAM(double)
+
+#define FOAM_NANHIST_WITH_STATS_IMP(VALUE_TYPE, N_DIM)                                                \
+  m.def("nanhistWithStats", [] (const xt::pytensor<VALUE_TYPE, N_DIM>& src,                           \
+                                double lb,                                                            \
+                                double ub,                                                            \
+                                size_t n_bins)                                                        \
+  {                                                                                                   \
+    return nanhistWithStats(src, lb, ub, n_bins);                                                     \
+  }, py::arg("src").noconvert(), py::arg("lb"), py::arg("ub"), py::arg("n_bins"),                     \
+     py::call_guard<py::gil_scoped_release>());
+
+#define FOAM_NANHIST_WITH_STATS(VALUE_TYPE)                                                           \
+  FOAM_NANHIST_WITH_STATS_IMP(VALUE_TYPE, 1)                                                          \
+  FOAM_NANHIST_WITH_STATS_IMP(VALUE_TYPE, 2)                                                          \
+  FOAM_NANHIST_WITH_STATS_IMP(VALUE_TYPE, 3)
+
+  FOAM_NANHIST_WITH_STATS(int)
+  FOAM_NANHIST_WITH_STATS(unsigned int)
+  FOAM_NANHIST_WITH_STATS(long long)
+  FOAM_NANHIST_WITH_STATS(unsigned long long)
+  FOAM_NANHIST_WITH_STATS(float)
+  FOAM_NANHIST_WITH_STATS(double)
 
 }
@@ -6,6 +6,9 @@ The full license is in the file LICENSE, distributed with this software.
 Copyright (C) 2020, Jun Zhu. All rights reserved.
 """
 import math
+import warnings
+from collections import namedtuple
+
 import numpy as np
 
 from .imageproc import mask_image_data, nanmeanImageArray
@@ -17,6 +20,21 @@ from pyfoamalgo.lib.statistics import nanvar as _nanvar_cpp
 from pyfoamalgo.lib.statistics import nanmin as _nanmin_cpp
 from pyfoamalgo.lib.statistics import nanmax as _nanmax_cpp
 from pyfoamalgo.lib.statistics import histogram1d as _histogram1d_cpp
+from pyfoamalgo.lib.statistics import histogram2d as _histogram2d_cpp
+from pyfoamalgo.lib.statistics import nanhistWithStats as _nanhist_with_stats_cpp
+from pyfoamalgo.lib.statistics import nanDescribe as _nan_describe_cpp
+from pyfoamalgo.lib.statistics import quickMinMax as _quick_min_max_cpp
+from pyfoamalgo.lib.statistics import RunningStats as _RunningStatsCpp
+from pyfoamalgo.lib.statistics import PixelCorrelation as _PixelCorrelationCpp
+from pyfoamalgo.lib.statistics import nanDescribeAxis0, nanDescribeAxis1
+from pyfoamalgo.lib.statistics import (
+    nansumAll, nansumAxis0, nansumAxis1,
+    nanmeanAll, nanmeanAxis0, nanmeanAxis1,
+    nanstdAll, nanstdAxis0, nanstdAxis1,
+    nanvarAll, nanvarAxis0, nanvarAxis1,
+    nanminAll, nanminAxis0, nanminAxis1,
+    nanmaxAll, nanmaxAxis0, nanmaxAxis1
+)
 
 __all__ = [
     'hist_with_stats',
@@ -28,34 +46,282 @@ __all__ = [
     'nanvar',
     'nanmin',
     'nanmax',
+    'nan_describe',
+    'NanDescription',
+    'RunningStats',
+    'PixelCorrelation',
+    'pixel_correlation',
     'quick_min_max',
     'histogram1d',
+    'histogram2d',
 ]
 
+NanDescription = namedtuple(
+    'NanDescription', ['count', 'sum', 'mean', 'var', 'min', 'max'])
+
+_PARALLEL_NAN_REDUCERS = {
+    'nansum': (nansumAll, nansumAxis0, nansumAxis1),
+    'nanmean': (nanmeanAll, nanmeanAxis0, nanmeanAxis1),
+    'nanstd': (nanstdAll, nanstdAxis0, nanstdAxis1),
+    'nanvar': (nanvarAll, nanvarAxis0, nanvarAxis1),
+    'nanmin': (nanminAll, nanminAxis0, nanminAxis1),
+    'nanmax': (nanmaxAll, nanmaxAxis0, nanmaxAxis1),
+}
+
+
+def _reduced_axes(axis, ndim):
+    """Return the sorted non-negative axes to be reduced or None if invalid."""
+    if axis is None:
+        return tuple(range(ndim))
+
+    if isinstance(axis, int):
+        axis = (axis,)
+    try:
+        axes = sorted(ax + ndim if ax < 0 else ax for ax in axis)
+    except TypeError:
+        return None
+
+    if len(set(axes)) != len(axes) or not all(0 <= ax < ndim for ax in axes):
+        return None
+    return tuple(axes)
+
+
+def _to_out(ret, out):
+    """Copy the result to the output array if given.
+
+    :raise ValueError: If the output array has a different shape or the
+        result cannot be cast to its dtype, as numpy does.
+    """
+    if out is None:
+        return ret
+
+    shape, dtype = np.shape(ret), np.result_type(ret)
+    if out.shape != shape:
+        raise ValueError(f"Output array has shape {out.shape} but the "
+                         f"result has shape {shape}")
+    if not np.can_cast(dtype, out.dtype, casting='same_kind'):
+        raise ValueError(f"Result with dtype {dtype} cannot be cast to the "
+                         f"output array with dtype {out.dtype}")
+    out[...] = ret
+    return out
+
+
+def _reduction_view(a, axis):
+    """View an array as 1D or 2D for the multi-threaded C++ kernels.
+
+    The kernels only apply to a non-empty C-contiguous float array reduced
+    over all, leading or trailing axes, which can be viewed as a 1D or 2D
+    array without copying.
+
+    :return: (view, axis of the view to be reduced, shape of the result),
+        or None if the kernels do not apply. The axis is None if all the
+        axes are reduced.
+    """
+    if a.dtype not in __NAN_DTYPES__ or a.size == 0 or not a.flags.c_contiguous:
+        return None
+
+    axes = _reduced_axes(axis, a.ndim)
+    if axes is None:
+        return None
+
+    n = len(axes)
+    if n == a.ndim:
+        return a.reshape(-1), None, ()
+
+    if axes == tuple(range(n)):
+        ret_shape = a.shape[n:]
+        return a.reshape(-1, int(np.prod(ret_shape))), 0, ret_shape
+
+    if axes == tuple(range(a.ndim - n, a.ndim)):
+        ret_shape = a.shape[:a.ndim - n]
+        return a.reshape(int(np.prod(ret_shape)), -1), 1, ret_shape
+
+    return None
+
+
+def _parallel_nanreduce(name, a, axis, out, mask=None, weights=None):
+    """Reduce an array with the multi-threaded C++ kernels.
+
+    :param None/numpy.ndarray mask: Bool mask of the pixels returned by
+        _pixel_mask_weights. If given, weights must also be given.
+    :param None/numpy.ndarray weights: Float64 weights of the pixels
+        returned by _pixel_mask_weights.
+
+    :return: The result, or None if the kernels do not apply.
+    """
+    view = _reduction_view(a, axis)
+    if view is None:
+        return None
+    src, reduced_axis, ret_shape = view
+
+    args = ()
+    if mask is not None:
+        # the mask and the weights are broadcast to the columns of the
+        # 2D view, which must not split the pixel axes
+        if reduced_axis is None:
+            first = a.ndim - mask.ndim
+            src = a.reshape(-1, mask.size)
+        elif reduced_axis == 0:
+            first = a.ndim - len(ret_shape)
+        else:
+            first = len(ret_shape)
+        if first > a.ndim - mask.ndim:
+            return None
+        args = tuple(np.ascontiguousarray(
+            np.broadcast_to(arr, a.shape[first:])).reshape(-1)
+            for arr in (mask, weights))
+
+    reduce_all, reduce_axis0, reduce_axis1 = _PARALLEL_NAN_REDUCERS[name]
+    if reduced_axis is None:
+        return _to_out(reduce_all(src, *args), out)
+    reducer = reduce_axis0 if reduced_axis == 0 else reduce_axis1
+
+    if out is not None and out.dtype == a.dtype \
+            and out.shape == ret_shape and out.flags.c_contiguous:
+        reducer(src, *args, out.reshape(-1))
+        return out
+
+    ret = np.empty(ret_shape, dtype=a.dtype)
+    reducer(src, *args, ret.reshape(-1))
+    return _to_out(ret, out)
+
+
+def _pixel_mask_weights(a, mask, weights):
+    """Check and complete the mask and the weights of the pixels.
+
+    :return: (bool mask, float64 weights) with the same shape.
+
+    :raise ValueError: If the shapes of the mask and the weights are
+        different or not the shape of the trailing axes of the array.
+    """
+    pixel_shape = np.shape(mask if weights is None else weights)
+    for arr in (mask, weights):
+        if arr is not None and (np.shape(arr) != pixel_shape
+                                or len(pixel_shape) > a.ndim
+                                or a.shape[a.ndim - len(pixel_shape):] != pixel_shape):
+            raise ValueError(f"Shape of mask or weights {np.shape(arr)} is "
+                             f"not compatible with data shape {a.shape}")
+
+    if mask is None:
+        mask = np.zeros(pixel_shape, dtype=bool)
+    if weights is None:
+        weights = np.ones(pixel_shape, dtype=np.float64)
+    return np.asarray(mask, dtype=bool), np.asarray(weights, dtype=np.float64)
+
+
+def _masked_weighted_nanreduce(name, a, axis, mask, weights, out):
+    """Reduce an array with a mask and/or weights of the pixels, ignoring nan.
+
+    The mask and the weights are broadcast over the leading axes of the
+    array. Masked values and values with zero weight are ignored. The mean
+    is sum(w * a) / sum(w) and the variance is
+    sum(w * (a - mean)**2) / sum(w).
+    """
+    mask, weights = _pixel_mask_weights(a, mask, weights)
+
+    ret = _parallel_nanreduce(name, a, axis, out, mask, weights)
+    if ret is not None:
+        return ret
+
+    w = np.where(np.isnan(a) | mask, 0., weights)
+    x = np.where(w == 0, 0., a)
+    if name == 'nansum':
+        ret = np.sum(w * x, axis=axis)
+    else:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+
+            w_sum = np.sum(w, axis=axis, keepdims=True)
+            mean = np.sum(w * x, axis=axis, keepdims=True) / w_sum
+            if name == 'nanmean':
+                ret = mean
+            else:
+                ret = np.sum(w * (x - mean) ** 2, axis=axis, keepdims=True) / w_sum
+                if name == 'nanstd':
+                    ret = np.sqrt(ret)
+        # 0D array is converted to a scalar
+        ret = np.squeeze(ret, axis=axis)[()]
+
+    if a.dtype in __NAN_DTYPES__:
+        ret = ret.astype(a.dtype)
+    return _to_out(ret, out)
+
 
-def nansum(a, axis=None):
+def nan_describe(a, axis=None):
+    """Compute the count, sum, mean, variance, minimum and maximum, ignoring nan.
+
+    For float arrays, all the statistics are computed by the multi-threaded
+    C++ implementation in a single pass over the data when applicable.
+    Otherwise, it falls back to numpy.
+
+    :param numpy.ndarray a: Data array.
+    :param None/int/tuple axis: Axis or axes along which the statistics
+        are computed. The default is to compute the statistics of the
+        flattened array.
+
+    :return NanDescription: Named tuple (count, sum, mean, var, min, max).
+        The variance is the population variance, i.e. ddof = 0. If all the
+        values are nan, the sum is 0 and the other statistics are nan.
+    """
+    view = _reduction_view(a, axis)
+    if view is not None:
+        src, reduced_axis, ret_shape = view
+        if reduced_axis is None:
+            return NanDescription(*_nan_describe_cpp(src))
+
+        count = np.empty(ret_shape, dtype=np.int64)
+        stats = np.empty((5, *ret_shape), dtype=a.dtype)
+        describer = nanDescribeAxis0 if reduced_axis == 0 else nanDescribeAxis1
+        describer(src, count.reshape(-1), stats.reshape(5, -1))
+        return NanDescription(count, *stats)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return NanDescription(np.count_nonzero(~np.isnan(a), axis=axis),
+                              np.nansum(a, axis=axis),
+                              np.nanmean(a, axis=axis),
+                              np.nanvar(a, axis=axis),
+                              np.nanmin(a, axis=axis),
+                              np.nanmax(a, axis=axis))
+
+
+def nansum(a, axis=None, *, mask=None, weights=None, out=None):
     """Faster numpy.nansum.
 
-    It uses the C++ implementation when applicable. Otherwise, it falls
-    back to numpy.nansum.
+    It uses the multi-threaded C++ implementation with compensated
+    summation when applicable. Otherwise, it falls back to numpy.nansum.
 
     :param numpy.ndarray a: Data array.
     :param None/int/tuple axis: Axis or axes along which the sum is computed.
         The default is to compute the sum of the flattened array.
+    :param None/numpy.ndarray mask: Mask of the pixels, which has the
+        shape of the trailing axes of a, e.g. (y, x) for an array of images
+        with shape (pulses, y, x), and is broadcast over the leading axes.
+        Pixels being True are ignored.
+    :param None/numpy.ndarray weights: Weight of each pixel, which has the
+        same shape as mask. Pixels with zero weight are ignored.
+    :param None/numpy.ndarray out: Array to store the result.
     """
+    if mask is not None or weights is not None:
+        return _masked_weighted_nanreduce('nansum', a, axis, mask, weights, out)
+
+    ret = _parallel_nanreduce('nansum', a, axis, out)
+    if ret is not None:
+        return ret
+
     if a.dtype in __NAN_DTYPES__:
         if axis is None:
-            return _nansum_cpp(a)
-        return _nansum_cpp(a, axis=axis)
+            return _to_out(_nansum_cpp(a), out)
+        return _to_out(_nansum_cpp(a, axis=axis), out)
 
-    return np.nansum(a, axis=axis)
+    return np.nansum(a, axis=axis, out=out)
 
 
-def nanmean(a, axis=None):
+def nanmean(a, axis=None, *, mask=None, weights=None, out=None):
     """Faster numpy.nanmean.
 
-    It uses the C++ implementation when applicable. Otherwise, it falls
-    back to numpy.nanmean.
+    It uses the multi-threaded C++ implementation with compensated
+    summation when applicable. Otherwise, it falls back to numpy.nanmean.
 
     If the input array is an array of images, i.e. 3D array, one may
     want to check :func:`pyfoamalgo.nanmean_image_data`.
@@ -63,22 +329,36 @@ def nanmean(a, axis=None):
     :param numpy.ndarray a: Data array.
     :param None/int/tuple axis: Axis or axes along which the mean is computed.
         The default is to compute the mean of the flattened array.
+    :param None/numpy.ndarray mask: Mask of the pixels, which has the
+        shape of the trailing axes of a, e.g. (y, x) for an array of images
+        with shape (pulses, y, x), and is broadcast over the leading axes.
+        Pixels being True are ignored.
+    :param None/numpy.ndarray weights: Weight of each pixel, which has the
+        same shape as mask. Pixels with zero weight are ignored.
+    :param None/numpy.ndarray out: Array to store the result.
     """
+    if mask is not None or weights is not None:
+        return _masked_weighted_nanreduce('nanmean', a, axis, mask, weights, out)
+
+    ret = _parallel_nanreduce('nanmean', a, axis, out)
+    if ret is not None:
+        return ret
+
     if a.dtype in __NAN_DTYPES__:
         if axis == 0 and a.ndim == 3:
-            return nanmeanImageArray(a)
+            return _to_out(nanmeanImageArray(a), out)
         if axis is None:
-            return _nanmean_cpp(a)
-        return _nanmean_cpp(a, axis=axis)
+            return _to_out(_nanmean_cpp(a), out)
+        return _to_out(_nanmean_cpp(a, axis=axis), out)
 
-    return np.nanmean(a, axis=axis)
+    return np.nanmean(a, axis=axis, out=out)
 
 
-def nanstd(a, axis=None, *, normalized=False):
+def nanstd(a, axis=None, *, normalized=False, mask=None, weights=None, out=None):
     """Faster numpy.nanstd.
 
-    It uses the C++ implementation when applicable. Otherwise, it falls
-    back to numpy.nanstd.
+    It uses the multi-threaded C++ implementation when applicable.
+    Otherwise, it falls back to numpy.nanstd.
 
     :param numpy.ndarray a: Data array.
     :param None/int/tuple axis: Axis or axes along which the standard
@@ -86,25 +366,50 @@ def nanstd(a, axis=None, *, normalized=False):
         deviation of the flattened array.
     :param bool normalized: True for normalizing the result by nanmean
         along the same axis or axes.
+    :param None/numpy.ndarray mask: Mask of the pixels, which has the
+        shape of the trailing axes of a, e.g. (y, x) for an array of images
+        with shape (pulses, y, x), and is broadcast over the leading axes.
+        Pixels being True are ignored.
+    :param None/numpy.ndarray weights: Weight of each pixel, which has the
+        same shape as mask. Pixels with zero weight are ignored.
+    :param None/numpy.ndarray out: Array to store the result.
     """
-    if a.dtype in __NAN_DTYPES__:
-        if axis is None:
-            ret = _nanstd_cpp(a)
+    if mask is not None or weights is not None:
+        ret = _masked_weighted_nanreduce('nanstd', a, axis, mask, weights, out)
+        if normalized:
+            mean = nanmean(a, axis=axis, mask=mask, weights=weights)
+            if out is None:
+                return ret / mean
+            out /= mean
+        return ret
+
+    if normalized and _reduction_view(a, axis) is not None:
+        # the variance and the mean are computed in a single pass
+        desc = nan_describe(a, axis=axis)
+        return _to_out(np.sqrt(desc.var) / desc.mean, out)
+
+    ret = _parallel_nanreduce('nanstd', a, axis, out)
+    if ret is None:
+        if a.dtype in __NAN_DTYPES__:
+            if axis is None:
+                ret = _to_out(_nanstd_cpp(a), out)
+            else:
+                ret = _to_out(_nanstd_cpp(a, axis=axis), out)
         else:
-            ret = _nanstd_cpp(a, axis=axis)
-    else:
-        ret = np.nanstd(a, axis=axis)
+            ret = np.nanstd(a, axis=axis, out=out)
 
     if normalized:
-        return ret / nanmean(a, axis=axis)
+        if out is None:
+            return ret / nanmean(a, axis=axis)
+        out /= nanmean(a, axis=axis)
     return ret
 
 
-def nanvar(a, axis=None, *, normalized=False):
+def nanvar(a, axis=None, *, normalized=False, mask=None, weights=None, out=None):
     """Faster numpy.nanvar.
 
-    It uses the C++ implementation when applicable. Otherwise, it falls
-    back to numpy.nanvar.
+    It uses the multi-threaded C++ implementation when applicable.
+    Otherwise, it falls back to numpy.nanvar.
 
     :param numpy.ndarray a: Data array.
     :param None/int/tuple axis: Axis or axes along which the variance
@@ -112,95 +417,432 @@ def nanvar(a, axis=None, *, normalized=False):
         flattened array.
     :param bool normalized: True for normalizing the result by square of
         nanmean along the same axis or axes.
+    :param None/numpy.ndarray mask: Mask of the pixels, which has the
+        shape of the trailing axes of a, e.g. (y, x) for an array of images
+        with shape (pulses, y, x), and is broadcast over the leading axes.
+        Pixels being True are ignored.
+    :param None/numpy.ndarray weights: Weight of each pixel, which has the
+        same shape as mask. Pixels with zero weight are ignored.
+    :param None/numpy.ndarray out: Array to store the result.
     """
-    if a.dtype in __NAN_DTYPES__:
-        if axis is None:
-            ret = _nanvar_cpp(a)
+    if mask is not None or weights is not None:
+        ret = _masked_weighted_nanreduce('nanvar', a, axis, mask, weights, out)
+        if normalized:
+            mean = nanmean(a, axis=axis, mask=mask, weights=weights)
+            if out is None:
+                return ret / mean ** 2
+            out /= mean ** 2
+        return ret
+
+    if normalized and _reduction_view(a, axis) is not None:
+        # the variance and the mean are computed in a single pass
+        desc = nan_describe(a, axis=axis)
+        return _to_out(desc.var / desc.mean ** 2, out)
+
+    ret = _parallel_nanreduce('nanvar', a, axis, out)
+    if ret is None:
+        if a.dtype in __NAN_DTYPES__:
+            if axis is None:
+                ret = _to_out(_nanvar_cpp(a), out)
+            else:
+                ret = _to_out(_nanvar_cpp(a, axis=axis), out)
         else:
-            ret = _nanvar_cpp(a, axis=axis)
-    else:
-        ret = np.nanvar(a, axis=axis)
+            ret = np.nanvar(a, axis=axis, out=out)
 
     if normalized:
-        return ret / nanmean(a, axis=axis) ** 2
+        if out is None:
+            return ret / nanmean(a, axis=axis) ** 2
+        out /= nanmean(a, axis=axis) ** 2
     return ret
 
 
-def nanmin(a, axis=None):
+def nanmin(a, axis=None, *, out=None):
     """Faster numpy.nanmin.
 
-    It uses the C++ implementation when applicable. Otherwise, it falls
-    back to numpy.nanmin.
+    It uses the multi-threaded C++ implementation when applicable.
+    Otherwise, it falls back to numpy.nanmin.
 
     :param numpy.ndarray a: Data array.
     :param None/int/tuple axis: Axis or axes along which the mean is computed.
         The default is to compute the nanmin of the flattened array.
+    :param None/numpy.ndarray out: Array to store the result.
     """
+    ret = _parallel_nanreduce('nanmin', a, axis, out)
+    if ret is not None:
+        return ret
+
     if a.dtype in __NAN_DTYPES__:
         if axis is None:
-            return _nanmin_cpp(a)
-        return _nanmin_cpp(a, axis=axis)
+            return _to_out(_nanmin_cpp(a), out)
+        return _to_out(_nanmin_cpp(a, axis=axis), out)
 
-    return np.nanmin(a, axis=axis)
+    return np.nanmin(a, axis=axis, out=out)
 
 
-def nanmax(a, axis=None):
+def nanmax(a, axis=None, *, out=None):
     """Faster numpy.nanmax.
 
-    It uses the C++ implementation when applicable. Otherwise, it falls
-    back to numpy.nanmax.
+    It uses the multi-threaded C++ implementation when applicable.
+    Otherwise, it falls back to numpy.nanmax.
 
     :param numpy.ndarray a: Data array.
     :param None/int/tuple axis: Axis or axes along which the mean is computed.
         The default is to compute the nanmax of the flattened array.
+    :param None/numpy.ndarray out: Array to store the result.
     """
+    ret = _parallel_nanreduce('nanmax', a, axis, out)
+    if ret is not None:
+        return ret
+
     if a.dtype in __NAN_DTYPES__:
         if axis is None:
-            return _nanmax_cpp(a)
-        return _nanmax_cpp(a, axis=axis)
+            return _to_out(_nanmax_cpp(a), out)
+        return _to_out(_nanmax_cpp(a, axis=axis), out)
+
+    return np.nanmax(a, axis=axis, out=out)
+
+
+class _OnlineStatsMixin:
+    """Shape handling, merging and pickling of the online statistics.
+
+    The C++ implementation _CPP accumulates the statistics of the
+    flattened variables.
+    """
+    _CPP = None
+
+    def __init__(self, shape):
+        if isinstance(shape, int):
+            shape = (shape,)
+        self._shape = tuple(shape)
+        self._acc = self._CPP(int(np.prod(self._shape)))
+
+    @property
+    def shape(self):
+        """Shape of the variables."""
+        return self._shape
+
+    @staticmethod
+    def _to_float(data):
+        data = np.asarray(data)
+        if data.dtype not in __NAN_DTYPES__:
+            data = data.astype(np.float64)
+        return data
+
+    def _update(self, data, *args):
+        # data has the shape (samples, *shape)
+        if data.shape[0] == 0:
+            # e.g. no pulse is left after filtering
+            return
+        self._acc.update(
+            np.ascontiguousarray(data).reshape(data.shape[0], -1), *args)
+
+    def _reshape(self, a):
+        # 0D array is converted to a scalar
+        return a.reshape(self._shape)[()]
+
+    def merge(self, other):
+        """Merge the statistics of another instance with the same shape.
+
+        :raise ValueError: If the shapes are different.
+        """
+        if other.shape != self._shape:
+            raise ValueError(f"Statistics with shapes {self._shape} and "
+                             f"{other.shape} cannot be merged")
+        self._acc.merge(other._acc)
+
+    def reset(self):
+        """Reset the statistics."""
+        self._acc.reset()
+
+    def __getstate__(self):
+        return {'shape': self._shape, 'state': self._acc.state()}
+
+    def __setstate__(self, state):
+        _OnlineStatsMixin.__init__(self, state['shape'])
+        self._acc.setState(state['state'])
+
+
+class RunningStats(_OnlineStatsMixin):
+    """Online statistics of scalars or arrays.
+
+    The count, mean, variance, minimum and maximum are updated from
+    single samples or batches of samples by the multi-threaded C++
+    implementation, ignoring nan. Instances can be merged exactly and
+    pickled, e.g. to combine the statistics accumulated by different
+    workers.
+    """
+    _CPP = _RunningStatsCpp
+
+    def __init__(self, shape=()):
+        """Initialization.
+
+        :param int/tuple shape: Shape of a sample. The default is a scalar.
+        """
+        super().__init__(shape)
+
+    def update(self, data):
+        """Accumulate a sample or a batch of samples.
+
+        :param float/numpy.ndarray data: A sample with the same shape as
+            the statistics or a batch of samples with the shape
+            (samples, \*shape).
+
+        :raise ValueError: If the shape of data is not compatible.
+        """
+        data = self._to_float(data)
+
+        if data.shape == self._shape:
+            data = data[np.newaxis]
+        elif data.shape[1:] != self._shape:
+            raise ValueError(f"Data with shape {data.shape} is not compatible "
+                             f"with the statistics with shape {self._shape}")
+
+        self._update(data)
+
+    @property
+    def count(self):
+        """Number of valid samples."""
+        return self._reshape(self._acc.count())
+
+    @property
+    def mean(self):
+        """Mean, nan if there is no valid sample."""
+        return self._reshape(self._acc.mean())
+
+    @property
+    def var(self):
+        """Population variance, nan if there is no valid sample."""
+        return self._reshape(self._acc.variance())
+
+    @property
+    def std(self):
+        """Population standard deviation, nan if there is no valid sample."""
+        return np.sqrt(self.var)
+
+    @property
+    def min(self):
+        """Minimum, nan if there is no valid sample."""
+        return self._reshape(self._acc.min())
+
+    @property
+    def max(self):
+        """Maximum, nan if there is no valid sample."""
+        return self._reshape(self._acc.max())
+
+
+class PixelCorrelation(_OnlineStatsMixin):
+    """Online pixel-wise correlation with a per-pulse reference.
+
+    For each pixel, the Pearson correlation, the covariance and the slope
+    of the linear regression between the pixel values and a scalar
+    reference, e.g. the intensity monitor, are accumulated pulse by pulse
+    in a single pass by the multi-threaded C++ implementation. Pairs in
+    which either the pixel or the reference is nan are ignored. Instances
+    can be merged exactly and pickled, e.g. to accumulate over trains.
+    """
+    _CPP = _PixelCorrelationCpp
+
+    def __init__(self, shape):
+        """Initialization.
+
+        :param int/tuple shape: Shape of an image, e.g. (y, x).
+        """
+        super().__init__(shape)
+
+    def update(self, data, ref):
+        """Accumulate an image array and the reference of each image.
+
+        :param numpy.ndarray data: Image array. Shape = (pulses, \*shape)
+        :param numpy.ndarray ref: Reference of each image. Shape = (pulses,)
+
+        :raise ValueError: If the shapes of data and ref are not compatible.
+        """
+        data = self._to_float(data)
+        ref = np.ascontiguousarray(ref, dtype=np.float64)
 
-    return np.nanmax(a, axis=axis)
+        if data.shape[1:] != self._shape or ref.shape != data.shape[:1]:
+            raise ValueError(f"Data with shape {data.shape} and reference with "
+                             f"shape {ref.shape} are not compatible with the "
+                             f"image shape {self._shape}")
 
+        self._update(data, ref)
 
-def histogram1d(a, bins=10, range=None):
+    @property
+    def count(self):
+        """Number of valid pairs of each pixel."""
+        return self._reshape(self._acc.count())
+
+    @property
+    def correlation(self):
+        """Pearson correlation coefficient, nan if either variance is zero."""
+        return self._reshape(self._acc.correlation())
+
+    @property
+    def covariance(self):
+        """Population covariance, nan if there is no valid pair."""
+        return self._reshape(self._acc.covariance())
+
+    @property
+    def slope(self):
+        """Slope of the linear regression of the pixel values on the
+        reference, nan if the variance of the reference is zero."""
+        return self._reshape(self._acc.slope())
+
+
+def pixel_correlation(data, ref):
+    """Compute the pixel-wise correlation between an image array and a
+    per-pulse reference, ignoring nan.
+
+    :param numpy.ndarray data: Image array. Shape = (pulses, y, x)
+    :param numpy.ndarray ref: Reference of each image, e.g. the intensity
+        monitor. Shape = (pulses,)
+
+    :return: (Pearson correlation coefficient, population covariance,
+        slope of the linear regression of the pixel values on the
+        reference), each with the shape (y, x).
+    :rtype: (numpy.array, numpy.array, numpy.array)
+    """
+    corr = PixelCorrelation(data.shape[1:])
+    corr.update(data, ref)
+    return corr.correlation, corr.covariance, corr.slope
+
+
+def _get_histogram_range(a):
+    """Determine the range of the bins from the data, ignoring nan.
+
+    Follow the convention of numpy.histogram.
+    """
+    if a.size == 0:
+        return 0., 1.
+
+    v_min, v_max = nanmin(a), nanmax(a)
+    if v_min == v_max:
+        v_min, v_max = v_min - 0.5, v_max + 0.5
+    return v_min, v_max
+
+
+def histogram1d(a, bins=10, range=None, *, weights=None, axis=None):
     """Faster numpy.histogram.
 
     It uses the C++ implementation when applicable. Otherwise, it falls
-    back to numpy.histogram.
+    back to numpy.histogram. Unlike numpy.histogram, nan is ignored.
 
     :param numpy.ndarray a: Data array.
     :param int bins: Number of bins.
     :param tuple/None range: The (lower, upper) boundary of the bins.
-        Default = (a.min(), a.max())
-
-    :return: (Values of the histogram, bin edges)
+        Default = (nanmin(a), nanmax(a))
+    :param None/numpy.ndarray weights: Weight of each value in a, which
+        has the same shape as a.
+    :param None/int axis: If given, a histogram is computed for each index
+        along this axis, e.g. axis=0 for the histograms of all the pulses
+        in an array of shape (pulses, y, x). The bins are shared.
+
+    :return: (Values of the histogram, bin edges). The values have the
+        shape (bins,) if axis is None, otherwise (a.shape[axis], bins).
     :rtype: (numpy.array, numpy.array)
     """
     if range is None:
-        range = (a.min(), a.max())
+        range = _get_histogram_range(a)
+
+    if axis is not None:
+        a = np.moveaxis(a, axis, 0)
+        a = a.reshape(a.shape[0], -1)
+        if weights is not None:
+            weights = np.moveaxis(weights, axis, 0).reshape(a.shape)
 
     if a.dtype in __ALL_DTYPES__:
         be_dtype = np.float32 if a.dtype == np.float32 else np.float64
         bin_edges = np.linspace(range[0], range[1], bins+1, dtype=be_dtype)
-        return (_histogram1d_cpp(a.ravel(), range[0], range[1], bins),
-                bin_edges)
-    return np.histogram(a, bins=bins, range=range)
+        if axis is None:
+            a = a.ravel()
+        if weights is None:
+            hist = _histogram1d_cpp(a, range[0], range[1], bins)
+        else:
+            weights = np.asarray(weights, dtype=np.float64).reshape(a.shape)
+            hist = _histogram1d_cpp(a, weights, range[0], range[1], bins)
+        return hist, bin_edges
+
+    if axis is None:
+        return np.histogram(a, bins=bins, range=range, weights=weights)
+
+    hists = [np.histogram(a[i], bins=bins, range=range,
+                          weights=None if weights is None else weights[i])
+             for i in np.arange(a.shape[0])]
+    bin_edges = np.linspace(range[0], range[1], bins+1)
+    if not hists:
+        return np.zeros((0, bins), dtype=np.int64), bin_edges
+    return np.stack([h for h, _ in hists]), hists[0][1]
+
+
+def histogram2d(x, y, bins=10, range=None, *, weights=None):
+    """Faster numpy.histogram2d.
+
+    It uses the C++ implementation when applicable. Otherwise, it falls
+    back to numpy.histogram2d. Unlike numpy.histogram2d, nan is ignored
+    and the values of the histogram are integers if weights is None.
+
+    :param numpy.ndarray x: Data along the first dimension.
+    :param numpy.ndarray y: Data along the second dimension, which has
+        the same shape as x.
+    :param int/tuple bins: Number of bins, (nx, ny) or n for both
+        dimensions.
+    :param tuple/None range: ((xmin, xmax), (ymin, ymax)) boundaries
+        of the bins. Default = ((nanmin(x), nanmax(x)), (nanmin(y), nanmax(y)))
+    :param None/numpy.ndarray weights: Weight of each value pair, which
+        has the same shape as x.
+
+    :return: (Values of the histogram, bin edges along the first dimension,
+        bin edges along the second dimension). The values have the shape
+        (nx, ny).
+    :rtype: (numpy.array, numpy.array, numpy.array)
+    """
+    nx, ny = (bins, bins) if np.isscalar(bins) else bins
+    if range is None:
+        range = (_get_histogram_range(x), _get_histogram_range(y))
+    (x_left, x_right), (y_left, y_right) = range
+
+    if x.dtype == y.dtype and x.dtype in __ALL_DTYPES__:
+        x_edges = np.linspace(x_left, x_right, nx + 1)
+        y_edges = np.linspace(y_left, y_right, ny + 1)
+        if weights is None:
+            hist = _histogram2d_cpp(x.ravel(), y.ravel(),
+                                    x_left, x_right, nx, y_left, y_right, ny)
+        else:
+            weights = np.asarray(weights, dtype=np.float64).ravel()
+            hist = _histogram2d_cpp(x.ravel(), y.ravel(), weights,
+                                    x_left, x_right, nx, y_left, y_right, ny)
+        return hist, x_edges, y_edges
+
+    return np.histogram2d(x.ravel(), y.ravel(), bins=(nx, ny), range=range,
+                          weights=None if weights is None else np.ravel(weights))
 
 
 def quick_min_max(x, q=None):
     """Estimate the min/max values of input by down-sampling.
 
-    :param numpy.ndarray x: data, 2D array for now.
+    The longest axis is halved repeatedly until there are no more than
+    1e5 elements left. It uses the C++ implementation, which samples
+    the data with strides without copying, when applicable. nan is
+    ignored.
+
+    :param numpy.ndarray x: data, 2D or 3D array.
     :param float/None q: quantile when calculating the min/max, which
-        must be within [0, 1].
+        must be within [0, 1]. The 'nearest' method of numpy.quantile
+        is used.
 
     :return tuple: (min, max)
     """
     if not isinstance(x, np.ndarray):
         raise TypeError("Input must be a numpy.ndarray!")
 
-    if x.ndim != 2:
-        raise ValueError("Input must be a 2D array!")
+    if x.ndim not in (2, 3):
+        raise ValueError("Input must be a 2D or 3D array!")
+
+    if q is not None and not 0 <= q <= 1:
+        raise ValueError("Quantile must be within [0, 1]!")
+
+    if x.dtype in __NAN_DTYPES__:
+        return _quick_min_max_cpp(x, 1. if q is None else q)
 
     while x.size > 1e5:
         sl = [slice(None)] * x.ndim
@@ -213,7 +855,6 @@ def quick_min_max(x, q=None):
     if q < 0.5:
         q = 1 - q
 
-    # Let np.nanquantile to handle the case when q is outside [0, 1]
     # caveat: nanquantile is about 30 times slower than nanmin/nanmax
     return np.nanquantile(x, 1 - q, interpolation='nearest'), \
            np.nanquantile(x, q, interpolation='nearest')
@@ -281,21 +922,36 @@ def compute_statistics(data):
     return np.mean(data), np.median(data), np.std(data)
 
 
+def _hist_with_stats_cpp(data, bin_range, n_bins):
+    """Compute histogram and statistics of an array in C++, ignoring nan."""
+    lb, ub = (-math.inf, math.inf) if bin_range is None else bin_range
+    hist, v_min, v_max, mean, median, std = _nanhist_with_stats_cpp(
+        data, lb, ub, n_bins)
+    bin_edges = np.linspace(v_min, v_max, n_bins + 1)
+    bin_centers = (bin_edges[1:] + bin_edges[:-1]) / 2.0
+    return hist, bin_centers, mean, median, std
+
+
 def nanhist_with_stats(data, bin_range=None, n_bins=10):
     """Compute nan-histogram and nan-statistics of an array.
 
+    It uses the C++ implementation, which computes the histogram, mean
+    and standard deviation in a single pass and selects the median with
+    bounded memory, without copying the data, when applicable. Otherwise,
+    it falls back to numpy.
+
     :param numpy.ndarray data: Image ROI.
     :param tuple bin_range: (lb, ub) of histogram.
     :param int n_bins: Number of bins of histogram.
 
     :raise ValueError: if finite outer edges cannot be found.
     """
+    if data.dtype in __ALL_DTYPES__ and data.ndim in (1, 2, 3):
+        return _hist_with_stats_cpp(data, bin_range, n_bins)
+
     # Note: Since the nan functions in numpy is typically 5-8 slower
     # than the non-nan counterpart, it is always faster to remove nan
     # first, which results in a copy, and then calculate the statistics.
-
-    # TODO: the following three steps can be merged into one to improve
-    #       the performance.
     filtered = data.copy()
     mask_image_data(filtered, threshold_mask=bin_range)
     filtered = filtered[~np.isnan(filtered)]
@@ -311,12 +967,21 @@ def nanhist_with_stats(data, bin_range=None, n_bins=10):
 def hist_with_stats(data, bin_range=None, n_bins=10):
     """Compute histogram and statistics of an array.
 
+    It uses the C++ implementation, which finds the outer edges, applies
+    the range filter and computes the histogram, mean and standard
+    deviation in at most two passes and selects the median with bounded
+    memory, without copying the data, when applicable. Otherwise, it
+    falls back to numpy.
+
     :param numpy.ndarray data: Input data.
     :param tuple bin_range: (lb, ub) of histogram.
     :param int n_bins: Number of bins of histogram.
 
     :raise ValueError: if finite outer edges cannot be found.
     """
+    if data.dtype in __ALL_DTYPES__ and data.ndim in (1, 2, 3):
+        return _hist_with_stats_cpp(data, bin_range, n_bins)
+
     v_min, v_max = _get_outer_edges(data, bin_range)
 
     filtered = data[(data >= v_min) & (data <= v_max)]
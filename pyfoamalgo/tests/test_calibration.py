@@ -0,0 +1,180 @@
+import pytest
+
+import numpy as np
+
+from pyfoamalgo import (
+    DarkBuilder, correct_common_mode, correct_multi_gain_image_data
+)
+
+
+class TestDarkBuilder:
+    @pytest.mark.parametrize("dtype", [np.uint16, np.float32])
+    def testGeneral(self, dtype):
+        n_cells, h, w = 4, 3, 2
+        builder = DarkBuilder(n_cells, h, w)
+        assert builder.shape == (n_cells, h, w)
+        assert builder.n_passes == 1
+        # only the snake_case API is public
+        assert not hasattr(builder, "nextPass")
+
+        # invalid shape
+        with pytest.raises(ValueError):
+            builder.update(np.ones((n_cells + 1, h, w), dtype=dtype))
+        # invalid dtype
+        with pytest.raises(TypeError):
+            builder.update(np.ones((n_cells, h, w), dtype=np.float64))
+
+        # no data
+        np.testing.assert_array_equal(np.full((n_cells, h, w), np.nan), builder.offset())
+        np.testing.assert_array_equal(np.full((n_cells, h, w), np.nan), builder.noise())
+        assert builder.bad_pixel_mask().all()
+
+        trains = np.random.randint(0, 1000, size=(10, n_cells, h, w)).astype(dtype)
+        for train in trains:
+            builder.update(train)
+
+        np.testing.assert_array_equal(np.full((n_cells, h, w), 10), builder.count())
+        np.testing.assert_array_almost_equal(
+            trains.astype(np.float64).mean(axis=0), builder.offset(), decimal=3)
+        np.testing.assert_array_almost_equal(
+            trains.astype(np.float64).std(axis=0), builder.noise(), decimal=3)
+
+        builder.reset()
+        np.testing.assert_array_equal(np.zeros((n_cells, h, w)), builder.count())
+
+    def testCellIds(self):
+        builder = DarkBuilder(4, 1, 1)
+
+        data = np.array([1, 2], dtype=np.float32).reshape(2, 1, 1)
+        with pytest.raises(ValueError, match="Duplicated cell ID"):
+            builder.update(data, cell_ids=[1, 1])
+        with pytest.raises(ValueError, match="out of range"):
+            builder.update(data, cell_ids=[0, 4])
+        with pytest.raises(ValueError):
+            builder.update(data, cell_ids=[0])
+
+        builder.update(data, cell_ids=[3, 1])
+        np.testing.assert_array_equal([np.nan, 2, np.nan, 1], builder.offset().ravel())
+        np.testing.assert_array_equal([0, 1, 0, 1], builder.count().ravel())
+
+    def testSigmaClipping(self):
+        builder = DarkBuilder(1, 1, 2)
+
+        samples = [10, 11, 9, 10, 11, 9, 10, 100]
+        data = [np.array([s, s], dtype=np.float32).reshape(1, 1, 2) for s in samples]
+        data[-1][0, 0, 1] = np.nan
+
+        for i in range(2):
+            if i > 0:
+                builder.next_pass(sigma=2)
+            for train in data:
+                builder.update(train)
+
+        assert builder.n_passes == 2
+        np.testing.assert_array_equal([[[7, 7]]], builder.count())
+        np.testing.assert_array_almost_equal([[[10, 10]]], builder.offset())
+
+        with pytest.raises(ValueError):
+            builder.next_pass(sigma=0)
+
+    def testBadPixelMask(self):
+        builder = DarkBuilder(1, 1, 4)
+
+        builder.update(np.array([[[10, 20, 30, 0]]], dtype=np.uint16))
+        builder.update(np.array([[[12, 20, 34, 0]]], dtype=np.uint16))
+
+        # zero noise
+        np.testing.assert_array_equal([[[False, True, False, True]]],
+                                      builder.bad_pixel_mask())
+        np.testing.assert_array_equal([[[False, True, True, True]]],
+                                      builder.bad_pixel_mask(offset_range=(0, 20)))
+        np.testing.assert_array_equal([[[True, True, False, True]]],
+                                      builder.bad_pixel_mask(noise_range=(1.5, np.inf)))
+
+
+class TestCommonMode:
+    def testCorrectCommonMode(self):
+        ah, aw = 354, 384
+        data = np.zeros((2, 2 * ah, 2 * aw), dtype=np.float32)
+        data[:, :ah, :aw] = 1
+        data[:, :ah, aw:] = 2
+        data[:, ah:, :aw] = -3
+        data[:, ah:, aw:] = 4
+        data[0, 0, 0] = 100  # photon hit
+        data[1, ah, aw] = np.nan
+
+        with pytest.raises(ValueError, match="Unsupported"):
+            correct_common_mode(data, detector="LPD")
+        with pytest.raises(ValueError, match="Unsupported"):
+            correct_common_mode(data, detector="ePix100", method="mode")
+        with pytest.raises(ValueError):
+            correct_common_mode(data[:, :ah, :], detector="ePix100")
+
+        image = data[0].copy()
+        correct_common_mode(image, detector="ePix100", threshold=10., method="mean")
+        assert image[0, 0] == 99
+        image[0, 0] = 0
+        np.testing.assert_array_equal(np.zeros_like(image), image)
+
+        correct_common_mode(data, detector="ePix100")
+        assert data[0, 0, 0] == 99
+        assert np.isnan(data[1, ah, aw])
+        data[0, 0, 0] = 0
+        data[1, ah, aw] = 0
+        np.testing.assert_array_equal(np.zeros_like(data), data)
+
+    @pytest.mark.parametrize("method", ["median", "mean"])
+    def testCorrectCommonModePerRow(self, method):
+        image = np.repeat(np.arange(512, dtype=np.float32)[:, None], 1024, axis=1)
+        image[1, 1] = 1000
+        mask = np.zeros((512, 1024), dtype=bool)
+        mask[1, 1] = True
+
+        correct_common_mode(image, detector="JungFrau", mask=mask,
+                            method=method, per_row=True)
+        assert image[1, 1] == 999
+        image[1, 1] = 0
+        np.testing.assert_array_equal(np.zeros_like(image), image)
+
+
+class TestMultiGainCorrection:
+    @pytest.mark.parametrize("dtype", [np.uint16, np.float32])
+    def testCorrectMultiGainImageData(self, dtype):
+        n_stages, n_cells, n_pulses, h, w = 3, 4, 4, 5, 6
+        data = np.random.randint(0, 1000, size=(n_pulses, h, w)).astype(dtype)
+        gain_stage = np.random.randint(0, n_stages, size=(n_pulses, h, w)).astype(np.uint8)
+        gain = np.random.rand(n_stages, n_cells, h, w).astype(np.float32)
+        offset = np.random.rand(n_stages, n_cells, h, w).astype(np.float32)
+
+        def expected(cells):
+            ret = np.empty((n_pulses, h, w), dtype=np.float32)
+            yy, xx = np.meshgrid(np.arange(h), np.arange(w), indexing='ij')
+            for i, c in enumerate(cells):
+                g = gain_stage[i]
+                ret[i] = gain[g, c, yy, xx] * (data[i].astype(np.float32) - offset[g, c, yy, xx])
+            return ret
+
+        out = correct_multi_gain_image_data(data, gain_stage, gain=gain, offset=offset)
+        assert out.dtype == np.float32
+        np.testing.assert_array_almost_equal(expected(range(n_pulses)), out)
+
+        cell_ids = [3, 1, 3, 0]
+        out2 = np.empty_like(out)
+        ret = correct_multi_gain_image_data(data, gain_stage, gain=gain, offset=offset,
+                                            cell_ids=cell_ids, out=out2)
+        assert ret is out2
+        np.testing.assert_array_almost_equal(expected(cell_ids), out2)
+
+        # invalid gain stage
+        gain_stage[0, 0, 0] = n_stages
+        out = correct_multi_gain_image_data(data, gain_stage, gain=gain, offset=offset)
+        assert np.isnan(out[0, 0, 0])
+
+        with pytest.raises(ValueError, match="out of range"):
+            correct_multi_gain_image_data(data, gain_stage, gain=gain, offset=offset,
+                                          cell_ids=[0, 1, 2, n_cells])
+        with pytest.raises(ValueError):
+            correct_multi_gain_image_data(data, gain_stage, gain=gain[:, :, :-1], offset=offset)
+        # without cell IDs, the numbers of pulses and memory cells must match
+        with pytest.raises(ValueError, match="memory cells"):
+            correct_multi_gain_image_data(data[:-1], gain_stage[:-1], gain=gain, offset=offset)
@@ -3,7 +3,7 @@ import unittest
 import numpy as np
 
 from pyfoamalgo import (
-    edge_detect, fourier_transform_2d
+    edge_detect, fourier_transform_2d, BufferPool
 )
 
 
@@ -12,8 +12,26 @@ class TestEdgeDetect(unittest.TestCase):
         img = np.ones((6, 8), dtype=np.float32)
         edge_detect(img)
 
+    def testPool(self):
+        img = np.random.rand(6, 8).astype(np.float32)
+        img[1, 1] = np.nan
+        pool = BufferPool()
+        for _ in range(2):
+            np.testing.assert_array_equal(
+                edge_detect(img, threshold=(0.1, 0.2)),
+                edge_detect(img, threshold=(0.1, 0.2), pool=pool))
+        # the intermediate arrays are returned to the pool
+        self.assertEqual(2, len(pool))
+
 
 class TestFourierTransform(unittest.TestCase):
     def testGeneral(self):
         img = np.ones((6, 8), dtype=np.float32)
         fourier_transform_2d(img)
+
+    def testPool(self):
+        img = np.random.rand(6, 8).astype(np.float32)
+        pool = BufferPool()
+        np.testing.assert_array_equal(fourier_transform_2d(img),
+                                      fourier_transform_2d(img, pool=pool))
+        self.assertEqual(1, len(pool))
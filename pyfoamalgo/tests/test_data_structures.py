@@ -1,3 +1,7 @@
+import copy
+import pickle
+import subprocess
+import sys
 import unittest
 import pytest
 from queue import Empty, Full
@@ -6,11 +10,13 @@ from threading import Thread
 import numpy as np
 
 from pyfoamalgo import (
-    OrderedSet, Stack,
+    OrderedSet, IndexSet, Stack,
     SimpleSequence, SimpleVectorSequence, SimplePairSequence, OneWayAccuPairSequence,
-    SimpleQueue,
+    TimeIndexedSequence, DecimatedSequence,
+    SimpleQueue, SpscQueue, QuantileSketch, BufferPool, BinnedAccumulator2d,
+    SharedSimpleSequence, SharedSimpleVectorSequence, SharedSequenceReader,
 )
-from pyfoamalgo.data_structures import _StatDataItem
+from pyfoamalgo.data_structures import _StatDataItem, shared_memory
 from pyfoamalgo import MovingAverageArray, MovingAverageScalar
 
 
@@ -83,6 +89,69 @@ class TestDataStructures(unittest.TestCase):
 
         # TODO: more
 
+    def testIndexSet(self):
+        x = IndexSet(10, [1, 3, 0, 3])
+        self.assertEqual('IndexSet([1, 3, 0])', repr(x))
+        self.assertEqual(10, x.capacity)
+        x.add(0)  # add an existing item
+        x.add(9)
+        with self.assertRaises(IndexError):
+            x.add(10)
+        with self.assertRaises(IndexError):
+            x.add(-1)
+        with self.assertRaises(TypeError):
+            x.add(1.5)
+
+        self.assertIn(1, x)
+        self.assertNotIn(10, x)
+        self.assertNotIn(-1, x)
+        self.assertIn(np.uint64(1), x)
+        # not an integer
+        self.assertNotIn(1.5, x)
+        self.assertNotIn(1., x)
+        self.assertNotIn('A', x)
+        self.assertNotIn(None, x)
+        self.assertEqual(4, len(x))
+        self.assertListEqual([1, 3, 0, 9], list(x))
+
+        x.discard(4)
+        x.discard(10)
+        x.discard(1.5)
+        x.discard('A')
+        x.discard(3)
+        self.assertListEqual([1, 0, 9], list(x))
+        # re-add a discarded item
+        x.add(3)
+        self.assertListEqual([1, 0, 9, 3], list(x))
+
+        # none of the indices is added if any of them is out of range
+        with self.assertRaises(IndexError):
+            x.update([5, 10])
+        with self.assertRaises(TypeError):
+            x.update([5, 1.5])
+        x.update(np.array([5, 1, 6, 5]))
+        self.assertListEqual([1, 0, 9, 3, 5, 6], list(x))
+
+        arr = x.as_array()
+        self.assertEqual(np.uint64, arr.dtype)
+        np.testing.assert_array_equal([1, 0, 9, 3, 5, 6], arr)
+        with self.assertRaises(ValueError):
+            arr[0] = 2
+
+        # the order array is full of holes
+        for i in range(10):
+            x.discard(i)
+            x.add(i)
+        self.assertListEqual(list(range(10)), list(x))
+
+        self.assertEqual(0, x.pop())
+        x.clear()
+        self.assertEqual(0, len(x))
+        self.assertEqual(0, len(x.as_array()))
+
+        x |= {2, 1}
+        self.assertEqual({1, 2}, x)
+
 
 class TestSequenceData(unittest.TestCase):
     def testSimpleSequence(self):
@@ -270,6 +339,129 @@ class TestSequenceData(unittest.TestCase):
         hist = SimplePairSequence.from_array([0, 1, 2], [1, 2, 3])
         self.assertEqual(3, len(hist))
 
+    def testTimeIndexedSequence(self):
+        MAX_LENGTH = 5
+
+        hist = TimeIndexedSequence(max_len=MAX_LENGTH, key_dtype=np.uint64)
+        keys, values = hist.latest(10)
+        self.assertEqual(0, len(keys))
+
+        for i in range(8):
+            hist.append((100 + i, 0.5 * i))
+        self.assertEqual(MAX_LENGTH, len(hist))
+        self.assertTupleEqual((103, 1.5), hist[0])
+
+        # keys must be monotonically increasing
+        with self.assertRaises(ValueError):
+            hist.append((99, 1))
+        with self.assertRaises(ValueError):
+            hist.extend([(120, 1), (119, 2)])
+        with self.assertRaises(ValueError):
+            hist.extend([(106, 1)])
+        self.assertEqual(107, hist.data()[0][-1])
+
+        keys, values = hist.range(104, 105)
+        np.testing.assert_array_equal([104, 105], keys)
+        np.testing.assert_array_equal([2, 2.5], values)
+        keys, values = hist.range(0, 50)
+        self.assertEqual(0, len(keys))
+        keys, values = hist.latest(2)
+        np.testing.assert_array_equal([105, 106, 107], keys)
+
+        hist.extend([(110, 1), (110, 2), (111, 3)])
+        keys, values = hist.range(108, 110.5)
+        np.testing.assert_array_equal([110, 110], keys)
+        np.testing.assert_array_equal([1, 2], values)
+
+        hist = TimeIndexedSequence.from_array([1., 2.5, 3.], [4, 5, 6], max_len=2)
+        keys, values = hist.latest(0.5)
+        np.testing.assert_array_equal([2.5, 3.], keys)
+        np.testing.assert_array_equal([5, 6], values)
+        with self.assertRaises(ValueError):
+            TimeIndexedSequence.from_array([2., 1.], [4, 5])
+
+    def testDecimatedSequence(self):
+        MAX_LENGTH = 100
+
+        hist = DecimatedSequence(max_len=MAX_LENGTH)
+        with self.assertRaises(ValueError):
+            hist.data(1)
+        self.assertEqual(0, len(hist.data(10)[0]))
+
+        for i in range(10):
+            hist.append(i)
+        # no decimation
+        positions, means, mins, maxs = hist.data(10)
+        np.testing.assert_array_equal(np.arange(10), positions)
+        np.testing.assert_array_equal(np.arange(10), means)
+        np.testing.assert_array_equal(np.arange(10), mins)
+
+        # blocks of 4 data points
+        positions, means, mins, maxs = hist.data(3)
+        np.testing.assert_array_equal([0, 4, 8], positions)
+        np.testing.assert_array_equal([1.5, 5.5, 8.5], means)
+        np.testing.assert_array_equal([0, 4, 8], mins)
+        np.testing.assert_array_equal([3, 7, 9], maxs)
+
+        # the first and the last blocks are incomplete after rolling over
+        data = np.random.randn(1000)
+        hist.extend(data[:-1])
+        hist.append(data[-1])
+        np.testing.assert_array_equal(data[-MAX_LENGTH:], hist.data())
+        for resolution in [2, 5, 10, 30, 100]:
+            positions, means, mins, maxs = hist.data(resolution)
+            self.assertLessEqual(len(positions), resolution)
+            self.assertEqual(0, positions[0])
+            bounds = np.append(positions, MAX_LENGTH)
+            expected = [data[-MAX_LENGTH:][i:j] for i, j in zip(bounds[:-1], bounds[1:])]
+            np.testing.assert_array_almost_equal([x.mean() for x in expected], means)
+            np.testing.assert_array_equal([x.min() for x in expected], mins)
+            np.testing.assert_array_equal([x.max() for x in expected], maxs)
+
+        hist.reset()
+        self.assertEqual(0, len(hist.data(10)[0]))
+
+    def testExtendMatchesAppend(self):
+        MAX_LENGTH = 7
+
+        for n_items in [0, 3, MAX_LENGTH, 2 * MAX_LENGTH + 1, 5 * MAX_LENGTH + 3]:
+            items = np.random.rand(n_items, 2)
+
+            hist1 = SimpleSequence(max_len=MAX_LENGTH, dtype=np.float32)
+            hist2 = SimpleSequence(max_len=MAX_LENGTH, dtype=np.float32)
+            hist1.append(-1)
+            hist2.append(-1)
+            for item in items[:, 0]:
+                hist1.append(item)
+            hist2.extend(items[:, 0])
+            np.testing.assert_array_equal(hist1.data(), hist2.data())
+            hist1.append(-2)
+            hist2.append(-2)
+            np.testing.assert_array_equal(hist1.data(), hist2.data())
+
+            hist1 = SimpleVectorSequence(2, max_len=MAX_LENGTH)
+            hist2 = SimpleVectorSequence(2, max_len=MAX_LENGTH)
+            for item in items:
+                hist1.append(item)
+            hist2.extend(items.tolist())
+            np.testing.assert_array_equal(hist1.data(), hist2.data())
+
+            hist1 = SimplePairSequence(max_len=MAX_LENGTH)
+            hist2 = SimplePairSequence(max_len=MAX_LENGTH)
+            for item in items:
+                hist1.append(item)
+            hist2.extend(items)
+            for a1, a2 in zip(hist1.data(), hist2.data()):
+                np.testing.assert_array_equal(a1, a2)
+
+        hist = SimpleVectorSequence(2, max_len=MAX_LENGTH)
+        with self.assertRaises(ValueError):
+            hist.extend(np.ones((3, 3)))
+        hist = SimplePairSequence(max_len=MAX_LENGTH)
+        with self.assertRaises(ValueError):
+            hist.extend([(1, 2, 3)])
+        self.assertEqual(0, len(hist))
+
     def testOneWayAccuPairSequence(self):
         MAX_LENGTH = 100
 
@@ -347,9 +539,28 @@ class TestSequenceData(unittest.TestCase):
             x, y = hist[-1]
             self.assertAlmostEqual(2.355, x)
             self.assertEqual(_StatDataItem(1.5, 1.25, 1.75, 2), y)
+            self.assertIsInstance(y.avg, np.float64)
+            # it is a namedtuple
+            self.assertEqual(4, len(y))
+            self.assertEqual(1.5, y[0])
+            self.assertEqual((1.5, 1.25), y[:2])
+            self.assertDictEqual({'avg': 1.5, 'min': 1.25, 'max': 1.75, 'count': 2}, y._asdict())
+            self.assertIsInstance(y, tuple)
+            self.assertEqual(hash((1.5, 1.25, 1.75, 2)), hash(y))
             with self.assertRaises(IndexError):
                 hist[2]
 
+            # test structured view
+            records = hist.records()
+            np.testing.assert_array_equal(ax, records['x'])
+            np.testing.assert_array_equal(ay.avg, records['avg'])
+            np.testing.assert_array_equal(ay.min, records['min'])
+            np.testing.assert_array_equal(ay.max, records['max'])
+            np.testing.assert_array_equal(ay.count, records['count'])
+            np.testing.assert_array_almost_equal([0.0816496580927726, 0.5], records['std'])
+            with self.assertRaises(ValueError):
+                records['avg'][0] = 1
+
         # ----------------------------
         # test when max length reached
         # ----------------------------
@@ -392,6 +603,57 @@ class TestSequenceData(unittest.TestCase):
         hist = OneWayAccuPairSequence.from_array([0, 0.9, 1.8], [1, 2, 3], resolution=1)
         self.assertEqual(1, len(hist))
 
+    def testOneWayAccuPairSequenceExtend(self):
+        MAX_LENGTH = 10
+
+        x = np.cumsum(np.random.choice([0., 0.01, 0.05, 0.3], size=500))
+        y = np.random.rand(500)
+
+        hist1 = OneWayAccuPairSequence(0.1, max_len=MAX_LENGTH, min_count=3)
+        for item in zip(x[:100], y[:100]):
+            hist1.append(item)
+        hist1.extend(list(zip(x[100:], y[100:])))
+        hist2 = OneWayAccuPairSequence.from_array(x, y, 0.1, max_len=MAX_LENGTH, min_count=3)
+        self.assertEqual(len(hist1), len(hist2))
+        ax1, ay1 = hist1.data()
+        ax2, ay2 = hist2.data()
+        np.testing.assert_array_equal(ax1, ax2)
+        for v1, v2 in zip(ay1, ay2):
+            np.testing.assert_array_equal(v1, v2)
+        self.assertEqual(hist1[-1][0], hist2[-1][0])
+
+        with self.assertRaises(ValueError):
+            hist1.extend([(1, 2, 3)])
+
+        # float32
+        hist = OneWayAccuPairSequence(0.1, dtype=np.float32, min_count=1)
+        hist.extend([(1, 1), (1.05, 3)])
+        ax, ay = hist.data()
+        self.assertEqual(np.float32, ax.dtype)
+        np.testing.assert_array_equal([2], ay.avg)
+        np.testing.assert_array_equal([2], ay.count)
+
+        with self.assertRaises(ValueError):
+            OneWayAccuPairSequence(0.1, dtype=np.int32)
+        with self.assertRaises(ValueError):
+            OneWayAccuPairSequence(0.1, min_count=0)
+
+    def testOneWayAccuPairSequencePickle(self):
+        x = np.cumsum(np.random.choice([0., 0.01, 0.05, 0.3], size=500))
+        y = np.random.rand(500)
+
+        for dtype in (np.float64, np.float32):
+            kwargs = dict(max_len=10, dtype=dtype, min_count=3)
+            hist = OneWayAccuPairSequence.from_array(x[:-50], y[:-50], 0.1, **kwargs)
+            expected = OneWayAccuPairSequence.from_array(x, y, 0.1, **kwargs)
+            for restored in (pickle.loads(pickle.dumps(hist)), copy.deepcopy(hist)):
+                self.assertEqual(len(hist), len(restored))
+                np.testing.assert_array_equal(hist.records(), restored.records())
+
+                # the point being accumulated is restored as well
+                restored.extend(list(zip(x[-50:], y[-50:])))
+                np.testing.assert_array_equal(expected.records(), restored.records())
+
     def testOneWayAccuPairSequence2(self):
         MAX_LENGTH = 100
         min_count = 20
@@ -417,6 +679,234 @@ class TestSequenceData(unittest.TestCase):
                 self.assertEqual(1, len(hist))
 
 
+@pytest.mark.skipif(shared_memory is None, reason="Requires Python 3.8 or later")
+class TestSharedSequence(unittest.TestCase):
+    def testSharedSimpleSequence(self):
+        MAX_LENGTH = 5
+
+        seq = SharedSimpleSequence(max_len=MAX_LENGTH)
+        reader = SharedSequenceReader(seq.name)
+        try:
+            expected = SimpleSequence(max_len=MAX_LENGTH)
+            self.assertEqual(0, reader.data().size)
+
+            for i in range(2 * MAX_LENGTH + 3):
+                seq.append(i)
+                expected.append(i)
+                np.testing.assert_array_equal(expected.data(), reader.data())
+
+            seq.extend(np.arange(7))
+            expected.extend(np.arange(7))
+            np.testing.assert_array_equal(expected.data(), reader.data())
+
+            # the view is invalidated by writing
+            version, data = reader.view()
+            np.testing.assert_array_equal(expected.data(), data)
+            self.assertTrue(reader.validate(version))
+            seq.append(100)
+            self.assertFalse(reader.validate(version))
+            self.assertEqual(0, reader.version % 2)
+
+            # the reader cannot write
+            with self.assertRaises(ValueError):
+                data[0] = 1
+
+            seq.reset()
+            self.assertEqual(0, reader.data().size)
+        finally:
+            reader.close()
+            seq.close()
+            seq.unlink()
+
+    def testSharedSimpleVectorSequence(self):
+        MAX_LENGTH = 3
+
+        seq = SharedSimpleVectorSequence(2, max_len=MAX_LENGTH, dtype=np.float32)
+        reader = SharedSequenceReader(seq.name)
+        try:
+            for i in range(2 * MAX_LENGTH + 1):
+                seq.append([i, 2 * i])
+
+            data = reader.data()
+            self.assertEqual(np.float32, data.dtype)
+            np.testing.assert_array_equal([[4, 8], [5, 10], [6, 12]], data)
+
+            with self.assertRaises(ValueError):
+                seq.append([1, 2, 3])
+            # a failed write does not leave the version odd
+            self.assertEqual(0, reader.version % 2)
+        finally:
+            reader.close()
+            seq.close()
+            seq.unlink()
+
+    def testReaderInAnotherProcess(self):
+        # an independent process has its own resource tracker, unlike the
+        # children started by multiprocessing
+        code = ("import sys; from pyfoamalgo import SharedSequenceReader; "
+                "reader = SharedSequenceReader(sys.argv[1]); "
+                "print(reader.data().tolist()); reader.close()")
+
+        seq = SharedSimpleSequence(max_len=5)
+        try:
+            for i in range(3):
+                seq.append(i)
+                ret = subprocess.run([sys.executable, "-c", code, seq.name],
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                     universal_newlines=True, timeout=60)
+                self.assertEqual(0, ret.returncode, ret.stderr)
+                self.assertNotIn("leaked", ret.stderr)
+                self.assertEqual(str(seq.data().tolist()), ret.stdout.strip())
+
+            # the shared memory survives the exits of the readers
+            seq.extend(np.arange(10))
+            reader = SharedSequenceReader(seq.name)
+            np.testing.assert_array_equal(seq.data(), reader.data())
+            reader.close()
+        finally:
+            seq.close()
+            seq.unlink()
+
+
+class TestBinnedAccumulator2d(unittest.TestCase):
+    def testFixedBins(self):
+        with self.assertRaises(ValueError):
+            BinnedAccumulator2d(((0, 2), (0, 2)), 0)
+
+        acc = BinnedAccumulator2d(((0, 2), (0, 2)), 2)
+        np.testing.assert_array_equal([0, 1, 2], acc.x_edges)
+        np.testing.assert_array_equal([0, 1, 2], acc.y_edges)
+
+        acc.update(0.5, 0.5, 1)
+        acc.update(0.5, 0.5, 3)
+        # the last edge falls in the last bin
+        acc.update(2, 2, 5)
+        # ignored
+        acc.update(1.5, 0.2, np.nan)
+        acc.update(3, 0, 7)
+
+        count, mean, std = acc.data()
+        np.testing.assert_array_equal([[2, 0], [0, 1]], count)
+        np.testing.assert_array_equal([[2, np.nan], [np.nan, 5]], mean)
+        np.testing.assert_array_equal([[1, np.nan], [np.nan, 0]], std)
+        with self.assertRaises(ValueError):
+            count[0, 0] = 0
+
+        with self.assertRaises(ValueError):
+            acc.update([0.5, 1.5], [0.5], [1, 2])
+
+        # consistent with numpy.histogram2d
+        x, y = np.random.rand(2, 100) * 2
+        v = np.random.rand(100)
+        acc.reset()
+        acc.update(x, y, v)
+        count, mean, _ = acc.data()
+        hist, _, _ = np.histogram2d(x, y, bins=2, range=((0, 2), (0, 2)))
+        weights, _, _ = np.histogram2d(x, y, bins=2, range=((0, 2), (0, 2)), weights=v)
+        np.testing.assert_array_equal(hist, count)
+        np.testing.assert_array_almost_equal(weights / hist, mean)
+
+    def testAutoGrow(self):
+        acc = BinnedAccumulator2d(((0, 2), (0, 2)), (2, 2), auto_grow=True, max_bins=5)
+
+        # the last edges do not grow the grid
+        acc.update(2, 2, 1)
+        acc.update([0.5, 2], [2, 0.5], [1, 1])
+        np.testing.assert_array_equal([0, 1, 2], acc.x_edges)
+        np.testing.assert_array_equal([0, 1, 2], acc.y_edges)
+        np.testing.assert_array_equal([[0, 1], [1, 1]], acc.data()[0])
+        acc.reset()
+
+        acc.update(0.5, 0.5, 1)
+        acc.update(-0.5, 2.5, 3)
+        np.testing.assert_array_equal([-1, 0, 1, 2], acc.x_edges)
+        np.testing.assert_array_equal([0, 1, 2, 3], acc.y_edges)
+        count, _, _ = acc.data()
+        np.testing.assert_array_equal([[0, 0, 1], [1, 0, 0], [0, 0, 0]], count)
+
+        # a failing batch accumulates nothing
+        with self.assertRaises(ValueError):
+            acc.update([0, 100], [0, 0], [1, 1])
+        np.testing.assert_array_equal(count, acc.data()[0])
+
+        acc.update([0, 3.5], [0, 0], [1, 1])
+        np.testing.assert_array_equal([-1, 0, 1, 2, 3, 4], acc.x_edges)
+        count, _, _ = acc.data()
+        self.assertEqual(2, count[1, 0])
+        self.assertEqual(1, count[4, 0])
+
+        acc.reset()
+        np.testing.assert_array_equal([0, 1, 2], acc.x_edges)
+        np.testing.assert_array_equal([[0, 0], [0, 0]], acc.data()[0])
+
+
+class TestQuantileSketch(unittest.TestCase):
+    def testGeneral(self):
+        sketch = QuantileSketch(seed=1)
+        self.assertEqual(0, len(sketch))
+        self.assertEqual(200, sketch.k)
+        self.assertTrue(np.isnan(sketch.quantile(0.5)))
+        self.assertTrue(np.isnan(sketch.cdf(0)))
+
+        for i in range(1, 6):
+            sketch.append(i)
+        sketch.append(np.nan)
+        self.assertEqual(5, len(sketch))
+        # no compaction yet
+        self.assertEqual(5, sketch.size)
+        self.assertEqual(3, sketch.quantile(0.5))
+        np.testing.assert_array_equal([1, 2, 5], sketch.quantile([0, 0.4, 1]))
+        self.assertEqual(0.4, sketch.cdf(2))
+
+        with self.assertRaises(ValueError):
+            sketch.quantile(1.1)
+        with self.assertRaises(ValueError):
+            QuantileSketch(k=1)
+
+        sketch.reset()
+        self.assertEqual(0, len(sketch))
+
+    def testAccuracy(self):
+        data = np.random.normal(size=200000)
+        sketch1 = QuantileSketch(k=200, seed=1)
+        sketch2 = QuantileSketch(k=200, seed=2)
+        sketch1.extend(data[:150000])
+        for chunk in np.split(data[150000:], 10):
+            sketch2.extend(chunk)
+
+        # memory is bounded
+        self.assertLess(sketch1.size, 1000)
+        sketch1.merge(sketch2)
+        self.assertEqual(len(data), len(sketch1))
+
+        qs = np.linspace(0, 1, 21)
+        ranks = np.searchsorted(np.sort(data), sketch1.quantile(qs), side='right') / len(data)
+        np.testing.assert_allclose(qs, ranks, atol=0.02)
+        self.assertEqual(data.min(), sketch1.min)
+        self.assertEqual(data.max(), sketch1.max)
+
+        with self.assertRaises(ValueError):
+            sketch1.merge(QuantileSketch(k=100))
+
+    def testPickle(self):
+        data = np.random.normal(size=10000)
+        sketch = QuantileSketch(k=50, seed=1)
+        sketch.extend(data[:5000])
+
+        restored = pickle.loads(pickle.dumps(sketch))
+        self.assertEqual(50, restored.k)
+        self.assertEqual(len(sketch), len(restored))
+        self.assertEqual(sketch.size, restored.size)
+
+        # the random number generator is restored as well
+        sketch.extend(data[5000:])
+        restored.extend(data[5000:])
+        qs = np.linspace(0, 1, 11)
+        np.testing.assert_array_equal(sketch.quantile(qs), restored.quantile(qs))
+        self.assertEqual(sketch.min, restored.min)
+        self.assertEqual(sketch.max, restored.max)
+
+
 class TestMovingAverageScalar(unittest.TestCase):
     def testGeneral(self):
         class Dummy:
@@ -571,3 +1061,103 @@ class TestSimpleQueue(unittest.TestCase):
         t1.join()
         t2.join()
         self.assertTrue(queue.empty())
+
+
+class TestSpscQueue(unittest.TestCase):
+    def testGeneral(self):
+        with self.assertRaises(ValueError):
+            SpscQueue(0)
+
+        queue = SpscQueue(2)
+        self.assertTrue(queue.empty())
+        queue.put(1)
+        queue.put("a")
+        with self.assertRaises(Full):
+            queue.put(3)
+        with self.assertRaises(Full):
+            queue.put(3, block=True, timeout=0.01)
+        with self.assertRaises(ValueError):
+            queue.put(3, block=True, timeout=-1)
+        self.assertTrue(queue.full())
+        self.assertEqual(2, queue.qsize())
+        self.assertEqual(1, queue.get())
+        self.assertEqual("a", queue.get())
+        with self.assertRaises(Empty):
+            queue.get()
+        with self.assertRaises(Empty):
+            queue.get(block=True, timeout=0.01)
+        self.assertTrue(queue.empty())
+
+        # drop the oldest item
+        for i in range(3):
+            queue.put_pop(i)
+        self.assertEqual(2, queue.qsize())
+        self.assertListEqual([1, 2], queue.get_many(5))
+        self.assertListEqual([], queue.get_many(5))
+
+        queue.put(np.ones(2))
+        queue.clear()
+        self.assertTrue(queue.empty())
+
+    def testMultiThreads(self):
+        n_items = 10000
+        received = []
+
+        def producer(queue):
+            for i in range(n_items):
+                queue.put(i, block=True)
+
+        def consumer(queue):
+            while len(received) < n_items:
+                received.extend(queue.get_many(100, block=True, timeout=1.))
+
+        queue = SpscQueue(16)
+        t1 = Thread(target=producer, args=(queue,))
+        t2 = Thread(target=consumer, args=(queue,))
+        t1.start()
+        t2.start()
+        t1.join()
+        t2.join()
+        self.assertListEqual(list(range(n_items)), received)
+        self.assertTrue(queue.empty())
+
+
+class TestBufferPool(unittest.TestCase):
+    def testGeneral(self):
+        pool = BufferPool(max_bytes=1000)
+
+        a = pool.get((10, 10))
+        self.assertEqual((10, 10), a.shape)
+        self.assertEqual(np.float64, a.dtype)
+        pool.put(a)
+        self.assertEqual(1, len(pool))
+        self.assertEqual(800, pool.nbytes)
+        with self.assertRaises(ValueError):
+            pool.put(a)
+        with self.assertRaises(ValueError):
+            pool.put(np.ones(10)[:5])
+
+        # recycled and filled
+        b = pool.get((10, 10), np.float64, fill_value=np.nan)
+        self.assertIs(a, b)
+        self.assertTrue(np.isnan(b).all())
+        self.assertEqual(0, len(pool))
+        # the dtype is part of the key
+        self.assertIsNot(a, pool.get((10, 10), np.float32))
+
+        # the least recently returned array is released
+        pool.put(a)
+        c = pool.get(20, np.float32)
+        pool.put(c)
+        pool.put(np.empty(20))
+        self.assertEqual(2, len(pool))
+        self.assertEqual(240, pool.nbytes)
+        self.assertIs(c, pool.get(20, np.float32))
+
+        # too large for the pool
+        pool.put(np.empty(200))
+        self.assertEqual(1, len(pool))
+
+        pool.clear()
+        self.assertEqual(0, len(pool))
+        self.assertEqual(0, pool.nbytes)
@@ -5,7 +5,8 @@ import numpy as np
 from pyfoamalgo.config import __XFEL_IMAGE_DTYPE__ as IMAGE_DTYPE
 from pyfoamalgo.config import __NAN_DTYPES__
 from pyfoamalgo import (
-    correct_image_data, mask_image_data, nanmean_image_data, nanmean_images
+    IndexSet, correct_image_data, mask_image_data, nanmean_image_data, nanmean_images,
+    nanmean_image_chunks, nanmedian_image_data, nanpercentile_image_data
 )
 from pyfoamalgo.lib.imageproc import movingAvgImageData
 
@@ -58,6 +59,8 @@ class TestImageProc:
                                                  nanmean_image_data(data, kept=[1]))
             np.testing.assert_array_almost_equal(np.nanmean(data[0:3:2, ...], axis=0),
                                                  nanmean_image_data(data, kept=[0, 2]))
+            np.testing.assert_array_almost_equal(np.nanmean(data[[2, 0], ...], axis=0),
+                                                 nanmean_image_data(data, kept=IndexSet(3, [2, 0]).as_array()))
 
     @pytest.mark.parametrize("dtype", __NAN_DTYPES__)
     def testNanMeanImages(self, dtype):
@@ -78,6 +81,86 @@ class TestImageProc:
         expected = np.array([[1., 0.5, 3], [np.inf, np.nan, -np.inf]])
         np.testing.assert_array_almost_equal(expected, nanmean_images(img1, img2))
 
+    @pytest.mark.parametrize("dtype", __NAN_DTYPES__)
+    def testNanmedianImageData(self, dtype):
+        arr3d = np.ones((2, 2, 2), dtype=dtype)
+
+        with pytest.raises(TypeError):
+            nanmedian_image_data(np.ones((2, 2, 2, 2), dtype=dtype))
+        with pytest.raises(ValueError):
+            nanmedian_image_data(arr3d, kept=[])
+        with pytest.raises(ValueError):
+            nanmedian_image_data(arr3d, kept=[0, 2])
+
+        data = np.random.randn(2, 2)
+        ret = nanmedian_image_data(data)
+        np.testing.assert_array_equal(data, ret)
+        assert ret is not data
+
+        for n in (1, 4, 7):
+            data = np.random.randn(n, 5, 6).astype(dtype)
+            data[0, 0, 0] = np.nan
+            data[:, 1, 1] = np.nan
+            with np.warnings.catch_warnings():
+                np.warnings.simplefilter("ignore", category=RuntimeWarning)
+                np.testing.assert_array_equal(np.nanmedian(data, axis=0),
+                                              nanmedian_image_data(data))
+                np.testing.assert_array_equal(np.nanmedian(data[[0, 2 % n]], axis=0),
+                                              nanmedian_image_data(data, kept=[0, 2 % n]))
+
+    @pytest.mark.parametrize("dtype", __NAN_DTYPES__)
+    def testNanpercentileImageData(self, dtype):
+        arr3d = np.ones((2, 2, 2), dtype=dtype)
+
+        with pytest.raises(ValueError):
+            nanpercentile_image_data(arr3d, 101)
+        with pytest.raises(ValueError):
+            nanpercentile_image_data(arr3d, -1)
+        with pytest.raises(ValueError):
+            nanpercentile_image_data(arr3d, 50, kept=[])
+
+        data = np.random.randn(9, 5, 6).astype(dtype)
+        data[0, 0, 0] = np.nan
+        data[:, 1, 1] = np.nan
+        with np.warnings.catch_warnings():
+            np.warnings.simplefilter("ignore", category=RuntimeWarning)
+            for q in (0, 10, 25, 50, 62.5, 99, 100):
+                np.testing.assert_array_almost_equal(
+                    np.nanpercentile(data, q, axis=0), nanpercentile_image_data(data, q))
+                np.testing.assert_array_almost_equal(
+                    np.nanpercentile(data[[1, 3, 4]], q, axis=0),
+                    nanpercentile_image_data(data, q, kept=[1, 3, 4]))
+
+    @pytest.mark.parametrize("dtype", __NAN_DTYPES__)
+    def testNanmeanImageChunks(self, dtype, tmp_path):
+        data = np.random.randn(50, 3, 4).astype(dtype)
+        data[::3, 0, 0] = np.nan
+        data[:, 1, 1] = np.nan
+        data[5, 2, 2] = np.inf
+        expected = nanmean_image_data(data)
+
+        # 3D array-like
+        for chunk_size in (1, 7, 50, 64):
+            ret = nanmean_image_chunks(data, chunk_size=chunk_size)
+            assert ret.dtype == dtype
+            np.testing.assert_allclose(expected, ret, rtol=1e-5)
+
+        # memory-mapped file
+        fp = tmp_path / "data.npy"
+        np.save(fp, data)
+        np.testing.assert_allclose(
+            expected, nanmean_image_chunks(np.load(fp, mmap_mode='r'), chunk_size=16), rtol=1e-5)
+
+        # iterable of chunks
+        np.testing.assert_allclose(
+            expected, nanmean_image_chunks(iter([data[:20], data[20:21], data[21:]])), rtol=1e-5)
+
+        with pytest.raises(ValueError):
+            nanmean_image_chunks([])
+        # chunks have different shapes
+        with pytest.raises(ValueError):
+            nanmean_image_chunks([data, data[:, :2]])
+
     def testMovingAverage(self):
         dtype = IMAGE_DTYPE
 
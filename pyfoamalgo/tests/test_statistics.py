@@ -2,14 +2,15 @@ import pytest
 from unittest.mock import patch
 
 import math
+import pickle
 
 import numpy as np
 
 from pyfoamalgo.config import __NAN_DTYPES__, __ALL_DTYPES__
 from pyfoamalgo.statistics import (
-    histogram1d, hist_with_stats, nanhist_with_stats, compute_statistics,
+    histogram1d, histogram2d, hist_with_stats, nanhist_with_stats, compute_statistics,
     _get_outer_edges, nanmean, nansum, nanstd, nanvar, nanmin, nanmax,
-    quick_min_max
+    nan_describe, quick_min_max, RunningStats, PixelCorrelation, pixel_correlation
 )
 
 _patch_dict = {
@@ -44,6 +45,26 @@ class TestStatistics:
         assert quick_min_max(arr) == (1., 2.)
         assert quick_min_max(arr, q=0.9) == (1, 2)
 
+        # test 3D array
+        arr = np.array([[[np.nan, 1, 2], [3, 4, 5]], [[6, 7, 8], [9, 10, np.nan]]], dtype=np.float32)
+        assert quick_min_max(arr) == (1, 10)
+        assert quick_min_max(arr, q=0.8) == (3, 8)
+
+        arr = np.random.rand(20, 100, 100)
+        arr[:, ::7] = np.nan
+        # the second axis is halved once
+        sampled = arr[:, ::2]
+        assert quick_min_max(arr) == (np.nanmin(sampled), np.nanmax(sampled))
+        assert quick_min_max(arr, q=0.3) == (
+            np.nanquantile(sampled, 0.3, interpolation='nearest'),
+            np.nanquantile(sampled, 0.7, interpolation='nearest'))
+
+        # test all nan
+        assert all(np.isnan(quick_min_max(np.full((2, 2), np.nan))))
+
+        with pytest.raises(ValueError):
+            quick_min_max(np.ones(10))
+
     def _assert_array_almost_equal(self, a, b):
         np.testing.assert_array_almost_equal(a, b)
         if isinstance(a, np.ndarray):
@@ -87,6 +108,122 @@ class TestStatistics:
             self._assert_array_almost_equal(f_py(a3d, axis=(-2, -1)), f_cpp(a3d, axis=(-2, -1)))
             self._assert_array_almost_equal(f_py(a4d, axis=(-2, -1)), f_cpp(a4d, axis=(-2, -1)))
 
+    @pytest.mark.parametrize("dtype", __NAN_DTYPES__)
+    @pytest.mark.parametrize("f_cpp, f_py",
+                             [(nanmean, np.nanmean),
+                              (nansum, np.nansum),
+                              (nanstd, np.nanstd),
+                              (nanvar, np.nanvar),
+                              (nanmin, np.nanmin),
+                              (nanmax, np.nanmax)])
+    def testParallelNanReducer(self, f_cpp, f_py, dtype):
+        # (pulses, modules, y, x)
+        a4d = np.random.rand(4, 3, 16, 128).astype(dtype)
+        a4d[:, :, ::3, ::7] = np.nan
+        a4d[:, 0, 0, 0] = np.nan
+
+        with np.warnings.catch_warnings():
+            np.warnings.simplefilter("ignore", category=RuntimeWarning)
+
+            for axis in [None, 0, (0, 1), (0, 1, 2), (-2, -1), (1, 2, 3), -1]:
+                ret = f_cpp(a4d, axis=axis)
+                np.testing.assert_allclose(f_py(a4d, axis=axis), ret, rtol=1e-5)
+                if isinstance(ret, np.ndarray):
+                    assert ret.dtype == dtype
+
+            # output buffer
+            out = np.zeros((16, 128), dtype=dtype)
+            assert f_cpp(a4d, axis=(0, 1), out=out) is out
+            np.testing.assert_allclose(f_py(a4d, axis=(0, 1)), out, rtol=1e-5)
+            out = np.zeros((4, 3), dtype=np.float64)
+            assert f_cpp(a4d, axis=(2, 3), out=out) is out
+            np.testing.assert_allclose(f_py(a4d, axis=(2, 3)), out, rtol=1e-5)
+            # output buffer with a wrong shape or dtype
+            with pytest.raises(ValueError):
+                f_cpp(a4d, axis=(2, 3), out=np.zeros((1, 3), dtype=dtype))
+            with pytest.raises(ValueError):
+                f_cpp(a4d, axis=(2, 3), out=np.zeros((4, 3), dtype=np.int64))
+
+            # non-contiguous array and axes which are neither leading nor trailing
+            np.testing.assert_allclose(f_py(a4d[:, ::2], axis=0), f_cpp(a4d[:, ::2], axis=0), rtol=1e-5)
+            np.testing.assert_allclose(f_py(a4d, axis=(0, 2)), f_cpp(a4d, axis=(0, 2)), rtol=1e-5)
+
+    def testParallelNanReducerNormalized(self):
+        a = np.random.rand(10, 4, 5).astype(np.float32)
+        out = np.zeros((4, 5), dtype=np.float32)
+        assert nanstd(a, axis=0, normalized=True, out=out) is out
+        np.testing.assert_allclose(np.nanstd(a, axis=0) / np.nanmean(a, axis=0), out, rtol=1e-5)
+        np.testing.assert_allclose(np.nanvar(a, axis=0) / np.nanmean(a, axis=0) ** 2,
+                                   nanvar(a, axis=0, normalized=True), rtol=1e-5)
+
+    @pytest.mark.parametrize("f, name", [(nansum, 'sum'), (nanmean, 'mean'),
+                                         (nanvar, 'var'), (nanstd, 'std')])
+    @pytest.mark.parametrize("dtype", __ALL_DTYPES__)
+    def testMaskedWeightedNanReducer(self, f, name, dtype):
+        def reference(a, axis, mask, weights):
+            w = np.broadcast_to(np.where(mask, 0., weights), a.shape)
+            w = np.where(np.isnan(a), 0., w)
+            x = np.where(w == 0, 0., a)
+            w_sum = np.sum(w, axis=axis, keepdims=True)
+            mean = np.sum(w * x, axis=axis, keepdims=True) / w_sum
+            var = np.sum(w * (x - mean) ** 2, axis=axis, keepdims=True) / w_sum
+            ret = {'sum': np.sum(w * x, axis=axis, keepdims=True),
+                   'mean': mean, 'var': var, 'std': np.sqrt(var)}[name]
+            return np.squeeze(ret, axis=axis)
+
+        # (pulses, y, x)
+        a = np.random.randint(1, 100, size=(4, 16, 128)).astype(dtype)
+        if dtype in __NAN_DTYPES__:
+            a[:, ::3, ::7] = np.nan
+        mask = np.zeros((16, 128), dtype=bool)
+        mask[::2, 1::5] = True
+        mask[:, 0] = True
+        weights = np.random.rand(16, 128)
+        weights[1, 1] = 0
+
+        with np.warnings.catch_warnings():
+            np.warnings.simplefilter("ignore", category=RuntimeWarning)
+
+            for axis in [None, 0, (1, 2), -1, (0, 1), (0, 2)]:
+                np.testing.assert_allclose(reference(a, axis, mask, 1.),
+                                           f(a, axis=axis, mask=mask), rtol=1e-5)
+                np.testing.assert_allclose(reference(a, axis, False, weights),
+                                           f(a, axis=axis, weights=weights), rtol=1e-5)
+                np.testing.assert_allclose(reference(a, axis, mask, weights),
+                                           f(a, axis=axis, mask=mask, weights=weights), rtol=1e-5)
+
+            # the mask is broadcast over the leading axes
+            np.testing.assert_allclose(reference(a, None, mask[0], 1.),
+                                       f(a, mask=mask[0]), rtol=1e-5)
+
+            # output buffer
+            if dtype in __NAN_DTYPES__:
+                out = np.zeros(4, dtype=dtype)
+                assert f(a, axis=(1, 2), mask=mask, out=out) is out
+                np.testing.assert_allclose(reference(a, (1, 2), mask, 1.), out, rtol=1e-5)
+
+            # all masked
+            ret = f(a, axis=(1, 2), mask=np.ones_like(mask))
+            if name == 'sum':
+                np.testing.assert_array_equal(0, ret)
+            else:
+                assert np.isnan(ret).all()
+
+        with pytest.raises(ValueError):
+            f(a, mask=mask.T)
+        with pytest.raises(ValueError):
+            f(a, mask=mask, weights=weights[0])
+
+    def testMaskedWeightedNanReducerNormalized(self):
+        a = np.random.rand(10, 4, 5).astype(np.float32)
+        mask = np.random.rand(4, 5) > 0.5
+        ref_mean = np.nanmean(np.where(mask, np.nan, a), axis=(1, 2))
+        ref_std = np.nanstd(np.where(mask, np.nan, a), axis=(1, 2))
+        np.testing.assert_allclose(ref_std / ref_mean,
+                                   nanstd(a, axis=(1, 2), mask=mask, normalized=True), rtol=1e-5)
+        np.testing.assert_allclose(ref_std ** 2 / ref_mean ** 2,
+                                   nanvar(a, axis=(1, 2), mask=mask, normalized=True), rtol=1e-5)
+
     @pytest.mark.parametrize("f_cpp, f_py",
                              [(nanmean, np.nanmean),
                               (nansum, np.nansum),
@@ -103,6 +240,134 @@ class TestStatistics:
             f_cpp(a1d)
             mocked.assert_called_once()
 
+    @pytest.mark.parametrize("dtype", __ALL_DTYPES__)
+    def testNanDescribe(self, dtype):
+        a = np.random.randint(0, 100, size=(4, 3, 16, 10)).astype(dtype)
+        if dtype in __NAN_DTYPES__:
+            a[:, :, ::3, ::7] = np.nan
+            a[:, 0, 0, 0] = np.nan
+
+        with np.warnings.catch_warnings():
+            np.warnings.simplefilter("ignore", category=RuntimeWarning)
+
+            for axis in [None, 0, (0, 1), (-2, -1), (1, 2, 3), (0, 2)]:
+                desc = nan_describe(a, axis=axis)
+                np.testing.assert_array_equal(np.count_nonzero(~np.isnan(a), axis=axis), desc.count)
+                np.testing.assert_allclose(np.nansum(a, axis=axis), desc.sum, rtol=1e-5)
+                np.testing.assert_allclose(np.nanmean(a, axis=axis), desc.mean, rtol=1e-5)
+                np.testing.assert_allclose(np.nanvar(a, axis=axis), desc.var, rtol=1e-5)
+                np.testing.assert_array_equal(np.nanmin(a, axis=axis), desc.min)
+                np.testing.assert_array_equal(np.nanmax(a, axis=axis), desc.max)
+
+        desc = nan_describe(np.array([np.nan, np.nan], dtype=np.float32))
+        assert 0 == desc.count
+        assert 0 == desc.sum
+        assert np.isnan(desc.mean)
+        assert np.isnan(desc.var)
+        assert np.isnan(desc.min)
+        assert np.isnan(desc.max)
+
+    def testRunningStats(self):
+        # scalar
+        stats = RunningStats()
+        assert np.isnan(stats.mean)
+        stats.update(1)
+        stats.update([2., 3., np.nan])
+        # empty batch
+        stats.update([])
+        assert 3 == stats.count
+        assert 2 == stats.mean
+        assert np.var([1, 2, 3]) == pytest.approx(stats.var)
+        assert np.std([1, 2, 3]) == pytest.approx(stats.std)
+        assert 1 == stats.min
+        assert 3 == stats.max
+
+        with pytest.raises(ValueError):
+            stats.update(np.ones((2, 2)))
+
+        # images accumulated by two workers
+        data = np.random.rand(20, 4, 5).astype(np.float32)
+        data[::3, 0, 0] = np.nan
+        data[:, 1, 1] = np.nan
+        stats1 = RunningStats((4, 5))
+        stats2 = RunningStats((4, 5))
+        stats1.update(data[0])
+        stats1.update(data[1:8])
+        stats2.update(data[8:])
+        stats2.update(data[:0])
+        stats1.merge(pickle.loads(pickle.dumps(stats2)))
+
+        with np.warnings.catch_warnings():
+            np.warnings.simplefilter("ignore", category=RuntimeWarning)
+
+            np.testing.assert_array_equal(np.sum(~np.isnan(data), axis=0), stats1.count)
+            np.testing.assert_allclose(np.nanmean(data, axis=0), stats1.mean, rtol=1e-6)
+            np.testing.assert_allclose(np.nanvar(data, axis=0), stats1.var, rtol=1e-5)
+            np.testing.assert_array_equal(np.nanmin(data, axis=0), stats1.min)
+            np.testing.assert_array_equal(np.nanmax(data, axis=0), stats1.max)
+
+        with pytest.raises(ValueError):
+            stats1.merge(RunningStats(20))
+
+        stats1.reset()
+        np.testing.assert_array_equal(0, stats1.count)
+        assert np.isnan(stats1.mean).all()
+
+    def testPixelCorrelation(self):
+        data = np.random.rand(30, 4, 5).astype(np.float32)
+        ref = np.random.rand(30)
+        data[::4, 0, 0] = np.nan
+        data[:, 1, 1] = np.nan
+        ref[5] = np.nan
+        # correlated and anti-correlated pixels
+        data[:, 2, 2] = 2 * ref + 1
+        data[:, 2, 3] = -ref
+
+        def reference(x, y):
+            valid = ~(np.isnan(x) | np.isnan(y))
+            if valid.sum() == 0:
+                return np.nan, np.nan, np.nan
+            x, y = x[valid], y[valid]
+            cov = np.mean((x - x.mean()) * (y - y.mean()))
+            return np.corrcoef(x, y)[0, 1], cov, cov / np.var(y)
+
+        corr, cov, slope = pixel_correlation(data, ref)
+        assert (4, 5) == corr.shape
+        with np.warnings.catch_warnings():
+            np.warnings.simplefilter("ignore", category=RuntimeWarning)
+
+            for i, j in np.ndindex(4, 5):
+                np.testing.assert_allclose(
+                    reference(data[:, i, j].astype(np.float64), ref),
+                    (corr[i, j], cov[i, j], slope[i, j]), rtol=1e-5)
+        assert corr[2, 2] == pytest.approx(1)
+        assert slope[2, 2] == pytest.approx(2)
+        assert corr[2, 3] == pytest.approx(-1)
+
+        # trains accumulated by two workers
+        corr1 = PixelCorrelation((4, 5))
+        corr2 = PixelCorrelation((4, 5))
+        corr1.update(data[:10], ref[:10])
+        corr2.update(data[10:], ref[10:])
+        # empty train
+        corr2.update(data[:0], ref[:0])
+        corr1.merge(pickle.loads(pickle.dumps(corr2)))
+        np.testing.assert_array_equal(
+            np.sum(~np.isnan(data) & ~np.isnan(ref)[:, None, None], axis=0), corr1.count)
+        np.testing.assert_allclose(corr, corr1.correlation, rtol=1e-6)
+        np.testing.assert_allclose(slope, corr1.slope, rtol=1e-6)
+
+        with pytest.raises(ValueError):
+            corr1.update(data, ref[1:])
+        with pytest.raises(ValueError):
+            corr1.update(data[:, :2], ref)
+        with pytest.raises(ValueError):
+            corr1.merge(PixelCorrelation(20))
+
+        corr1.reset()
+        np.testing.assert_array_equal(0, corr1.count)
+        assert np.isnan(corr1.covariance).all()
+
     def testNanhistWithStats(self):
         # case 1
         roi = np.array([[np.nan, 1, 2], [3, 6, np.nan]], dtype=np.float32)
@@ -146,6 +411,34 @@ class TestStatistics:
         with pytest.raises(ValueError):
             nanhist_with_stats(roi, (-np.inf, np.inf), 4)
 
+    @pytest.mark.parametrize("dtype", __NAN_DTYPES__)
+    @pytest.mark.parametrize("bin_range", [None, (-0.5, 0.5), (0.2, np.inf), (-np.inf, 0.3)])
+    def testNanhistWithStatsCpp(self, dtype, bin_range):
+        roi = np.random.randn(2, 20, 30).astype(dtype)
+        roi[roi > 1.5] = np.nan
+
+        def expected(data):
+            data = data.astype(np.float64)
+            filtered = data[~np.isnan(data)]
+            if bin_range is not None:
+                filtered = filtered[(filtered >= bin_range[0]) & (filtered <= bin_range[1])]
+            hist, bin_edges = np.histogram(
+                filtered, range=_get_outer_edges(filtered, bin_range), bins=7)
+            return (hist, (bin_edges[1:] + bin_edges[:-1]) / 2.0,
+                    *compute_statistics(filtered))
+
+        for data in (roi, roi[0], roi[0, 2:10, ::3]):
+            copied = data.copy()
+            hist, bin_centers, mean, median, std = nanhist_with_stats(data, bin_range, 7)
+            np.testing.assert_array_equal(copied, data)
+
+            hist_gt, bin_centers_gt, mean_gt, median_gt, std_gt = expected(data)
+            np.testing.assert_array_equal(hist_gt, hist)
+            np.testing.assert_array_almost_equal(bin_centers_gt, bin_centers)
+            assert mean == pytest.approx(mean_gt)
+            assert median == pytest.approx(median_gt)
+            assert std == pytest.approx(std_gt)
+
     def testHistWithStats(self):
         data = np.array([0, 1, 2, 3, 6, 0], dtype=np.float32)  # 1D
         hist, bin_centers, mean, median, std = hist_with_stats(data, (1, 3), 4)
@@ -179,6 +472,29 @@ class TestStatistics:
         with pytest.raises(ValueError):
             hist_with_stats(roi, (-np.inf, np.inf), 4)
 
+    @pytest.mark.parametrize("dtype", __ALL_DTYPES__)
+    @pytest.mark.parametrize("bin_range", [None, (10, 50), (20, np.inf), (-np.inf, 30)])
+    def testHistWithStatsCpp(self, dtype, bin_range):
+        data = np.random.randint(0, 100, size=(2, 60, 70)).astype(dtype)
+
+        def expected(data):
+            v_min, v_max = _get_outer_edges(data, bin_range)
+            filtered = data[(data >= v_min) & (data <= v_max)]
+            hist, bin_edges = np.histogram(filtered, bins=7, range=(v_min, v_max))
+            return (hist, (bin_edges[1:] + bin_edges[:-1]) / 2.0,
+                    *compute_statistics(filtered))
+
+        # 1D data is longer than a row of the C++ implementation
+        for arr in (data, data[0], data.ravel(), data[0, 2:10, ::3]):
+            hist, bin_centers, mean, median, std = hist_with_stats(arr, bin_range, 7)
+
+            hist_gt, bin_centers_gt, mean_gt, median_gt, std_gt = expected(arr)
+            np.testing.assert_array_equal(hist_gt, hist)
+            np.testing.assert_array_almost_equal(bin_centers_gt, bin_centers)
+            assert mean == pytest.approx(mean_gt)
+            assert median == pytest.approx(median_gt)
+            assert std == pytest.approx(std_gt)
+
     def testFindActualRange(self):
         arr = np.array([1, 2, 3, 4])
         assert (-1.5, 2.5) == _get_outer_edges(arr, (-1.5, 2.5))
@@ -256,6 +572,90 @@ class TestStatistics:
             np.testing.assert_array_almost_equal(hist_np, hist)
             np.testing.assert_array_almost_equal(edges_np, edges)
 
+    @pytest.mark.parametrize("dtype", __NAN_DTYPES__)
+    def testHistogram1dNanAndWeights(self, dtype):
+        arr = np.random.randn(200).astype(dtype)
+        arr[::7] = np.nan
+        weights = np.random.rand(200)
+        finite = ~np.isnan(arr)
+
+        hist, edges = histogram1d(arr, bins=8)
+        hist_np, edges_np = np.histogram(arr[finite], bins=8)
+        np.testing.assert_array_equal(hist_np, hist)
+        np.testing.assert_array_almost_equal(edges_np, edges)
+
+        hist, edges = histogram1d(arr, bins=8, range=(-1, 1), weights=weights)
+        hist_np, _ = np.histogram(arr[finite], bins=8, range=(-1, 1), weights=weights[finite])
+        assert hist.dtype == np.float64
+        np.testing.assert_array_almost_equal(hist_np, hist)
+
+        with pytest.raises(ValueError):
+            histogram1d(arr, bins=8, range=(-1, 1), weights=weights[:-1])
+        with pytest.raises(ValueError):
+            histogram1d(arr, bins=8, range=(-np.inf, 1))
+
+    @pytest.mark.parametrize("dtype", __ALL_DTYPES__)
+    def testHistogram1dAxis(self, dtype):
+        arr = (100 * np.random.rand(4, 5, 6)).astype(dtype)
+        weights = np.random.rand(4, 5, 6)
+
+        for axis in (0, 1, -1):
+            moved = np.moveaxis(arr, axis, 0)
+            moved_weights = np.moveaxis(weights, axis, 0)
+
+            hist, edges = histogram1d(arr, bins=5, range=(10, 90), axis=axis)
+            assert hist.shape == (arr.shape[axis], 5)
+            for i in range(arr.shape[axis]):
+                hist_np, edges_np = np.histogram(moved[i], bins=5, range=(10, 90))
+                np.testing.assert_array_equal(hist_np, hist[i])
+            np.testing.assert_array_almost_equal(edges_np, edges)
+
+            hist, _ = histogram1d(arr, bins=5, range=(10, 90), weights=weights, axis=axis)
+            for i in range(arr.shape[axis]):
+                hist_np, _ = np.histogram(moved[i], bins=5, range=(10, 90),
+                                          weights=moved_weights[i])
+                np.testing.assert_array_almost_equal(hist_np, hist[i])
+
+        # fallback
+        arr = arr.astype(np.int8)
+        hist, _ = histogram1d(arr, bins=5, range=(10, 90), axis=0)
+        for i in range(arr.shape[0]):
+            np.testing.assert_array_equal(
+                np.histogram(arr[i], bins=5, range=(10, 90))[0], hist[i])
+
+    @pytest.mark.parametrize("dtype", __NAN_DTYPES__)
+    def testHistogram2d(self, dtype):
+        x = np.random.randn(10, 20).astype(dtype)
+        y = np.random.randn(10, 20).astype(dtype)
+        weights = np.random.rand(10, 20)
+
+        with patch("numpy.histogram2d") as mocked:
+            histogram2d(x, y)
+            mocked.assert_not_called()
+
+        hist, x_edges, y_edges = histogram2d(x, y, bins=(4, 6))
+        hist_np, x_edges_np, y_edges_np = np.histogram2d(x.ravel(), y.ravel(), bins=(4, 6))
+        np.testing.assert_array_equal(hist_np, hist)
+        np.testing.assert_array_almost_equal(x_edges_np, x_edges)
+        np.testing.assert_array_almost_equal(y_edges_np, y_edges)
+
+        bin_range = ((-1, 1), (-0.5, 2))
+        hist, _, _ = histogram2d(x, y, bins=5, range=bin_range, weights=weights)
+        hist_np, _, _ = np.histogram2d(
+            x.ravel(), y.ravel(), bins=5, range=bin_range, weights=weights.ravel())
+        np.testing.assert_array_almost_equal(hist_np, hist)
+
+        # nan is ignored
+        x[0, 0] = np.nan
+        y[1, 1] = np.nan
+        hist, _, _ = histogram2d(x, y, bins=5, range=bin_range)
+        finite = ~np.isnan(x) & ~np.isnan(y)
+        hist_np, _, _ = np.histogram2d(x[finite], y[finite], bins=5, range=bin_range)
+        np.testing.assert_array_equal(hist_np, hist)
+
+        with pytest.raises(ValueError):
+            histogram2d(x, y[:, :-1], bins=5, range=bin_range)
+
     def testHistogram1dFallback(self):
         dtype = np.int8
         assert(dtype not in __ALL_DTYPES__)
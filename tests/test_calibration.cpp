@@ -0,0 +1,219 @@
+#include "gtest/gtest.h"
+#include "gmock/gmock.h"
+
+#include "xtensor/xtensor.hpp"
+#include "xtensor/xview.hpp"
+#include "xtensor/xmath.hpp"
+
+#include "foamalgo/calibration.hpp"
+#include "foamalgo/geometry.hpp"
+
+
+namespace foam::test
+{
+
+using ::testing::ElementsAre;
+using ::testing::NanSensitiveFloatEq;
+
+static constexpr auto nan = std::numeric_limits<float>::quiet_NaN();
+static const auto nan_mt = NanSensitiveFloatEq(nan);
+
+TEST(TestDarkBuilder, TestGeneral)
+{
+  DarkBuilder<float> builder(2, 1, 2);
+
+  xt::xtensor<float, 3> wrong_shape = xt::ones<float>({2, 2, 2});
+  EXPECT_THROW(builder.update(wrong_shape), std::invalid_argument);
+
+  xt::xtensor<uint16_t, 3> train1 {{{10, 20}}, {{30, 0}}};
+  xt::xtensor<uint16_t, 3> train2 {{{12, 20}}, {{34, 0}}};
+  builder.update(train1);
+  builder.update(train2);
+
+  EXPECT_THAT(builder.count(), ElementsAre(2, 2, 2, 2));
+  EXPECT_THAT(builder.offset(), ElementsAre(11.f, 20.f, 32.f, 0.f));
+  EXPECT_THAT(builder.noise(), ElementsAre(1.f, 0.f, 2.f, 0.f));
+
+  // zero noise
+  EXPECT_THAT(builder.badPixelMask(-1000.f, 1000.f, 0.f, 1000.f), ElementsAre(false, true, false, true));
+  // offset and noise range
+  EXPECT_THAT(builder.badPixelMask(0.f, 20.f, 0.f, 1.5f), ElementsAre(false, true, true, true));
+
+  builder.reset();
+  EXPECT_THAT(builder.count(), ElementsAre(0, 0, 0, 0));
+  EXPECT_THAT(builder.offset(), ElementsAre(nan_mt, nan_mt, nan_mt, nan_mt));
+  EXPECT_THAT(builder.noise(), ElementsAre(nan_mt, nan_mt, nan_mt, nan_mt));
+}
+
+TEST(TestDarkBuilder, TestNan)
+{
+  DarkBuilder<float> builder(1, 1, 2);
+
+  xt::xtensor<float, 3> train1 {{{1.f, nan}}};
+  xt::xtensor<float, 3> train2 {{{3.f, nan}}};
+  builder.update(train1);
+  builder.update(train2);
+
+  EXPECT_THAT(builder.count(), ElementsAre(2, 0));
+  EXPECT_THAT(builder.offset(), ElementsAre(2.f, nan_mt));
+  EXPECT_THAT(builder.badPixelMask(-10.f, 10.f, 0.f, 10.f), ElementsAre(false, true));
+}
+
+TEST(TestDarkBuilder, TestCellIds)
+{
+  DarkBuilder<float> builder(3, 1, 1);
+
+  xt::xtensor<float, 3> train {{{1.f}}, {{2.f}}};
+  EXPECT_THROW(builder.update(train, {0}), std::invalid_argument);
+  EXPECT_THROW((builder.update(train, {0, 3})), std::invalid_argument);
+  EXPECT_THROW((builder.update(train, {1, 1})), std::invalid_argument);
+
+  builder.update(train, {2, 0});
+  EXPECT_THAT(builder.count(), ElementsAre(1, 0, 1));
+  EXPECT_THAT(builder.offset(), ElementsAre(2.f, nan_mt, 1.f));
+}
+
+TEST(TestDarkBuilder, TestSigmaClipping)
+{
+  DarkBuilder<float> builder(1, 1, 1);
+
+  std::vector<float> samples {10.f, 11.f, 9.f, 10.f, 11.f, 9.f, 10.f, 100.f};
+  auto stream = [&builder, &samples] ()
+  {
+    for (auto v : samples)
+    {
+      xt::xtensor<float, 3> train {{{v}}};
+      builder.update(train);
+    }
+  };
+
+  EXPECT_THROW(builder.nextPass(0.), std::invalid_argument);
+
+  stream();
+  EXPECT_EQ(1, builder.nPasses());
+  EXPECT_THAT(builder.count(), ElementsAre(8));
+  EXPECT_THAT(builder.offset(), ElementsAre(21.25f));
+
+  builder.nextPass(2.);
+  EXPECT_EQ(2, builder.nPasses());
+  EXPECT_THAT(builder.count(), ElementsAre(0));
+
+  stream();
+  // the outlier is rejected
+  EXPECT_THAT(builder.count(), ElementsAre(7));
+  EXPECT_THAT(builder.offset(), ElementsAre(10.f));
+}
+
+TEST(TestCommonModePolicy, TestEstimate)
+{
+  std::vector<float> odd {4.f, 1.f, 3.f};
+  EXPECT_EQ(3.f, MedianCommonModePolicy::estimate(odd));
+  std::vector<float> even {4.f, 1.f, 3.f, 8.f};
+  EXPECT_EQ(3.5f, MedianCommonModePolicy::estimate(even));
+  std::vector<float> mean {4.f, 1.f, 3.f, 8.f};
+  EXPECT_EQ(4.f, MeanCommonModePolicy::estimate(mean));
+}
+
+TEST(TestCorrectCommonMode, TestImage)
+{
+  constexpr auto ah = EPix100::asic_shape[0];
+  constexpr auto aw = EPix100::asic_shape[1];
+
+  xt::xtensor<float, 2> wrong_shape = xt::zeros<float>({ah, aw});
+  EXPECT_THROW((correctCommonMode<EPix100, MedianCommonModePolicy>(wrong_shape)), std::invalid_argument);
+
+  // each ASIC has a different common mode
+  xt::xtensor<float, 2> img = xt::empty<float>(EPix100::module_shape);
+  xt::view(img, xt::range(0, ah), xt::range(0, aw)) = 1.f;
+  xt::view(img, xt::range(0, ah), xt::range(aw, 2 * aw)) = 2.f;
+  xt::view(img, xt::range(ah, 2 * ah), xt::range(0, aw)) = -3.f;
+  xt::view(img, xt::range(ah, 2 * ah), xt::range(aw, 2 * aw)) = 4.f;
+  // photon hit and nan
+  img(0, 0) = 100.f;
+  img(ah, aw) = nan;
+
+  auto img_mean = img;
+  correctCommonMode<EPix100, MeanCommonModePolicy>(img_mean, 10.f);
+  EXPECT_EQ(99.f, img_mean(0, 0));
+  EXPECT_EQ(0.f, img_mean(0, 1));
+  EXPECT_EQ(0.f, img_mean(0, aw));
+  EXPECT_EQ(0.f, img_mean(ah, 0));
+  EXPECT_THAT(img_mean(ah, aw), nan_mt);
+  EXPECT_EQ(0.f, img_mean(ah, aw + 1));
+
+  // without threshold, the photon hit is filtered by the median
+  correctCommonMode<EPix100, MedianCommonModePolicy>(img);
+  EXPECT_EQ(99.f, img(0, 0));
+  EXPECT_EQ(0.f, xt::nansum(img)() - 99.f);
+}
+
+TEST(TestCorrectCommonMode, TestImageArrayPerRow)
+{
+  constexpr auto aw = JungFrau::asic_shape[1];
+
+  xt::xtensor<float, 3> imgs = xt::zeros<float>({2ul, JungFrau::module_shape[0], JungFrau::module_shape[1]});
+  for (size_t j = 0; j < JungFrau::module_shape[0]; ++j)
+  {
+    xt::view(imgs, 0, j, xt::all()) = static_cast<float>(j);
+    xt::view(imgs, 1, j, xt::all()) = static_cast<float>(2 * j);
+  }
+
+  auto imgs_per_asic = imgs;
+  correctCommonMode<JungFrau, MeanCommonModePolicy>(imgs_per_asic);
+  // the first ASIC has common mode (0 + 255) / 2 = 127.5 for the first image
+  EXPECT_EQ(-127.5f, imgs_per_asic(0, 0, 0));
+  EXPECT_EQ(-255.f, imgs_per_asic(1, 0, 0));
+
+  // masked pixel
+  imgs(0, 1, 1) = 1000.f;
+  imgs(1, 1, 1) = 1000.f;
+
+  xt::xtensor<bool, 2> mask = xt::zeros<bool>(JungFrau::module_shape);
+  mask(1, 1) = true;
+
+  correctCommonMode<JungFrau, MeanCommonModePolicy>(
+    imgs, mask, std::numeric_limits<float>::infinity(), true);
+  EXPECT_EQ(999.f, imgs(0, 1, 1));
+  EXPECT_EQ(998.f, imgs(1, 1, 1));
+  imgs(0, 1, 1) = 0.f;
+  imgs(1, 1, 1) = 0.f;
+  EXPECT_THAT(imgs, ::testing::Each(0.f));
+
+  xt::xtensor<bool, 2> wrong_mask = xt::zeros<bool>({2ul, aw});
+  EXPECT_THROW((correctCommonMode<JungFrau, MeanCommonModePolicy>(imgs, wrong_mask)), std::invalid_argument);
+}
+
+TEST(TestCorrectMultiGain, TestGeneral)
+{
+  xt::xtensor<uint16_t, 3> src {{{10, 20}}, {{30, 40}}};
+  xt::xtensor<uint8_t, 3> stages {{{0, 1}}, {{2, 3}}};
+  // (gain stages, memory cells, y, x)
+  xt::xtensor<float, 4> gain {{{{1.f, 1.f}}, {{1.f, 1.f}}},
+                              {{{2.f, 2.f}}, {{2.f, 2.f}}},
+                              {{{4.f, 4.f}}, {{4.f, 4.f}}}};
+  xt::xtensor<float, 4> offset {{{{1.f, 2.f}}, {{3.f, 4.f}}},
+                                {{{5.f, 6.f}}, {{7.f, 8.f}}},
+                                {{{9.f, 10.f}}, {{11.f, 12.f}}}};
+  xt::xtensor<float, 3> out = xt::zeros<float>({2, 1, 2});
+
+  correctMultiGainImageData(src, stages, gain, offset, out);
+  // the last pixel has an invalid gain stage
+  EXPECT_THAT(out, ElementsAre(9.f, 28.f, 76.f, nan_mt));
+
+  correctMultiGainImageData(src, stages, gain, offset, std::vector<size_t>{1, 0}, out);
+  EXPECT_THAT(out, ElementsAre(7.f, 24.f, 84.f, nan_mt));
+
+  EXPECT_THROW(correctMultiGainImageData(src, stages, gain, offset, std::vector<size_t>{2, 0}, out),
+               std::invalid_argument);
+  EXPECT_THROW(correctMultiGainImageData(src, stages, gain, offset, std::vector<size_t>{0}, out),
+               std::invalid_argument);
+
+  xt::xtensor<float, 3> wrong_out = xt::zeros<float>({2, 2, 2});
+  EXPECT_THROW(correctMultiGainImageData(src, stages, gain, offset, wrong_out), std::invalid_argument);
+  xt::xtensor<float, 4> wrong_offset = xt::zeros<float>({2, 2, 1, 2});
+  EXPECT_THROW(correctMultiGainImageData(src, stages, gain, wrong_offset, out), std::invalid_argument);
+  xt::xtensor<float, 4> wrong_cells = xt::zeros<float>({3, 3, 1, 2});
+  EXPECT_THROW(correctMultiGainImageData(src, stages, wrong_cells, wrong_cells, out), std::invalid_argument);
+}
+
+} //foam::test
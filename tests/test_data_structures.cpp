@@ -0,0 +1,216 @@
+#include <iterator>
+#include <limits>
+#include <thread>
+#include <vector>
+
+#include "gtest/gtest.h"
+#include "gmock/gmock.h"
+
+#include "xtensor/xtensor.hpp"
+
+#include "foamalgo/data_structures.hpp"
+
+
+namespace foam::test
+{
+
+using ::testing::ElementsAre;
+using ::testing::NanSensitiveDoubleEq;
+
+static const auto nan_mt = NanSensitiveDoubleEq(std::numeric_limits<double>::quiet_NaN());
+
+TEST(TestOneWayAccuPairSequence, TestGeneral)
+{
+  EXPECT_THROW(OneWayAccuPairSequence<double>(0., 10, 2), std::invalid_argument);
+  EXPECT_THROW(OneWayAccuPairSequence<double>(0.1, 10, 0), std::invalid_argument);
+
+  OneWayAccuPairSequence<double> seq(0.1, 2, 2);
+  EXPECT_TRUE(seq.appendDry(1.));
+
+  seq.append(1., 0.3);
+  EXPECT_FALSE(seq.appendDry(1.05));
+  EXPECT_TRUE(seq.appendDry(1.2));
+  EXPECT_EQ(0, seq.size());
+  // the first point is discarded since it has only one sample
+  seq.append(2., 0.4);
+  seq.append(2.02, 0.5);
+  EXPECT_EQ(1, seq.size());
+  const auto& p = seq.points()[0];
+  EXPECT_DOUBLE_EQ(2.01, p.x_avg);
+  EXPECT_DOUBLE_EQ(0.45, p.y_avg);
+  EXPECT_DOUBLE_EQ(0.425, p.y_min);
+  EXPECT_DOUBLE_EQ(0.475, p.y_max);
+  EXPECT_DOUBLE_EQ(0.05, p.y_std);
+  EXPECT_EQ(2, p.count);
+
+  // the storage is rolled over when the over-capacity region is full
+  xt::xtensor<double, 1> xs {3., 3., 4., 4., 5., 5.};
+  xt::xtensor<double, 1> ys {1., 1., 2., 2., 3., 3.};
+  seq.extend(xs, ys);
+  EXPECT_EQ(2, seq.size());
+  EXPECT_EQ(0, seq.start());
+  EXPECT_DOUBLE_EQ(4., seq.points()[0].x_avg);
+  EXPECT_DOUBLE_EQ(5., seq.points()[1].x_avg);
+
+  xt::xtensor<double, 1> wrong_ys {1.};
+  EXPECT_THROW(seq.extend(xs, wrong_ys), std::invalid_argument);
+
+  seq.reset();
+  EXPECT_EQ(0, seq.size());
+  EXPECT_TRUE(seq.appendDry(5.));
+}
+
+TEST(TestOneWayAccuPairSequence, TestMinCountOne)
+{
+  OneWayAccuPairSequence<float> seq(0.1, 10, 1);
+  seq.append(1., 1.);
+  EXPECT_EQ(1, seq.size());
+  seq.append(1.05, 3.);
+  EXPECT_EQ(1, seq.size());
+  seq.append(2., 1.);
+  EXPECT_EQ(2, seq.size());
+  EXPECT_FLOAT_EQ(2.f, seq.points()[0].y_avg);
+  EXPECT_FLOAT_EQ(1.f, seq.points()[0].y_std);
+  EXPECT_EQ(2, seq.points()[0].count);
+}
+
+TEST(TestOneWayAccuPairSequence, TestState)
+{
+  OneWayAccuPairSequence<double> seq(0.1, 2, 2);
+  xt::xtensor<double, 1> xs {1., 1., 2., 2., 3., 3., 4.};
+  xt::xtensor<double, 1> ys {1., 2., 2., 2., 3., 4., 5.};
+  seq.extend(xs, ys);
+
+  OneWayAccuPairSequence<double> restored(0.1, 2, 2);
+  restored.setState(seq.state());
+  EXPECT_EQ(seq.start(), restored.start());
+  EXPECT_EQ(seq.size(), restored.size());
+
+  // the point being accumulated is restored as well
+  seq.append(4., 7.);
+  restored.append(4., 7.);
+  EXPECT_EQ(seq.size(), restored.size());
+  for (size_t i = 0; i < seq.points().size(); ++i)
+  {
+    EXPECT_DOUBLE_EQ(seq.points()[i].y_avg, restored.points()[i].y_avg);
+    EXPECT_DOUBLE_EQ(seq.points()[i].y_std, restored.points()[i].y_std);
+    EXPECT_EQ(seq.points()[i].count, restored.points()[i].count);
+  }
+
+  EXPECT_THROW(OneWayAccuPairSequence<double>(0.1, 3, 2).setState(seq.state()), std::invalid_argument);
+}
+
+TEST(TestSpscQueue, TestGeneral)
+{
+  EXPECT_THROW(SpscQueue<int>(0), std::invalid_argument);
+
+  SpscQueue<int> queue(3);
+  int item;
+  EXPECT_FALSE(queue.tryPop(item));
+  EXPECT_FALSE(queue.pop(item, 0.001));
+  EXPECT_TRUE(queue.empty());
+
+  EXPECT_TRUE(queue.tryPush(1));
+  EXPECT_TRUE(queue.push(2));
+  EXPECT_TRUE(queue.push(3, 0.));
+  EXPECT_FALSE(queue.push(4, 0.001));
+  EXPECT_TRUE(queue.full());
+  EXPECT_EQ(3, queue.size());
+
+  // the oldest item is dropped
+  int dropped;
+  EXPECT_TRUE(queue.pushPop(4, dropped));
+  EXPECT_EQ(1, dropped);
+
+  std::vector<int> items;
+  EXPECT_EQ(3, queue.popMany(std::back_inserter(items), 10, 0.));
+  EXPECT_THAT(items, ElementsAre(2, 3, 4));
+  EXPECT_TRUE(queue.empty());
+  EXPECT_FALSE(queue.pushPop(5, dropped));
+  EXPECT_TRUE(queue.pop(item));
+  EXPECT_EQ(5, item);
+}
+
+TEST(TestSpscQueue, TestMultiThreads)
+{
+  constexpr size_t n_items = 100000;
+  SpscQueue<size_t> queue(7);
+
+  std::thread producer([&queue] () { for (size_t i = 0; i < n_items; ++i) queue.push(i); });
+
+  std::vector<size_t> items;
+  while (items.size() < n_items) queue.popMany(std::back_inserter(items), 5);
+  producer.join();
+
+  for (size_t i = 0; i < n_items; ++i) ASSERT_EQ(i, items[i]);
+}
+
+TEST(TestBinnedAccumulator2d, TestFixedBins)
+{
+  EXPECT_THROW(BinnedAccumulator2d(0., 2., 0, 0., 2., 2), std::invalid_argument);
+  EXPECT_THROW(BinnedAccumulator2d(2., 2., 2, 0., 2., 2), std::invalid_argument);
+
+  BinnedAccumulator2d acc(0., 2., 2, 0., 2., 2);
+  EXPECT_THAT(acc.xEdges(), ElementsAre(0., 1., 2.));
+
+  acc.update(0.5, 0.5, 1.);
+  acc.update(0.5, 0.5, 3.);
+  // the last edge falls in the last bin
+  acc.update(2., 2., 5.);
+  // ignored
+  acc.update(1.5, 0.2, std::numeric_limits<double>::quiet_NaN());
+  acc.update(3., 0., 7.);
+
+  EXPECT_THAT(*acc.count(), ElementsAre(2, 0, 0, 1));
+  EXPECT_THAT(*acc.mean(), ElementsAre(2., nan_mt, nan_mt, 5.));
+  EXPECT_THAT(*acc.stdDev(), ElementsAre(1., nan_mt, nan_mt, 0.));
+
+  xt::xtensor<double, 1> xs {0.5, 1.5};
+  xt::xtensor<double, 1> vs {1., 2.};
+  xt::xtensor<double, 1> wrong_size {0.5};
+  EXPECT_THROW(acc.update(xs, wrong_size, vs), std::invalid_argument);
+  acc.update(xs, xs, vs);
+  EXPECT_THAT(*acc.count(), ElementsAre(3, 0, 0, 2));
+
+  // the returned storage stays valid after reset
+  auto count = acc.count();
+  acc.reset();
+  EXPECT_THAT(*count, ElementsAre(3, 0, 0, 2));
+  EXPECT_THAT(*acc.count(), ElementsAre(0, 0, 0, 0));
+}
+
+TEST(TestBinnedAccumulator2d, TestAutoGrow)
+{
+  BinnedAccumulator2d acc(0., 2., 2, 0., 2., 2, true, 5);
+
+  // the last edges do not grow the grid
+  acc.update(2., 2., 1.);
+  EXPECT_THAT(acc.xEdges(), ElementsAre(0., 1., 2.));
+  EXPECT_THAT(*acc.count(), ElementsAre(0, 0, 0, 1));
+  acc.reset();
+
+  acc.update(0.5, 0.5, 1.);
+  acc.update(-0.5, 2.5, 3.);
+  EXPECT_THAT(acc.xEdges(), ElementsAre(-1., 0., 1., 2.));
+  EXPECT_THAT(acc.yEdges(), ElementsAre(0., 1., 2., 3.));
+  EXPECT_THAT(*acc.count(), ElementsAre(0, 0, 1, 1, 0, 0, 0, 0, 0));
+
+  // a failing batch accumulates nothing
+  xt::xtensor<double, 1> xs {0., 100.};
+  xt::xtensor<double, 1> ys {0., 0.};
+  xt::xtensor<double, 1> vs {1., 1.};
+  EXPECT_THROW(acc.update(xs, ys, vs), std::invalid_argument);
+  EXPECT_EQ(4, acc.xEdges().size());
+
+  xs(1) = 3.5;
+  acc.update(xs, ys, vs);
+  EXPECT_THAT(acc.xEdges(), ElementsAre(-1., 0., 1., 2., 3., 4.));
+  EXPECT_EQ(2, (*acc.count())(1, 0));
+  EXPECT_EQ(1, (*acc.count())(4, 0));
+
+  acc.reset();
+  EXPECT_THAT(acc.xEdges(), ElementsAre(0., 1., 2.));
+  EXPECT_THAT(acc.yEdges(), ElementsAre(0., 1., 2.));
+}
+
+} //foam::test
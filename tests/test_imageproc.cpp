@@ -54,6 +54,63 @@ TEST(TestNanmeanImageArray, TestTwoImages)
   EXPECT_THAT(nanmeanImageArray(std::move(img1), std::move(img2)), ElementsAreArray(ret_gt));
 }
 
+TEST(TestNanmedianImageArray, TestGeneral)
+{
+  xt::xtensor<float, 3> imgs {{{1.f, nan, 2.f}, {4.f, 5.f, nan}},
+                              {{3.f, nan, 3.f}, {3.f, nan, 6.f}},
+                              {{2.f, nan, 9.f}, {2.f, 1.f, nan}},
+                              {{0.f, nan, 5.f}, {1.f, 2.f, nan}}};
+
+  EXPECT_THAT(nanmedianImageArray(imgs), ElementsAre(1.5f, nan_mt, 4.f, 2.5f, 2.f, 6.f));
+  EXPECT_THAT((nanmedianImageArray(imgs, {0, 2, 3})), ElementsAre(1.f, nan_mt, 5.f, 2.f, 2.f, nan_mt));
+
+  EXPECT_THROW(nanmedianImageArray(imgs, {}), std::invalid_argument);
+  EXPECT_THROW(nanmedianImageArray(imgs, {4}), std::invalid_argument);
+}
+
+TEST(TestNanpercentileImageArray, TestGeneral)
+{
+  xt::xtensor<float, 3> imgs {{{1.f, nan}}, {{3.f, nan}}, {{2.f, 4.f}}, {{0.f, nan}}};
+
+  EXPECT_THAT(nanpercentileImageArray(imgs, 0.), ElementsAre(0.f, 4.f));
+  EXPECT_THAT(nanpercentileImageArray(imgs, 50.), ElementsAre(1.5f, 4.f));
+  EXPECT_THAT(nanpercentileImageArray(imgs, 25.), ElementsAre(FloatEq(0.75f), 4.f));
+  EXPECT_THAT(nanpercentileImageArray(imgs, 100.), ElementsAre(3.f, 4.f));
+  EXPECT_THAT((nanpercentileImageArray(imgs, 50., {0, 1})), ElementsAre(2.f, nan_mt));
+
+  EXPECT_THROW(nanpercentileImageArray(imgs, -1.), std::invalid_argument);
+  EXPECT_THROW(nanpercentileImageArray(imgs, 100.1), std::invalid_argument);
+  EXPECT_THROW(nanpercentileImageArray(imgs, 50., {}), std::invalid_argument);
+}
+
+TEST(TestNanAccumulateImageArray, TestGeneral)
+{
+  xt::xtensor<float, 3> imgs1 {{{1.f, nan, 2.f}, {4.f, 5.f, nan}},
+                               {{1.f, nan, 3.f}, {3.f, nan, 6.f}}};
+  xt::xtensor<float, 3> imgs2 {{{2.f, nan, nan}, {2.f, 1.f, nan}}};
+
+  xt::xtensor<float, 2> sum = xt::zeros<float>({2, 3});
+  xt::xtensor<uint64_t, 2> count = xt::zeros<uint64_t>({2, 3});
+
+  nanAccumulateImageArray(imgs1, sum, count);
+  nanAccumulateImageArray(imgs2, sum, count);
+  EXPECT_THAT(sum, ElementsAre(4.f, 0.f, 5.f, 9.f, 6.f, 6.f));
+  EXPECT_THAT(count, ElementsAre(3, 0, 2, 3, 2, 1));
+
+  // accumulate in a wider type
+  xt::xtensor<double, 2> sum64 = xt::zeros<double>({2, 3});
+  count.fill(0);
+  nanAccumulateImageArray(imgs1, sum64, count);
+  nanAccumulateImageArray(imgs2, sum64, count);
+  EXPECT_THAT(sum64, ElementsAre(4., 0., 5., 9., 6., 6.));
+  EXPECT_THAT(count, ElementsAre(3, 0, 2, 3, 2, 1));
+
+  xt::xtensor<float, 2> wrong_sum = xt::zeros<float>({3, 2});
+  EXPECT_THROW(nanAccumulateImageArray(imgs1, wrong_sum, count), std::invalid_argument);
+  xt::xtensor<uint64_t, 2> wrong_count = xt::zeros<uint64_t>({2, 2});
+  EXPECT_THROW(nanAccumulateImageArray(imgs1, sum, wrong_count), std::invalid_argument);
+}
+
 TEST(TestImageDataMask, TestGeneral)
 {
   xt::xtensor<float, 2> img {{1.f, nan, 3.f}, {4.f, 5.f, nan}};
@@ -14,4 +14,416 @@ using ::testing::ElementsAreArray;
 using ::testing::NanSensitiveFloatEq;
 using ::testing::FloatEq;
 
+static constexpr auto nan = std::numeric_limits<float>::quiet_NaN();
+static constexpr auto inf = std::numeric_limits<float>::infinity();
+
+TEST(TestUniformBins, TestGeneral)
+{
+  EXPECT_THROW(detail::UniformBins(0., 1., 0), std::invalid_argument);
+  EXPECT_THROW(detail::UniformBins(1., 1., 2), std::invalid_argument);
+  EXPECT_THROW(detail::UniformBins(0., inf, 2), std::invalid_argument);
+
+  detail::UniformBins bins(1., 3., 4);
+  EXPECT_THAT(bins.edges(), ElementsAre(1., 1.5, 2., 2.5, 3.));
+  EXPECT_EQ(-1, bins.index(0.999));
+  EXPECT_EQ(0, bins.index(1.));
+  EXPECT_EQ(1, bins.index(1.5));
+  EXPECT_EQ(2, bins.index(2.4));
+  EXPECT_EQ(3, bins.index(3.));
+  EXPECT_EQ(-1, bins.index(3.001));
+  EXPECT_EQ(-1, bins.index(nan));
+}
+
+TEST(TestNanhistWithStats, TestVector)
+{
+  // longer than a row of the implementation
+  xt::xtensor<int, 1> x = xt::zeros<int>({10000});
+  x(0) = 1;
+  x(5000) = 3;
+  x(9999) = 2;
+
+  auto [hist, v_min, v_max, mean, median, std] = nanhistWithStats(x, 1., 3., 2);
+  EXPECT_THAT(hist, ElementsAre(1, 2));
+  EXPECT_EQ(1., v_min);
+  EXPECT_EQ(3., v_max);
+  EXPECT_EQ(2., mean);
+  EXPECT_EQ(2., median);
+  EXPECT_DOUBLE_EQ(std::sqrt(2. / 3.), std);
+}
+
+TEST(TestNanhistWithStats, TestImage)
+{
+  xt::xtensor<float, 2> roi {{nan, 1.f, 2.f}, {3.f, 6.f, nan}};
+
+  auto [hist, v_min, v_max, mean, median, std] = nanhistWithStats(roi, 1., 3., 4);
+  EXPECT_THAT(hist, ElementsAre(1, 0, 1, 1));
+  EXPECT_EQ(1., v_min);
+  EXPECT_EQ(3., v_max);
+  EXPECT_DOUBLE_EQ(2., mean);
+  EXPECT_DOUBLE_EQ(2., median);
+  EXPECT_DOUBLE_EQ(std::sqrt(2. / 3.), std);
+
+  // outer edges are determined by data
+  std::tie(hist, v_min, v_max, mean, median, std) = nanhistWithStats(roi, -inf, inf, 5);
+  EXPECT_THAT(hist, ElementsAre(1, 1, 1, 0, 1));
+  EXPECT_EQ(1., v_min);
+  EXPECT_EQ(6., v_max);
+  EXPECT_DOUBLE_EQ(3., mean);
+  EXPECT_DOUBLE_EQ(2.5, median);
+
+  // no valid value
+  std::tie(hist, v_min, v_max, mean, median, std) = nanhistWithStats(roi, 10., inf, 2);
+  EXPECT_THAT(hist, ElementsAre(0, 0));
+  EXPECT_EQ(10., v_min);
+  EXPECT_EQ(11., v_max);
+  EXPECT_TRUE(std::isnan(mean));
+  EXPECT_TRUE(std::isnan(median));
+  EXPECT_TRUE(std::isnan(std));
+
+  // finite outer edges cannot be found
+  roi(0, 0) = -inf;
+  EXPECT_THROW(nanhistWithStats(roi, -inf, inf, 4), std::invalid_argument);
+  EXPECT_THROW(nanhistWithStats(roi, 2., 1., 4), std::invalid_argument);
+}
+
+TEST(TestNanhistWithStats, TestLargeMedianBin)
+{
+  // more values in the bin of the median than can be gathered at once
+  xt::xtensor<double, 2> roi = xt::empty<double>({400, 500});
+  for (size_t k = 0; k < roi.size(); ++k) roi.flat(k) = static_cast<double>(k * 7919 % roi.size());
+
+  auto [hist, v_min, v_max, mean, median, std] = nanhistWithStats(roi, -inf, inf, 2);
+  EXPECT_THAT(hist, ElementsAre(100000, 100000));
+  EXPECT_EQ(99999.5, median);
+
+  // ties cannot be told apart by refining the bins
+  for (size_t k = 0; k < roi.size(); ++k) roi.flat(k) = static_cast<double>(k % 3);
+  std::tie(hist, v_min, v_max, mean, median, std) = nanhistWithStats(roi, -inf, inf, 1);
+  EXPECT_EQ(1., median);
+}
+
+TEST(TestNanhistWithStats, TestImageArray)
+{
+  xt::xtensor<double, 3> roi {{{nan, 1., 2.}, {3., 6., nan}},
+                              {{nan, 0., 1.}, {2., 5., nan}}};
+
+  auto [hist, v_min, v_max, mean, median, std] = nanhistWithStats(roi, 1., 3., 4);
+  EXPECT_THAT(hist, ElementsAre(2, 0, 2, 1));
+  EXPECT_DOUBLE_EQ(1.8, mean);
+  EXPECT_DOUBLE_EQ(2., median);
+  EXPECT_DOUBLE_EQ(std::sqrt(0.56), std);
+}
+
+TEST(TestHistogram, TestHistogram1d)
+{
+  xt::xtensor<float, 1> x {0.f, 1.f, nan, 2.f, 3.f, 6.f, 1.5f};
+  EXPECT_THAT(histogram1d(x, 1., 3., 4), ElementsAre(1, 1, 1, 1));
+
+  xt::xtensor<double, 1> weights {1., 2., 3., 4., 5., 6., 7.};
+  EXPECT_THAT(histogram1d(x, weights, 1., 3., 2), ElementsAre(9., 9.));
+
+  xt::xtensor<double, 1> wrong_weights {1., 2.};
+  EXPECT_THROW(histogram1d(x, wrong_weights, 1., 3., 2), std::invalid_argument);
+  EXPECT_THROW(histogram1d(x, 1., 1., 2), std::invalid_argument);
+  EXPECT_THROW(histogram1d(x, 1., inf, 2), std::invalid_argument);
+
+  // histogram of each row
+  xt::xtensor<float, 2> x2 {{0.f, 1.f, nan, 2.f}, {3.f, 6.f, 1.5f, 1.f}};
+  auto hist = histogram1d(x2, 1., 3., 2);
+  EXPECT_THAT(hist, ElementsAre(1, 1, 2, 1));
+  EXPECT_EQ(2, hist.shape()[0]);
+
+  xt::xtensor<double, 2> w2 {{1., 2., 3., 4.}, {5., 6., 7., 8.}};
+  EXPECT_THAT(histogram1d(x2, w2, 1., 3., 2), ElementsAre(2., 4., 15., 5.));
+}
+
+TEST(TestHistogram, TestHistogram2d)
+{
+  xt::xtensor<float, 1> x {0.f, 1.f, nan, 2.f, 3.f, 0.5f};
+  xt::xtensor<float, 1> y {0.f, 1.f, 1.f, 2.f, nan, 2.f};
+
+  auto hist = histogram2d(x, y, 0., 2., 2, 0., 2., 4);
+  EXPECT_EQ(2, hist.shape()[0]);
+  EXPECT_EQ(4, hist.shape()[1]);
+  EXPECT_THAT(hist, ElementsAre(1, 0, 0, 1,
+                                0, 0, 1, 1));
+
+  xt::xtensor<double, 1> weights {1., 2., 3., 4., 5., 6.};
+  EXPECT_THAT(histogram2d(x, y, weights, 0., 2., 2, 0., 2., 4), ElementsAre(1., 0., 0., 6.,
+                                                                             0., 0., 2., 4.));
+
+  xt::xtensor<float, 1> wrong_y {0.f, 1.f};
+  EXPECT_THROW(histogram2d(x, wrong_y, 0., 2., 2, 0., 2., 4), std::invalid_argument);
+}
+
+TEST(TestNanreduce, TestKahanAccumulator)
+{
+  detail::KahanAccumulator acc;
+  acc.push(1.);
+  for (int i = 0; i < 10; ++i) acc.push(1e-16);
+  // naive summation loses all the small values
+  EXPECT_DOUBLE_EQ(1. + 1e-15, acc.value());
+  EXPECT_EQ(11, acc.count);
+
+  detail::KahanAccumulator other;
+  other.push(-1.);
+  acc.merge(other);
+  EXPECT_DOUBLE_EQ(1e-15, acc.value());
+}
+
+TEST(TestNanreduce, TestGeneral)
+{
+  xt::xtensor<float, 1> x {nan, 1.f, 2.f, 3.f, nan, 6.f};
+  EXPECT_FLOAT_EQ(12.f, nanreduce<NansumPolicy>(x));
+  EXPECT_FLOAT_EQ(3.f, nanreduce<NanmeanPolicy>(x));
+  EXPECT_FLOAT_EQ(3.5f, nanreduce<NanvarPolicy>(x));
+  EXPECT_FLOAT_EQ(std::sqrt(3.5f), nanreduce<NanstdPolicy>(x));
+  EXPECT_FLOAT_EQ(1.f, nanreduce<NanminPolicy>(x));
+  EXPECT_FLOAT_EQ(6.f, nanreduce<NanmaxPolicy>(x));
+
+  xt::xtensor<float, 1> x_nan {nan, nan};
+  EXPECT_EQ(0.f, nanreduce<NansumPolicy>(x_nan));
+  EXPECT_THAT(nanreduce<NanmeanPolicy>(x_nan), NanSensitiveFloatEq(nan));
+  EXPECT_THAT(nanreduce<NanvarPolicy>(x_nan), NanSensitiveFloatEq(nan));
+  EXPECT_THAT(nanreduce<NanminPolicy>(x_nan), NanSensitiveFloatEq(nan));
+}
+
+TEST(TestNanreduce, TestAxis)
+{
+  xt::xtensor<float, 2> src {{nan, 1.f, 2.f}, {3.f, nan, nan}};
+
+  xt::xtensor<float, 1> out0 = xt::zeros<float>({3});
+  nanreduceAxis0<NanmeanPolicy>(src, out0);
+  EXPECT_THAT(out0, ElementsAre(3.f, 1.f, 2.f));
+  nanreduceAxis0<NanmaxPolicy>(src, out0);
+  EXPECT_THAT(out0, ElementsAre(3.f, 1.f, 2.f));
+
+  xt::xtensor<float, 1> out1 = xt::zeros<float>({2});
+  nanreduceAxis1<NansumPolicy>(src, out1);
+  EXPECT_THAT(out1, ElementsAre(3.f, 3.f));
+  nanreduceAxis1<NanvarPolicy>(src, out1);
+  EXPECT_THAT(out1, ElementsAre(0.25f, 0.f));
+
+  EXPECT_THROW(nanreduceAxis0<NansumPolicy>(src, out1), std::invalid_argument);
+  EXPECT_THROW(nanreduceAxis1<NansumPolicy>(src, out0), std::invalid_argument);
+
+  // many columns
+  xt::xtensor<double, 2> wide = xt::ones<double>({3, 100});
+  wide(0, 99) = nan;
+  wide(1, 99) = 4.;
+  xt::xtensor<double, 1> out_wide = xt::zeros<double>({100});
+  nanreduceAxis0<NanmeanPolicy>(wide, out_wide);
+  EXPECT_EQ(1., out_wide(0));
+  EXPECT_EQ(2.5, out_wide(99));
+}
+
+TEST(TestNanreduce, TestMaskedWeighted)
+{
+  xt::xtensor<float, 2> src {{nan, 1.f, 2.f}, {3.f, 5.f, 4.f}};
+  xt::xtensor<bool, 1> mask {false, false, true};
+  xt::xtensor<double, 1> weights {1., 3., 1.};
+
+  // 3 * 1 + 3 * 5 + 1 * 3
+  EXPECT_EQ(21.f, nanreduce<NansumPolicy>(src, mask, weights));
+  EXPECT_EQ(3.f, nanreduce<NanmeanPolicy>(src, mask, weights));
+  // (1 * 0 + 3 * 4 + 3 * 4) / 7
+  EXPECT_FLOAT_EQ(24.f / 7.f, nanreduce<NanvarPolicy>(src, mask, weights));
+
+  xt::xtensor<float, 1> out0 = xt::zeros<float>({3});
+  nanreduceAxis0<NansumPolicy>(src, mask, weights, out0);
+  EXPECT_THAT(out0, ElementsAre(3.f, 18.f, 0.f));
+  nanreduceAxis0<NanmeanPolicy>(src, mask, weights, out0);
+  EXPECT_THAT(out0, ElementsAre(3.f, 3.f, NanSensitiveFloatEq(nan)));
+
+  xt::xtensor<float, 1> out1 = xt::zeros<float>({2});
+  nanreduceAxis1<NanmeanPolicy>(src, mask, weights, out1);
+  EXPECT_THAT(out1, ElementsAre(1.f, 4.5f));
+  nanreduceAxis1<NanstdPolicy>(src, mask, weights, out1);
+  EXPECT_THAT(out1, ElementsAre(0.f, ::testing::FloatEq(std::sqrt(0.75f))));
+
+  // zero weight
+  weights(0) = 0.;
+  nanreduceAxis1<NansumPolicy>(src, mask, weights, out1);
+  EXPECT_THAT(out1, ElementsAre(3.f, 15.f));
+
+  xt::xtensor<bool, 1> wrong_mask {false, true};
+  EXPECT_THROW(nanreduce<NansumPolicy>(src, wrong_mask, weights), std::invalid_argument);
+  EXPECT_THROW(nanreduceAxis0<NansumPolicy>(src, wrong_mask, weights, out0), std::invalid_argument);
+  EXPECT_THROW(nanreduceAxis1<NansumPolicy>(src, mask, weights, out0), std::invalid_argument);
+}
+
+TEST(TestNanDescribe, TestGeneral)
+{
+  xt::xtensor<float, 1> x {nan, 1.f, 2.f, 3.f, nan, 6.f};
+  auto [count, sum, mean, var, min, max] = nanDescribe(x);
+  EXPECT_EQ(4, count);
+  EXPECT_FLOAT_EQ(12.f, sum);
+  EXPECT_FLOAT_EQ(3.f, mean);
+  EXPECT_FLOAT_EQ(3.5f, var);
+  EXPECT_FLOAT_EQ(1.f, min);
+  EXPECT_FLOAT_EQ(6.f, max);
+
+  xt::xtensor<float, 2> src {{nan, 1.f, 2.f}, {3.f, nan, 4.f}};
+
+  xt::xtensor<int64_t, 1> count0 = xt::zeros<int64_t>({3});
+  xt::xtensor<float, 2> stats0 = xt::zeros<float>({5, 3});
+  nanDescribeAxis0(src, count0, stats0);
+  EXPECT_THAT(count0, ElementsAre(1, 1, 2));
+  EXPECT_THAT(stats0, ElementsAre(3.f, 1.f, 6.f,
+                                  3.f, 1.f, 3.f,
+                                  0.f, 0.f, 1.f,
+                                  3.f, 1.f, 2.f,
+                                  3.f, 1.f, 4.f));
+
+  xt::xtensor<int64_t, 1> count1 = xt::zeros<int64_t>({2});
+  xt::xtensor<float, 2> stats1 = xt::zeros<float>({5, 2});
+  nanDescribeAxis1(src, count1, stats1);
+  EXPECT_THAT(count1, ElementsAre(2, 2));
+  EXPECT_THAT(stats1, ElementsAre(3.f, 7.f,
+                                  1.5f, 3.5f,
+                                  0.25f, 0.25f,
+                                  1.f, 3.f,
+                                  2.f, 4.f));
+
+  EXPECT_THROW(nanDescribeAxis0(src, count1, stats0), std::invalid_argument);
+  EXPECT_THROW(nanDescribeAxis1(src, count1, stats0), std::invalid_argument);
+}
+
+TEST(TestQuickMinMax, TestGeneral)
+{
+  xt::xtensor<float, 2> img {{nan, 1.f, 2.f, 3.f, 4.f}, {5.f, 6.f, 7.f, 8.f, nan}};
+  EXPECT_EQ(std::make_pair(1., 8.), quickMinMax(img));
+  EXPECT_EQ(std::make_pair(2., 7.), quickMinMax(img, 0.9));
+  EXPECT_EQ(std::make_pair(3., 6.), quickMinMax(img, 0.3));
+  EXPECT_THROW(quickMinMax(img, 1.1), std::invalid_argument);
+
+  // the last axis is halved once and then the first axis is halved twice
+  xt::xtensor<float, 3> imgs {{{1.f, 10.f, 2.f, 10.f}}, {{10.f, 10.f, 10.f, 10.f}}, {{3.f, 10.f, nan, 10.f}}};
+  EXPECT_EQ(std::make_pair(1., 2.), quickMinMax(imgs, 1., 2));
+
+  xt::xtensor<float, 2> all_nan {{nan, nan}};
+  auto [lb, ub] = quickMinMax(all_nan);
+  EXPECT_TRUE(std::isnan(lb));
+  EXPECT_TRUE(std::isnan(ub));
+}
+
+TEST(TestKllSketch, TestGeneral)
+{
+  EXPECT_THROW(KllSketch(1), std::invalid_argument);
+
+  KllSketch sketch(8, 1);
+  EXPECT_TRUE(std::isnan(sketch.quantile(0.5)));
+
+  xt::xtensor<float, 1> x {3.f, nan, 1.f, 2.f};
+  sketch.update(x);
+  EXPECT_EQ(3, sketch.count());
+  EXPECT_EQ(1., sketch.quantile(0.));
+  EXPECT_EQ(2., sketch.quantile(0.5));
+  EXPECT_EQ(3., sketch.quantile(1.));
+  EXPECT_DOUBLE_EQ(2. / 3., sketch.cdf(2.));
+  EXPECT_THROW(sketch.quantile(-0.1), std::invalid_argument);
+
+  // the sketch is compacted and the total weight is preserved
+  for (int i = 0; i < 1000; ++i) sketch.update(static_cast<double>(i % 100));
+  EXPECT_EQ(1003, sketch.count());
+  EXPECT_LT(sketch.size(), 100);
+  EXPECT_DOUBLE_EQ(1., sketch.cdf(99.));
+  EXPECT_NEAR(50., sketch.quantile(0.5), 25.);
+
+  KllSketch other(8, 2);
+  other.update(-1.);
+  sketch.merge(other);
+  EXPECT_EQ(1004, sketch.count());
+  EXPECT_EQ(-1., sketch.min());
+  EXPECT_EQ(99., sketch.max());
+
+  KllSketch wrong_k(16);
+  EXPECT_THROW(sketch.merge(wrong_k), std::invalid_argument);
+
+  // the random number generator is restored as well
+  KllSketch restored(8, 3);
+  restored.setState(sketch.state());
+  for (int i = 0; i < 100; ++i)
+  {
+    sketch.update(static_cast<double>(i % 7));
+    restored.update(static_cast<double>(i % 7));
+  }
+  EXPECT_EQ(sketch.size(), restored.size());
+  EXPECT_EQ(sketch.quantile(0.3), restored.quantile(0.3));
+
+  auto state = sketch.state();
+  ++state.count;
+  EXPECT_THROW(restored.setState(state), std::invalid_argument);
+
+  sketch.reset();
+  EXPECT_EQ(0, sketch.count());
+  EXPECT_EQ(0, sketch.size());
+}
+
+TEST(TestRunningStats, TestGeneral)
+{
+  RunningStats stats(2);
+  EXPECT_THAT(stats.mean(), ElementsAre(NanSensitiveFloatEq(nan), NanSensitiveFloatEq(nan)));
+
+  xt::xtensor<float, 2> batch1 {{1.f, nan}, {3.f, nan}};
+  stats.update(batch1);
+  EXPECT_THAT(stats.count(), ElementsAre(2, 0));
+  EXPECT_THAT(stats.mean(), ElementsAre(2., NanSensitiveFloatEq(nan)));
+
+  RunningStats other(2);
+  xt::xtensor<double, 2> batch2 {{5., 1.}};
+  other.update(batch2);
+  stats.merge(other);
+  EXPECT_THAT(stats.count(), ElementsAre(3, 1));
+  EXPECT_THAT(stats.mean(), ElementsAre(3., 1.));
+  EXPECT_THAT(stats.variance(), ElementsAre(::testing::DoubleEq(8. / 3.), 0.));
+  EXPECT_THAT(stats.min(), ElementsAre(1., 1.));
+  EXPECT_THAT(stats.max(), ElementsAre(5., 1.));
+
+  RunningStats restored(2);
+  restored.setState(stats.state());
+  EXPECT_THAT(restored.variance(), ElementsAre(::testing::DoubleEq(8. / 3.), 0.));
+
+  xt::xtensor<float, 2> wrong_batch {{1.f}};
+  EXPECT_THROW(stats.update(wrong_batch), std::invalid_argument);
+  EXPECT_THROW(stats.merge(RunningStats(3)), std::invalid_argument);
+
+  stats.reset();
+  EXPECT_THAT(stats.count(), ElementsAre(0, 0));
+}
+
+TEST(TestPixelCorrelation, TestGeneral)
+{
+  PixelCorrelation corr(3);
+  EXPECT_THAT(corr.correlation(), ::testing::Each(NanSensitiveFloatEq(nan)));
+
+  // the last pixel is constant and the last reference is nan
+  xt::xtensor<float, 2> batch1 {{1.f, 4.f, 1.f}, {2.f, nan, 1.f}, {0.f, 0.f, 1.f}};
+  xt::xtensor<double, 1> ref1 {1., 2., nan};
+  corr.update(batch1, ref1);
+  EXPECT_THAT(corr.count(), ElementsAre(2, 1, 2));
+
+  PixelCorrelation other(3);
+  xt::xtensor<double, 2> batch2 {{3., 2., 1.}};
+  xt::xtensor<double, 1> ref2 {3.};
+  other.update(batch2, ref2);
+  corr.merge(other);
+  EXPECT_THAT(corr.count(), ElementsAre(3, 2, 3));
+  EXPECT_THAT(corr.correlation(), ElementsAre(::testing::DoubleEq(1.), ::testing::DoubleEq(-1.),
+                                              NanSensitiveFloatEq(nan)));
+  EXPECT_THAT(corr.covariance(), ElementsAre(::testing::DoubleEq(2. / 3.), ::testing::DoubleEq(-1.), 0.));
+  EXPECT_THAT(corr.slope(), ElementsAre(::testing::DoubleEq(1.), ::testing::DoubleEq(-1.), 0.));
+
+  PixelCorrelation restored(3);
+  restored.setState(corr.state());
+  EXPECT_THAT(restored.slope(), ElementsAre(::testing::DoubleEq(1.), ::testing::DoubleEq(-1.), 0.));
+
+  xt::xtensor<double, 1> wrong_ref {1., 2.};
+  EXPECT_THROW(corr.update(batch1, wrong_ref), std::invalid_argument);
+  EXPECT_THROW(corr.merge(PixelCorrelation(2)), std::invalid_argument);
+
+  corr.reset();
+  EXPECT_THAT(corr.count(), ElementsAre(0, 0, 0));
+}
+
 } //foam::test
\ No newline at end of file